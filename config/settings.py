@@ -74,13 +74,48 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Perfil de SQLite para varias cajas a la vez:
+# - WAL: los reportes leen sin frenar a los cobros (y viceversa).
+# - timeout (busy_timeout): un cobro espera hasta 20 s a que se libere el archivo
+#   en vez de fallar enseguida con "database is locked".
+# - transaction_mode IMMEDIATE: cada atomic() (cobro, anulación, movimientos, importación)
+#   toma el lock de escritura al empezar. Con DEFERRED, dos transacciones que leyeron
+#   y después quieren escribir chocan y una falla sin esperar el timeout.
+# - synchronous=NORMAL es seguro con WAL (un corte de luz puede perder solo la
+#   última transacción, nunca corromper la base); mmap y cache_size evitan lecturas al disco.
+SQLITE_PRODUCCION = {
+    'timeout': 20,
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=268435456;'  # 256 MB
+        'PRAGMA cache_size=-65536;'  # 64 MB (negativo = KB)
+        'PRAGMA temp_store=MEMORY;'
+    ),
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': SQLITE_PRODUCCION,
+    },
+    # Copia de solo lectura para los reportes pesados (ver gestion/base_reportes.py).
+    # En SQLite es un archivo aparte que se refresca con la API de backup; con
+    # PostgreSQL, acá iría la réplica. En los tests apunta a la misma base.
+    'reportes': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'reportes.sqlite3',
+        'OPTIONS': {
+            'init_command': 'PRAGMA query_only=ON;PRAGMA mmap_size=268435456;PRAGMA cache_size=-65536;',
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['gestion.routers.RouterReportes']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -120,6 +155,11 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Las imágenes de productos ya se guardaban en la carpeta del proyecto (productos/):
+# MEDIA_ROOT apunta ahí para no romper esas rutas. Las exportaciones van a exportaciones/.
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR
+
 
 LOGIN_REDIRECT_URL = 'ventas' 
 
@@ -156,4 +196,35 @@ JAZZMIN_SETTINGS = {
         },
     ],
     
-}
\ No newline at end of file
+}
+
+# --- COBRO ---
+# False: la caja abierta se resuelve sin bloqueo exclusivo (cada cobro solo bloquea
+# las filas de sus productos). True: vuelve al modo viejo, un cobro a la vez.
+KIOSCO_COBRO_BLOQUEA_SESION = False
+
+# Etiquetas EAN-13 de la balanza: prefijo -> qué trae la etiqueta en los dígitos 8 a 12
+# ('PESO' = gramos, 'PRECIO' = importe en pesos). Ver catalogo.interpretar_etiqueta_balanza.
+KIOSCO_BALANZA_PREFIJOS = {
+    '20': 'PESO',
+    '21': 'PRECIO',
+}
+
+# --- TRABAJOS EN SEGUNDO PLANO (exportaciones e importaciones) ---
+# Los archivos grandes se generan/procesan en hilos aparte y la pantalla muestra el
+# avance (ver gestion/trabajos.py). False: corren dentro del mismo pedido (útil en los tests).
+KIOSCO_TRABAJOS_EN_SEGUNDO_PLANO = True
+KIOSCO_TRABAJOS_HILOS = 2
+
+# --- BASE DE REPORTES ---
+# Alias al que van las lecturas del reporte mensual, faltantes y exportaciones
+# (None = todo a 'default'), y cada cuánto se vuelve a copiar la base si es SQLite.
+KIOSCO_BASE_REPORTES = 'reportes'
+KIOSCO_REPORTES_SEGUNDOS_COPIA = 300
+
+# --- IMPRESORA DE TICKETS (ESC/POS) ---
+# Adónde van los tickets que se mandan a imprimir: 'host:puerto' para una impresora
+# de red (RAW, puerto 9100) o la ruta del dispositivo ('/dev/usb/lp0'). None: solo descarga.
+KIOSCO_IMPRESORA = None
+# Caracteres por renglón: 32 en papel de 58 mm, 48 en papel de 80 mm
+KIOSCO_TICKET_COLUMNAS = 32
@@ -1,13 +1,14 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Producto, SesionCaja, Venta, DetalleVenta, MovimientoCaja, Categoria, Cliente
+from .models import Producto, SesionCaja, Venta, DetalleVenta, MovimientoCaja, Categoria, Cliente, ResumenDiario
+from .caja import calcular_resumen
 
 # 1. PRODUCTOS (Con tus colores de stock)
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
     list_display = ('nombre', 'codigo', 'precio_costo', 'precio_venta', 'stock_actual', 'mostrar_estado', 'activo')
     search_fields = ('nombre', 'codigo')
-    list_filter = ('categoria', 'activo')
+    list_filter = ('categoria', 'activo', 'bajo_minimo')
     list_editable = ('stock_actual', 'precio_venta', 'activo') # Para editar rápido
     
     def mostrar_estado(self, obj):
@@ -43,6 +44,9 @@ class SesionCajaAdmin(admin.ModelAdmin):
     
     # --- TUS FUNCIONES VISUALES ---
     def mostrar_saldo_esperado(self, obj):
+        if obj.estado:
+            # Caja abierta: el esperado sale de los totales acumulados (sin consultas extra)
+            return f"${calcular_resumen(obj).esperado_efectivo}"
         return f"${obj.saldo_final_esperado}" if obj.saldo_final_esperado is not None else "-"
     mostrar_saldo_esperado.short_description = "Esperado"
 
@@ -89,7 +93,7 @@ class SesionCajaAdmin(admin.ModelAdmin):
 # 5. VENTAS (Solo Lectura Absoluta)
 class DetalleVentaInline(admin.TabularInline):
     model = DetalleVenta
-    readonly_fields = ('producto', 'cantidad', 'precio_unitario', 'subtotal')
+    readonly_fields = ('producto', 'cantidad', 'precio_unitario', 'costo_unitario', 'subtotal')
     can_delete = False
     extra = 0
 
@@ -111,4 +115,16 @@ class MovimientoCajaAdmin(admin.ModelAdmin):
     list_display = ('fecha', 'tipo', 'categoria', 'monto', 'descripcion', 'sesion')
     list_filter = ('tipo', 'categoria')
     
-    def has_change_permission(self, request, obj=None): return False
\ No newline at end of file
+    def has_change_permission(self, request, obj=None): return False
+
+# 7. RESUMEN DIARIO (Solo Lectura: lo mantienen el cobro y la anulación)
+@admin.register(ResumenDiario)
+class ResumenDiarioAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'metodo_pago', 'producto', 'categoria', 'cantidad', 'ingresos', 'costo', 'tickets')
+    list_filter = ('metodo_pago', 'categoria')
+    date_hierarchy = 'fecha'
+    list_select_related = ('producto', 'categoria')
+
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
@@ -0,0 +1,177 @@
+"""
+Base aparte para los reportes pesados (reporte mensual, faltantes, exportaciones).
+
+Las lecturas de esas vistas se desvían (routers.RouterReportes) al alias
+settings.KIOSCO_BASE_REPORTES. En SQLite ese alias es una copia de la base
+principal hecha con la API de backup y refrescada cada
+KIOSCO_REPORTES_SEGUNDOS_COPIA: un export de un año lee otro archivo y no
+compite con los cobros. Con una réplica de verdad (PostgreSQL, etc) no hay
+nada que copiar y el alias se usa tal cual.
+
+Si el alias no existe o apunta a la misma base que 'default' (como en los
+tests, con TEST['MIRROR']), no se desvía nada.
+"""
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+# True mientras corre una vista o un trabajo de reportes (ver base_de_reportes)
+en_reportes = ContextVar('kiosco_en_reportes', default=False)
+
+_refrescando = threading.Lock()
+
+# Cuándo cambió por última vez algo que la copia ya tenía (p. ej. se anuló una venta
+# de un día cerrado). No vence: una copia anterior a eso no sirve para cachear nada
+# mientras no se rehaga, aunque pase mucho tiempo sin que nadie pida un reporte.
+CLAVE_ULTIMO_CAMBIO = 'gestion:base_reportes:ultimo_cambio'
+
+
+def alias_de_reportes():
+    """El alias de la base de reportes, o None si no hay una distinta de la principal."""
+    alias = getattr(settings, 'KIOSCO_BASE_REPORTES', None)
+    if not alias or alias not in settings.DATABASES:
+        return None
+    if connections[alias].settings_dict['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']:
+        return None
+    return alias
+
+
+def _es_copia(alias):
+    """La base de reportes es una copia de SQLite que hay que refrescar nosotros."""
+    return connections[alias].vendor == 'sqlite' and connections[DEFAULT_DB_ALIAS].vendor == 'sqlite'
+
+
+def copia_tomada(alias=None):
+    """
+    Desde cuándo está la copia actual: tiene todo lo confirmado antes de ese
+    momento (None si todavía no hay copia). Para réplicas: ahora.
+    """
+    alias = alias or alias_de_reportes()
+    if alias is None or not _es_copia(alias):
+        return timezone.now()
+    try:
+        segundos = os.path.getmtime(connections[alias].settings_dict['NAME'])
+    except OSError:
+        return None
+    return datetime.datetime.fromtimestamp(segundos, tz=datetime.timezone.utc)
+
+
+def anotar_cambio():
+    """
+    Anota que cambiaron datos que la copia ya tenía. Hasta que se vuelva a
+    copiar, datos_completos_hasta() da False y la próxima lectura pide una copia nueva.
+    """
+    cache.set(CLAVE_ULTIMO_CAMBIO, timezone.now(), None)
+
+
+def _copia_al_dia(tomada):
+    cambio = cache.get(CLAVE_ULTIMO_CAMBIO)
+    return cambio is None or tomada >= cambio
+
+
+def datos_completos_hasta(momento):
+    """
+    True si lo que se lee ahora incluye todo lo anterior a `momento`: siempre en la
+    base principal, y en la copia solo si se tomó después (y después del último
+    cambio anotado). Sirve para no cachear un período cerrado calculado con una
+    copia de antes del cierre o de antes de anular una venta vieja.
+    """
+    if not en_reportes.get():
+        return True
+    tomada = copia_tomada()
+    return tomada is not None and tomada >= momento and _copia_al_dia(tomada)
+
+
+def refrescar_copia(destino=None, esperar=True):
+    """
+    Copia la base principal al archivo de la base de reportes (o a `destino`).
+    La copia se hace en un solo paso de la API de backup (una transacción de
+    lectura: en WAL no frena a los cobros) sobre un temporal que después se
+    renombra, así los reportes nunca leen un archivo a medias.
+    Devuelve False si no hay copia que hacer o, con esperar=False, si otra ya estaba en curso.
+    Dentro de una transacción tampoco se copia: el backup esperaría a que termine.
+    """
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return False
+    if destino is None:
+        alias = alias_de_reportes()
+        if alias is None or not _es_copia(alias):
+            return False
+        destino = str(connections[alias].settings_dict['NAME'])
+    if not _refrescando.acquire(blocking=esperar):
+        return False
+    try:
+        origen = connections[DEFAULT_DB_ALIAS]
+        origen.ensure_connection()
+        temporal = destino + '.nueva'
+        inicio = time.time()
+        with closing(sqlite3.connect(temporal)) as copia:
+            origen.connection.backup(copia)
+            # La copia no necesita WAL (solo se lee) y así no deja archivos -wal/-shm
+            copia.execute('PRAGMA journal_mode=DELETE')
+        # La fecha del archivo es la de antes de copiar (ver copia_tomada): lo que se
+        # confirmó mientras se copiaba puede haber quedado afuera
+        os.utime(temporal, (inicio, inicio))
+        os.replace(temporal, destino)
+        return True
+    finally:
+        _refrescando.release()
+
+
+def asegurar_copia(desde=None):
+    """
+    Antes de leer de la copia: si no existe (o es anterior a `desde`) se hace en
+    el momento; si está vieja o es de antes del último cambio anotado se pide
+    una nueva en segundo plano y mientras tanto se usa la que hay.
+    Devuelve False si no hay copia para leer (se lee de la base principal).
+    """
+    alias = alias_de_reportes()
+    if alias is None or not _es_copia(alias):
+        return True
+    tomada = copia_tomada(alias)
+    if tomada is None or (desde is not None and tomada < desde):
+        return refrescar_copia()
+    segundos = getattr(settings, 'KIOSCO_REPORTES_SEGUNDOS_COPIA', 300)
+    if timezone.now() - tomada > datetime.timedelta(seconds=segundos) or not _copia_al_dia(tomada):
+        from .trabajos import encolar
+        encolar(refrescar_copia, None, False)
+    return True
+
+
+@contextmanager
+def base_de_reportes(desde=None):
+    """
+    Dentro de este bloque las lecturas de los modelos de reportes van a la base
+    de reportes. Con `desde`, la copia tiene que tener todo lo confirmado antes
+    de ese momento (ver asegurar_copia).
+    """
+    alias = alias_de_reportes()
+    if alias is None or not asegurar_copia(desde):
+        yield
+        return
+    marca = en_reportes.set(True)
+    try:
+        yield
+    finally:
+        en_reportes.reset(marca)
+        # La conexión de este hilo a la copia se cierra: la próxima abre el archivo nuevo si se refrescó
+        connections[alias].close()
+
+
+def usar_base_de_reportes(vista):
+    """Decorador para las vistas de solo lectura de reportes."""
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        with base_de_reportes():
+            return vista(*args, **kwargs)
+    return envoltura
@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db.models import F, Q, Sum
+
+from .models import Venta, MovimientoCaja, SesionCaja
+
+
+CAMPOS_TOTALES = list(SesionCaja.CAMPO_TOTAL_POR_METODO.values()) + list(SesionCaja.CAMPO_TOTAL_POR_TIPO_MOVIMIENTO.values())
+
+
+@dataclass
+class ResumenCaja:
+    """Desglose de lo que el sistema sabe de una caja (sin contar las ventas anuladas)."""
+    saldo_inicial: Decimal
+    ventas_efectivo: Decimal
+    ventas_debito: Decimal  # Incluye Mercado Pago
+    ventas_credito: Decimal
+    ventas_vales: Decimal
+    ingresos: Decimal
+    egresos: Decimal
+
+    @property
+    def esperado_efectivo(self):
+        return self.saldo_inicial + self.ventas_efectivo + self.ingresos - self.egresos
+
+    @property
+    def ventas_digital(self):
+        return self.ventas_debito + self.ventas_credito
+
+
+def calcular_resumen(sesion):
+    """
+    Desglose de la caja leído de los totales acumulados de la sesión: no hace
+    ninguna consulta extra, cueste lo que cueste la cantidad de ventas.
+    """
+    return ResumenCaja(
+        saldo_inicial=sesion.saldo_inicial,
+        ventas_efectivo=sesion.ventas_efectivo,
+        ventas_debito=sesion.ventas_debito + sesion.ventas_mercadopago,
+        ventas_credito=sesion.ventas_credito,
+        ventas_vales=sesion.ventas_vales,
+        ingresos=sesion.total_ingresos,
+        egresos=sesion.total_egresos,
+    )
+
+
+def totales_recalculados(sesion_ids=None):
+    """
+    Recalcula desde cero los totales acumulados de las sesiones (todas, o las de
+    sesion_ids) con una pasada de agregación condicional sobre Venta y otra sobre
+    MovimientoCaja. Devuelve {sesion_id: {campo: valor}} con las mismas columnas de SesionCaja.
+    """
+    ventas = Venta.objects.filter(anulada=False)
+    movimientos = MovimientoCaja.objects.all()
+    if sesion_ids is not None:
+        ventas = ventas.filter(sesion_id__in=sesion_ids)
+        movimientos = movimientos.filter(sesion_id__in=sesion_ids)
+
+    ventas = ventas.values('sesion_id').annotate(**{
+        campo: Sum('total', filter=Q(metodo_pago=metodo), default=0)
+        for metodo, campo in SesionCaja.CAMPO_TOTAL_POR_METODO.items()
+    })
+    movimientos = movimientos.values('sesion_id').annotate(**{
+        campo: Sum('monto', filter=Q(tipo=tipo), default=0)
+        for tipo, campo in SesionCaja.CAMPO_TOTAL_POR_TIPO_MOVIMIENTO.items()
+    })
+
+    vacio = {campo: Decimal('0') for campo in CAMPOS_TOTALES}
+    totales = {}
+    for fila in list(ventas) + list(movimientos):
+        totales.setdefault(fila.pop('sesion_id'), dict(vacio)).update(fila)
+    return totales
+
+
+def sumar_venta(sesion_id, metodo_pago, importe, solo_abierta=False):
+    """
+    Suma (o resta, con importe negativo) una venta a los totales de la caja con F().
+    Devuelve la cantidad de filas tocadas: 0 si la caja no existe o, con
+    solo_abierta=True, si ya estaba cerrada.
+    """
+    campo = SesionCaja.CAMPO_TOTAL_POR_METODO[metodo_pago]
+    sesiones = SesionCaja.objects.filter(pk=sesion_id)
+    if solo_abierta:
+        sesiones = sesiones.filter(estado=True)
+    return sesiones.update(**{campo: F(campo) + importe})
+
+
+def sumar_movimiento(sesion_id, tipo, monto):
+    campo = SesionCaja.CAMPO_TOTAL_POR_TIPO_MOVIMIENTO[tipo]
+    return SesionCaja.objects.filter(pk=sesion_id).update(**{campo: F(campo) + monto})
+
+
+def guardar_esperado(sesion, resumen):
+    """Guarda el saldo esperado solo si cambió, y escribiendo únicamente esa columna."""
+    if sesion.saldo_final_esperado != resumen.esperado_efectivo:
+        sesion.saldo_final_esperado = resumen.esperado_efectivo
+        sesion.save(update_fields=['saldo_final_esperado'])
@@ -0,0 +1,219 @@
+import base64
+import json
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Categoria, Producto
+
+TAMANIO_PAGINA = 50
+TAMANIO_PAGINA_MAXIMO = 200
+
+# Solo las columnas que usa la pantalla de ventas (nada de descripcion, imagen, etc)
+CAMPOS_CATALOGO = ('id', 'codigo', 'nombre', 'precio_venta', 'stock_actual', 'tipo_venta', 'categoria_id')
+
+
+def codificar_cursor(nombre, producto_id):
+    """El cursor es opaco para el JS: (nombre, id) del último producto de la página."""
+    crudo = json.dumps([nombre, producto_id]).encode()
+    return base64.urlsafe_b64encode(crudo).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        nombre, producto_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(nombre), int(producto_id)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor de paginación inválido")
+
+
+def pagina_productos(cursor=None, categoria=None, texto=None, limite=TAMANIO_PAGINA):
+    """
+    Una página del catálogo activo ordenado por (nombre, id), con paginación por
+    clave (keyset): la página 300 cuesta lo mismo que la primera porque no hay OFFSET.
+
+    categoria: id de Categoria o 'SIN_CAT' para los productos sin categoría.
+    texto: busca en nombre y código.
+    Devuelve (lista_de_dicts, cursor_siguiente o None).
+    """
+    productos = Producto.objects.filter(activo=True)
+
+    if categoria == 'SIN_CAT':
+        productos = productos.filter(categoria__isnull=True)
+    elif categoria:
+        productos = productos.filter(categoria_id=int(categoria))
+
+    if texto:
+        productos = productos.filter(Q(nombre__icontains=texto) | Q(codigo__icontains=texto))
+
+    if cursor:
+        nombre, producto_id = decodificar_cursor(cursor)
+        # (nombre, id) > cursor como rango sobre nombre: así se usa producto_catalogo sin OR
+        productos = productos.filter(nombre__gte=nombre).exclude(nombre=nombre, id__lte=producto_id)
+
+    # Pedimos uno de más para saber si hay otra página sin hacer un COUNT
+    filas = list(productos.order_by('nombre', 'id').values(*CAMPOS_CATALOGO)[:limite + 1])
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor(filas[-1]['nombre'], filas[-1]['id'])
+    return filas, siguiente
+
+
+# --- VERSIÓN DEL CATÁLOGO Y CATEGORÍAS ---
+
+# La versión del catálogo sube con cualquier cambio (señales de Producto y Categoria,
+# importaciones y descuentos de stock al cobrar) y es el ETag de api_productos: si el
+# navegador ya tiene la versión actual recibe un 304 sin que se consulte la base.
+# Vence a los SEGUNDOS_VERSION_CATALOGO porque sin CACHES compartido cada proceso
+# tiene su propia versión y solo sube la del proceso que hizo el cambio.
+CLAVE_VERSION_CATALOGO = 'gestion:catalogo:version'
+SEGUNDOS_VERSION_CATALOGO = 60
+
+# Las categorías (botones de la pantalla de ventas) cambian poco: van aparte, sin
+# depender de la versión que sube con cada cobro
+CLAVE_CATEGORIAS = 'gestion:catalogo:categorias'
+SEGUNDOS_CACHE_CATEGORIAS = 60 * 5
+
+
+def version_catalogo():
+    # Arranca en el reloj y no en 1: una versión nueva (cache vacío o vencido) nunca
+    # coincide con un ETag que haya quedado en un navegador
+    return cache.get_or_set(CLAVE_VERSION_CATALOGO, time.time_ns, SEGUNDOS_VERSION_CATALOGO)
+
+
+def subir_version_catalogo():
+    """Invalida los ETag del catálogo. Llamar después del commit del cambio."""
+    try:
+        cache.incr(CLAVE_VERSION_CATALOGO)
+    except ValueError:
+        pass  # Sin versión guardada la próxima lectura arranca una nueva
+
+
+def etag_catalogo(request, *args, **kwargs):
+    """etag_func para django.views.decorators.http.condition: una lectura del cache."""
+    return str(version_catalogo())
+
+
+def categorias_catalogo():
+    """[{'id', 'nombre'}] de todas las categorías, desde el cache."""
+    categorias = cache.get(CLAVE_CATEGORIAS)
+    if categorias is None:
+        categorias = list(Categoria.objects.order_by('id').values('id', 'nombre'))
+        cache.set(CLAVE_CATEGORIAS, categorias, SEGUNDOS_CACHE_CATEGORIAS)
+    return categorias
+
+
+def olvidar_categorias():
+    cache.delete(CLAVE_CATEGORIAS)
+
+
+# --- BÚSQUEDA POR CÓDIGO DE BARRAS ---
+
+# Lo que necesita el JS para sumar al carrito un producto escaneado
+CAMPOS_CODIGO = ('id', 'codigo', 'nombre', 'precio_venta', 'tipo_venta', 'stock_actual')
+
+# Cache en memoria del proceso: codigo -> (fila, vence). Se invalida con las señales
+# de Producto (signals.py) y al cobrar; el vencimiento acota cuánto puede quedar
+# desactualizado un proceso cuando el cambio se hizo en otro.
+SEGUNDOS_CACHE_CODIGOS = 300
+_codigos = {}
+_codigo_por_id = {}
+_lock_codigos = threading.Lock()
+
+
+def _buscar_codigo_exacto(codigo):
+    ahora = time.monotonic()
+    with _lock_codigos:
+        guardado = _codigos.get(codigo)
+    if guardado and guardado[1] > ahora:
+        return guardado[0]
+
+    # Búsqueda por el índice único de Producto.codigo
+    fila = Producto.objects.filter(codigo=codigo, activo=True).values(*CAMPOS_CODIGO).first()
+    if fila is not None:
+        with _lock_codigos:
+            _codigos[codigo] = (fila, ahora + SEGUNDOS_CACHE_CODIGOS)
+            _codigo_por_id[fila['id']] = codigo
+    return fila
+
+
+def olvidar_productos(producto_ids=(), codigos=()):
+    """Saca del cache de códigos los productos que cambiaron (por id o por código)."""
+    with _lock_codigos:
+        for producto_id in producto_ids:
+            codigo = _codigo_por_id.pop(producto_id, None)
+            if codigo is not None:
+                _codigos.pop(codigo, None)
+        for codigo in codigos:
+            guardado = _codigos.pop(codigo, None)
+            if guardado is not None:
+                _codigo_por_id.pop(guardado[0]['id'], None)
+
+
+def olvidar_todos_los_codigos():
+    with _lock_codigos:
+        _codigos.clear()
+        _codigo_por_id.clear()
+
+
+def digito_verificador_ean13(primeros_12):
+    suma = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(primeros_12))
+    return (10 - suma % 10) % 10
+
+
+def interpretar_etiqueta_balanza(codigo):
+    """
+    Etiquetas EAN-13 que imprime la balanza: PP CCCCC VVVVV D
+      PP    = prefijo (ver KIOSCO_BALANZA_PREFIJOS: cada prefijo dice si VVVVV es peso o precio)
+      CCCCC = código del producto (PLU)
+      VVVVV = gramos, o importe en pesos enteros
+      D     = dígito verificador
+    Devuelve (plu, modo, valor) o None si no es una etiqueta de balanza válida.
+    """
+    prefijos = getattr(settings, 'KIOSCO_BALANZA_PREFIJOS', {'20': 'PESO', '21': 'PRECIO'})
+    if len(codigo) != 13 or not codigo.isdigit() or codigo[:2] not in prefijos:
+        return None
+    if digito_verificador_ean13(codigo[:12]) != int(codigo[12]):
+        return None
+
+    modo = prefijos[codigo[:2]]
+    if modo == 'PESO':
+        valor = Decimal(codigo[7:12]) / 1000  # gramos -> kilos
+    else:
+        valor = Decimal(codigo[7:12])  # importe en pesos
+    return codigo[2:7], modo, valor
+
+
+def buscar_por_codigo(codigo):
+    """
+    Resuelve un escaneo en tiempo constante (índice único + cache).
+    Devuelve (fila_producto, cantidad) o (None, None). La cantidad solo viene
+    en las etiquetas de balanza de productos que se venden por peso.
+    """
+    fila = _buscar_codigo_exacto(codigo)
+    if fila is not None:
+        return fila, None
+
+    etiqueta = interpretar_etiqueta_balanza(codigo)
+    if etiqueta is None:
+        return None, None
+
+    plu, modo, valor = etiqueta
+    fila = _buscar_codigo_exacto(plu) or _buscar_codigo_exacto(plu.lstrip('0') or '0')
+    if fila is None or fila['tipo_venta'] != 'PESO':
+        return None, None
+
+    if modo == 'PESO':
+        cantidad = valor
+    elif fila['precio_venta'] > 0:
+        # La etiqueta trae el importe: calculamos cuántos kilos son
+        cantidad = valor / fila['precio_venta']
+    else:
+        return None, None
+    return fila, cantidad.quantize(Decimal('0.001'), rounding=ROUND_HALF_UP)
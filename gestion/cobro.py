@@ -0,0 +1,188 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, When
+from django.utils import timezone
+
+from .caja import sumar_venta
+from .catalogo import olvidar_productos, subir_version_catalogo
+from .reportes import sumar_al_resumen_diario
+from .models import Producto, Venta, DetalleVenta, SesionCaja
+
+CLAVE_SESION_ABIERTA = 'gestion:sesion_abierta_id'
+# Sin CACHES compartido cada proceso tiene su propio LocMem y olvidar_sesion_abierta()
+# solo limpia el del proceso que abrió o cerró la caja: el resto se entera al vencer
+SEGUNDOS_CACHE_SESION = 30
+
+
+class ErrorVenta(Exception):
+    """Error de negocio al cobrar (carrito inválido, stock insuficiente, etc)."""
+
+
+class CajaCerrada(ErrorVenta):
+    def __init__(self):
+        super().__init__('No hay caja abierta. Abra una sesión primero.')
+
+
+def agrupar_items(items):
+    """
+    Convierte el carrito que manda el JS en {producto_id: cantidad}.
+    Si el mismo producto viene en dos renglones, se suman las cantidades.
+    """
+    cantidades = {}
+    for item in items:
+        producto_id = int(item['id'])
+        cantidad = Decimal(str(item['cantidad']))
+        if cantidad <= 0:
+            raise ErrorVenta("Las cantidades tienen que ser mayores a cero.")
+        cantidades[producto_id] = cantidades.get(producto_id, Decimal('0')) + cantidad
+    return cantidades
+
+
+def sesion_abierta_id():
+    """
+    Devuelve el id de la caja abierta SIN bloquear su fila.
+    El id queda cacheado SEGUNDOS_CACHE_SESION; no hace falta confirmarlo acá
+    porque registrar_venta solo suma a los totales de una caja con estado=True
+    (si estaba cerrada, falla con CajaCerrada y cobrar() vuelve a buscarla).
+    """
+    sesion_id = cache.get(CLAVE_SESION_ABIERTA)
+    if sesion_id is not None:
+        return sesion_id
+
+    sesion_id = SesionCaja.objects.filter(estado=True).values_list('id', flat=True).last()
+    if sesion_id is not None:
+        cache.set(CLAVE_SESION_ABIERTA, sesion_id, SEGUNDOS_CACHE_SESION)
+    return sesion_id
+
+
+def olvidar_sesion_abierta():
+    """Se llama al abrir o cerrar la caja para que el próximo cobro la vuelva a buscar."""
+    cache.delete(CLAVE_SESION_ABIERTA)
+
+
+def cobrar(usuario, items, metodo_pago, bloquear_sesion=None):
+    """
+    Punto de entrada del cobro: resuelve la caja abierta y registra la venta en una transacción.
+
+    Por defecto (KIOSCO_COBRO_BLOQUEA_SESION = False) la caja se resuelve sin
+    bloqueo exclusivo, así dos cajas que cobran productos distintos no se
+    esperan entre sí: solo se bloquean las filas de los productos del carrito.
+    Con bloquear_sesion=True se vuelve al modo anterior (SELECT FOR UPDATE sobre la caja).
+
+    En SQLite no hay FOR UPDATE: la transacción empieza con BEGIN IMMEDIATE
+    (SQLITE_PRODUCCION en settings), así el cobro toma el lock de escritura
+    antes de leer el stock y el que llega segundo espera en vez de fallar.
+    """
+    if bloquear_sesion is None:
+        bloquear_sesion = getattr(settings, 'KIOSCO_COBRO_BLOQUEA_SESION', False)
+
+    if bloquear_sesion:
+        with transaction.atomic():
+            sesion_id = SesionCaja.objects.filter(estado=True).select_for_update().values_list('id', flat=True).last()
+            return registrar_venta(sesion_id, usuario, items, metodo_pago)
+
+    try:
+        with transaction.atomic():
+            return registrar_venta(sesion_abierta_id(), usuario, items, metodo_pago)
+    except CajaCerrada:
+        # El id cacheado era de una caja que ya se cerró: la buscamos de nuevo una sola vez
+        olvidar_sesion_abierta()
+        with transaction.atomic():
+            return registrar_venta(sesion_abierta_id(), usuario, items, metodo_pago)
+
+
+def registrar_venta(sesion_id, usuario, items, metodo_pago):
+    """
+    Registra la venta completa con una cantidad FIJA de consultas, sin importar
+    cuántos productos tenga el carrito:
+
+      1. Un solo SELECT ... FOR UPDATE con id__in para bloquear los productos.
+      2. Un INSERT de la Venta (el total ya se calcula en memoria).
+      3. Un bulk_create con todos los DetalleVenta.
+      4. Un UPDATE con F() que descuenta el stock solo si todavía alcanza.
+      5. Dos consultas para sumar la venta al resumen diario de los reportes.
+      6. Un UPDATE con F() que suma la venta a los totales de la caja (solo si sigue abierta).
+
+    Tiene que llamarse dentro de transaction.atomic(): si algo falla se lanza
+    ErrorVenta y no queda nada guardado a medias.
+    """
+    if sesion_id is None:
+        raise CajaCerrada()
+    if metodo_pago not in SesionCaja.CAMPO_TOTAL_POR_METODO:
+        raise ErrorVenta(f"Método de pago inválido: {metodo_pago}")
+
+    cantidades = agrupar_items(items)
+    if not cantidades:
+        raise ErrorVenta("El carrito está vacío")
+
+    # 1. Bloqueo de todos los productos del carrito en una sola consulta
+    productos = Producto.objects.select_for_update().in_bulk(list(cantidades))
+
+    # 2. Validación de stock en memoria
+    total = Decimal('0')
+    renglones = []
+    for producto_id, cantidad in cantidades.items():
+        producto = productos.get(producto_id)
+        if producto is None:
+            raise ErrorVenta(f"El producto #{producto_id} no existe.")
+        if producto.stock_actual < cantidad:
+            raise ErrorVenta(f"No hay suficiente stock de {producto.nombre}. Disponible: {producto.stock_actual}")
+
+        subtotal = producto.precio_venta * cantidad
+        total += subtotal
+        renglones.append((producto, cantidad, subtotal))
+
+    venta = Venta.objects.create(
+        sesion_id=sesion_id,
+        total=total,
+        metodo_pago=metodo_pago,
+        usuario=usuario,
+    )
+
+    # 3. Todos los renglones en un INSERT (bulk_create no llama a save(), el subtotal va calculado)
+    DetalleVenta.objects.bulk_create([
+        DetalleVenta(
+            venta=venta,
+            producto=producto,
+            cantidad=cantidad,
+            precio_unitario=producto.precio_venta,
+            costo_unitario=producto.precio_costo,
+            subtotal=subtotal,
+        )
+        for producto, cantidad, subtotal in renglones
+    ])
+
+    # 4. Descuento de stock condicional: cada fila solo se toca si el stock sigue alcanzando
+    condicion = Q()
+    for producto_id, cantidad in cantidades.items():
+        condicion |= Q(pk=producto_id, stock_actual__gte=cantidad)
+
+    actualizados = Producto.objects.filter(condicion).update(
+        stock_actual=Case(
+            *[When(pk=producto_id, then=F('stock_actual') - cantidad) for producto_id, cantidad in cantidades.items()],
+            output_field=DecimalField(max_digits=10, decimal_places=3),
+        ),
+        actualizado=timezone.now(),
+    )
+    if actualizados != len(cantidades):
+        raise ErrorVenta("El stock cambió mientras se cobraba. Volvé a intentar.")
+
+    # 5. Resumen diario (tabla precalculada de los reportes)
+    sumar_al_resumen_diario(timezone.localdate(venta.fecha), metodo_pago, [
+        (producto.id, producto.categoria_id, cantidad, subtotal, producto.precio_costo * cantidad)
+        for producto, cantidad, subtotal in renglones
+    ])
+
+    # 6. Totales de la caja. Es la última escritura a propósito: la fila de la caja
+    # queda tomada lo menos posible. Si la caja se cerró mientras tanto, no se guarda nada.
+    if not sumar_venta(sesion_id, metodo_pago, total, solo_abierta=True):
+        raise CajaCerrada()
+
+    # El UPDATE no dispara señales: el stock cacheado de estos códigos y la versión del catálogo (ETag) quedan viejos
+    transaction.on_commit(lambda: olvidar_productos(producto_ids=list(cantidades)))
+    transaction.on_commit(subir_version_catalogo)
+
+    return venta
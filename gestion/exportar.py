@@ -0,0 +1,138 @@
+import csv
+
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, FloatField, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .historial import filtrar_ventas
+from .models import Producto, Venta
+
+# Filas que se piden a la base por vuelta: la memoria no depende del total de ventas
+FILAS_POR_LOTE = 2000
+
+ENCABEZADOS_VENTAS = ('ID Venta', 'Fecha', 'Cajero/Usuario', 'Método Pago', 'Total', 'ID Sesión Caja', 'Anulada')
+
+
+def filas_de_ventas(desde=None, hasta=None, sesion_id=None):
+    """
+    Genera las filas de la exportación de ventas, de la más nueva a la más vieja.
+    Un solo SELECT con el JOIN al usuario de la caja, recorrido por lotes con
+    iterator(): ni modelos, ni una consulta por venta, ni la lista entera en memoria.
+
+    desde/hasta: fechas locales inclusive (None = sin límite).
+    """
+    ventas = filtrar_ventas(Venta.objects.all(), sesion=sesion_id, desde=desde, hasta=hasta)
+
+    columnas = ventas.order_by('-fecha', '-id').values_list(
+        'id', 'fecha', 'sesion__usuario__username', 'metodo_pago', 'total', 'sesion_id', 'anulada',
+    )
+    for venta_id, fecha, usuario, metodo_pago, total, sesion, anulada in columnas.iterator(chunk_size=FILAS_POR_LOTE):
+        yield (
+            venta_id,
+            timezone.localtime(fecha).strftime('%d/%m/%Y %H:%M'),
+            usuario,
+            metodo_pago,
+            float(total),
+            sesion,
+            'SI' if anulada else '',
+        )
+
+
+ENCABEZADOS_PRODUCTOS = ('Código', 'Nombre', 'Categoría', 'Costo ($)', 'Precio Venta ($)', 'Ganancia x Unid ($)',
+                         'Margen (%)', 'Stock', 'Dinero Invertido ($)')
+
+_DINERO = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _productos_valorizados():
+    """
+    Productos activos con la ganancia, el margen y el valor del inventario
+    calculados por la base, ordenados por categoría (sin categoría al final) y nombre.
+    """
+    return Producto.objects.filter(activo=True).annotate(
+        nombre_categoria=Coalesce('categoria__nombre', Value('-')),
+        ganancia=ExpressionWrapper(F('precio_venta') - F('precio_costo'), output_field=_DINERO),
+        margen=Case(
+            When(precio_venta__gt=0, then=(F('precio_venta') - F('precio_costo')) * 100 / F('precio_venta')),
+            default=Value(0),
+            output_field=FloatField(),
+        ),
+        valor_inventario=ExpressionWrapper(F('precio_costo') * F('stock_actual'), output_field=_DINERO),
+    ).order_by(F('categoria__nombre').asc(nulls_last=True), 'nombre', 'id')
+
+
+def _fila_de_total(titulo, categoria, valor):
+    return ('', titulo, categoria, None, None, None, None, None, round(float(valor), 2))
+
+
+def filas_de_productos():
+    """
+    Filas de la lista de precios y stock, agrupadas por categoría. Un solo SELECT
+    (JOIN a la categoría y las cuentas hechas por la base) recorrido con iterator();
+    como vienen ordenadas, al cerrar cada categoría se agrega su fila de total y
+    al final el total del inventario, sin otra consulta.
+    """
+    columnas = _productos_valorizados().values_list(
+        'codigo', 'nombre', 'nombre_categoria', 'precio_costo', 'precio_venta', 'ganancia', 'margen',
+        'stock_actual', 'valor_inventario',
+    )
+    categoria_actual, subtotal, total = None, 0, 0
+    for codigo, nombre, categoria, costo, venta, ganancia, margen, stock, valor in columnas.iterator(
+            chunk_size=FILAS_POR_LOTE):
+        if categoria != categoria_actual:
+            if categoria_actual is not None:
+                yield _fila_de_total(f'Total {categoria_actual}', categoria_actual, subtotal)
+            categoria_actual, subtotal = categoria, 0
+        subtotal += valor
+        total += valor
+        yield (
+            codigo,
+            nombre,
+            categoria,
+            float(costo),
+            float(venta),
+            float(ganancia),
+            round(margen, 1),
+            stock,
+            float(valor),
+        )
+
+    if categoria_actual is not None:
+        yield _fila_de_total(f'Total {categoria_actual}', categoria_actual, subtotal)
+    yield _fila_de_total('TOTAL INVENTARIO', '', total)
+
+
+class _Eco:
+    """Archivo falso para csv.writer: devuelve la línea en vez de guardarla."""
+    def write(self, valor):
+        return valor
+
+
+def lineas_csv(encabezados, filas):
+    """CSV línea por línea, para mandarlo con un StreamingHttpResponse."""
+    escritor = csv.writer(_Eco(), delimiter=';')
+    # BOM para que Excel abra bien los acentos
+    yield '\ufeff' + escritor.writerow(encabezados)
+    for fila in filas:
+        yield escritor.writerow(fila)
+
+
+def escribir_csv(encabezados, filas, destino):
+    """Escribe el CSV en un archivo de texto abierto (mismo formato que lineas_csv)."""
+    for linea in lineas_csv(encabezados, filas):
+        destino.write(linea)
+
+
+def escribir_xlsx(encabezados, filas, destino, titulo='Hoja1'):
+    """
+    Escribe un XLSX con openpyxl en modo write_only: cada fila se vuelca al
+    archivo temporal de la hoja apenas se agrega, así que la memoria queda fija.
+    destino: ruta o archivo binario abierto.
+    """
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet(titulo)
+    hoja.append(list(encabezados))
+    for fila in filas:
+        hoja.append(list(fila))
+    libro.save(destino)
@@ -4,4 +4,10 @@ class ImportarProductosForm(forms.Form):
     archivo_excel = forms.FileField(
         label="Seleccionar archivo Excel o CSV",
         help_text="Columnas requeridas: codigo, nombre, venta. Opcionales: costo, stock, categoria."
-    )
\ No newline at end of file
+    )
+    previsualizar = forms.BooleanField(
+        label="Ver los cambios antes de aplicarlos",
+        required=False,
+        initial=True,
+        help_text="Muestra productos nuevos, cambios de precio y de stock sin guardar nada hasta que confirmes."
+    )
@@ -0,0 +1,68 @@
+import datetime
+
+from django.db.models import Prefetch
+
+from .catalogo import codificar_cursor, decodificar_cursor
+from .models import DetalleVenta, Venta
+from .reportes import inicio_del_dia
+
+VENTAS_POR_PAGINA = 50
+
+
+def filtrar_ventas(ventas, sesion=None, usuario=None, metodo_pago=None, anulada=None, desde=None, hasta=None):
+    """
+    Aplica los filtros del historial. desde/hasta: fechas locales inclusive.
+    anulada: True (solo anuladas), False (solo válidas) o None (todas).
+    """
+    if sesion:
+        ventas = ventas.filter(sesion_id=sesion)
+    if usuario:
+        ventas = ventas.filter(usuario_id=usuario)
+    if metodo_pago:
+        ventas = ventas.filter(metodo_pago=metodo_pago)
+    if anulada is not None:
+        ventas = ventas.filter(anulada=anulada)
+    if desde:
+        ventas = ventas.filter(fecha__gte=inicio_del_dia(desde))
+    # El último día del calendario no tiene día siguiente: ahí no hay tope
+    if hasta and hasta < datetime.date.max:
+        ventas = ventas.filter(fecha__lt=inicio_del_dia(hasta + datetime.timedelta(days=1)))
+    return ventas
+
+
+def pagina_ventas(cursor=None, limite=VENTAS_POR_PAGINA, **filtros):
+    """
+    Una página del historial, de la venta más nueva a la más vieja, paginada por
+    clave (fecha, id) como el catálogo: la página 2000 es un salto en el índice
+    venta_fecha_id igual que la primera, sin OFFSET.
+
+    Trae en el mismo viaje el usuario y el cliente (JOIN) y los detalles con su
+    producto (una consulta más para toda la página). La caja no se une: la
+    pantalla solo muestra sesion_id, y el INNER JOIN hacía que SQLite recorriera
+    las cajas y ordenara todas las ventas en vez de bajar por venta_fecha_id.
+    Devuelve (lista_de_ventas, cursor_siguiente o None).
+    """
+    ventas = filtrar_ventas(Venta.objects.all(), **filtros)
+
+    if cursor:
+        fecha, venta_id = decodificar_cursor(cursor)
+        try:
+            fecha = datetime.datetime.fromisoformat(fecha)
+        except ValueError:
+            raise ValueError("Cursor de paginación inválido")
+        # Equivale a (fecha, id) < cursor, escrito como rango sobre fecha para que
+        # SQLite baje por el índice y corte en la fila 51 (con un OR recorre de más)
+        ventas = ventas.filter(fecha__lte=fecha).exclude(fecha=fecha, id__gte=venta_id)
+
+    ventas = ventas.select_related('usuario', 'cliente').prefetch_related(
+        Prefetch('detalles', queryset=DetalleVenta.objects.select_related('producto').order_by('id')),
+    ).order_by('-fecha', '-id')
+
+    # Pedimos una de más para saber si hay otra página sin hacer un COUNT
+    filas = list(ventas[:limite + 1])
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor(filas[-1].fecha.isoformat(), filas[-1].id)
+    return filas, siguiente
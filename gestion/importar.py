@@ -0,0 +1,408 @@
+"""
+Importación masiva de productos desde Excel/CSV.
+
+Cada lote de filas se limpia y valida con operaciones vectorizadas de pandas y
+se guarda con pocas consultas, sin importar cuántas filas tenga:
+  1. Categorías: un SELECT de las que existen + un bulk_create de las nuevas.
+  2. Productos: un SELECT de los códigos que ya existen (para contar) y un
+     INSERT ... ON CONFLICT (codigo) DO UPDATE.
+
+La pantalla de importación usa ejecutar_importacion(): lee el archivo por lotes
+(CSV con chunksize, XLSX con openpyxl en modo read_only), guarda cada lote en
+su propia transacción junto con el punto de control, y anota las filas con
+errores en vez de cancelar todo. Si se corta, se retoma desde el último lote guardado.
+
+Antes de aplicar, previsualizar() compara el archivo contra los productos que ya
+existen (sin escribir nada) y deja el archivo ya limpio en el cache: al confirmar,
+ejecutar_importacion() usa eso en vez de volver a leer el archivo.
+"""
+import csv
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .catalogo import olvidar_categorias, olvidar_productos, subir_version_catalogo
+from .models import Categoria, FilaConError, ImportacionProductos, Producto
+
+COLUMNAS_REQUERIDAS = ('codigo', 'nombre', 'venta')
+CATEGORIA_POR_DEFECTO = 'General'
+FILAS_POR_LOTE = 2000
+CODIGOS_POR_CONSULTA = 10000
+
+# La previsualización queda en el cache este tiempo esperando que la confirmen
+SEGUNDOS_CACHE_PREVIA = 60 * 60
+
+# Columnas que pisa la importación en los productos que ya existen
+CAMPOS_ACTUALIZADOS = ['nombre', 'precio_venta', 'precio_costo', 'stock_actual', 'categoria', 'activo', 'actualizado']
+
+
+class ErrorImportacion(Exception):
+    pass
+
+
+def normalizar_codigos(codigos):
+    """
+    Códigos como texto sin espacios. Solo se saca el '.0' de los números enteros
+    que Excel guardó como decimales ("7790001.0" -> "7790001"); un código que
+    contiene ".0" en el medio queda igual.
+    """
+    return codigos.astype(str).str.strip().str.replace(r'^(\d+)\.0+$', r'\1', regex=True)
+
+
+def _texto(df, columna):
+    if columna not in df.columns:
+        return pd.Series('', index=df.index)
+    return df[columna].fillna('').astype(str).str.strip().replace('nan', '')
+
+
+def _numeros(textos):
+    """Texto -> número (acepta coma decimal). Vacío o inválido = NaN."""
+    return pd.to_numeric(textos.str.replace(',', '.', regex=False), errors='coerce')
+
+
+def normalizar_columnas(columnas):
+    columnas = pd.Index(columnas).astype(str).str.strip().str.lower()
+    if any(col not in columnas for col in COLUMNAS_REQUERIDAS):
+        raise ErrorImportacion("El archivo DEBE tener las columnas: codigo, nombre, venta")
+    return columnas
+
+
+def limpiar(df):
+    """
+    Normaliza y valida un DataFrame recién leído (todo texto): columnas en
+    minúscula, códigos y textos limpios, números con coma o punto (vacío = 0) y
+    categoría por defecto. El índice del DataFrame es la posición de cada fila de
+    datos en el archivo.
+
+    Devuelve (limpio, errores):
+      limpio:  codigo, nombre, categoria, venta, costo, stock de las filas válidas;
+               si un código se repite, queda la última fila.
+      errores: fila (número en el archivo, la 1 es el encabezado), codigo, mensaje.
+    """
+    df = df.copy()
+    df.columns = normalizar_columnas(df.columns)
+
+    codigos = normalizar_codigos(_texto(df, 'codigo'))
+    nombres = _texto(df, 'nombre')
+    categorias = _texto(df, 'categoria').replace('', CATEGORIA_POR_DEFECTO)
+    textos = {col: _texto(df, col) for col in ('venta', 'costo', 'stock')}
+    numeros = {col: _numeros(texto) for col, texto in textos.items()}
+
+    def invalido(col):
+        return numeros[col].isna() & textos[col].ne('')
+
+    # Se informa el primer problema de cada fila, en este orden
+    mensajes = pd.Series(np.select(
+        [
+            codigos.eq(''), nombres.eq(''),
+            codigos.str.len().gt(50), nombres.str.len().gt(100),
+            invalido('venta'), numeros['venta'].lt(0), numeros['venta'].ge(10 ** 8),
+            invalido('costo'), numeros['costo'].lt(0), numeros['costo'].ge(10 ** 8),
+            invalido('stock'), numeros['stock'].abs().ge(10 ** 7),
+        ],
+        [
+            'Falta el código', 'Falta el nombre',
+            'Código demasiado largo (máx. 50)', 'Nombre demasiado largo (máx. 100)',
+            'Precio de venta inválido', 'Precio de venta negativo', 'Precio de venta demasiado grande',
+            'Costo inválido', 'Costo negativo', 'Costo demasiado grande',
+            'Stock inválido', 'Stock demasiado grande',
+        ],
+        default='',
+    ), index=df.index)
+
+    con_error = mensajes.ne('')
+    errores = pd.DataFrame({
+        'fila': df.index[con_error.to_numpy()] + 2,
+        'codigo': codigos[con_error].str.slice(0, 100).to_numpy(),
+        'mensaje': mensajes[con_error].to_numpy(),
+    })
+
+    limpio = pd.DataFrame({
+        'codigo': codigos,
+        'nombre': nombres,
+        'categoria': categorias,
+        'venta': numeros['venta'].fillna(0).round(2),
+        'costo': numeros['costo'].fillna(0).round(2),
+        'stock': numeros['stock'].fillna(0).round(3),
+    })[~con_error]
+    return limpio.drop_duplicates('codigo', keep='last'), errores
+
+
+def resolver_categorias(nombres):
+    """{nombre: id} para los nombres dados, creando de una vez las que falten."""
+    nombres = set(nombres)
+    ids = {}
+    # Si hubiera categorías repetidas con el mismo nombre, usamos la más vieja
+    for categoria_id, nombre in Categoria.objects.filter(nombre__in=nombres).order_by('-id').values_list('id', 'nombre'):
+        ids[nombre] = categoria_id
+
+    nuevas = Categoria.objects.bulk_create([Categoria(nombre=nombre) for nombre in sorted(nombres - set(ids))])
+    ids.update({categoria.nombre: categoria.id for categoria in nuevas})
+    return ids
+
+
+def guardar_productos(limpio, lote=FILAS_POR_LOTE):
+    """
+    Crea o actualiza (por código) los productos de un DataFrame ya limpio.
+    Devuelve (nuevos, actualizados). Llamar dentro de una transacción.
+    """
+    if limpio.empty:
+        return 0, 0
+
+    categorias = resolver_categorias(limpio['categoria'].unique())
+    codigos = limpio['codigo'].tolist()
+
+    existentes = 0
+    for inicio in range(0, len(codigos), lote):
+        existentes += Producto.objects.filter(codigo__in=codigos[inicio:inicio + lote]).count()
+
+    filas = zip(
+        codigos,
+        limpio['nombre'],
+        limpio['categoria'].map(categorias),
+        limpio['venta'].map('{:.2f}'.format),
+        limpio['costo'].map('{:.2f}'.format),
+        limpio['stock'].map('{:.3f}'.format),
+    )
+    Producto.objects.bulk_create(
+        [
+            Producto(codigo=codigo, nombre=nombre, categoria_id=categoria_id, precio_venta=venta,
+                     precio_costo=costo, stock_actual=stock, activo=True)
+            for codigo, nombre, categoria_id, venta, costo, stock in filas
+        ],
+        batch_size=lote,
+        update_conflicts=True,
+        unique_fields=['codigo'],
+        update_fields=CAMPOS_ACTUALIZADOS,
+    )
+
+    # bulk_create no dispara las señales de Producto ni de Categoria: avisamos a los caches nosotros
+    transaction.on_commit(lambda: olvidar_productos(codigos=codigos))
+    transaction.on_commit(subir_version_catalogo)
+    transaction.on_commit(olvidar_categorias)
+    return len(codigos) - existentes, existentes
+
+
+# --- IMPORTACIÓN POR LOTES (la de la pantalla) ---
+
+def _es_csv(ruta):
+    return str(ruta).lower().endswith('.csv')
+
+
+def verificar_encabezado(ruta):
+    """Lee solo la primera fila y controla las columnas obligatorias (ErrorImportacion si faltan)."""
+    if _es_csv(ruta):
+        columnas = pd.read_csv(ruta, dtype=str, nrows=0).columns
+    else:
+        libro = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            columnas = next(libro.active.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            libro.close()
+    normalizar_columnas(['' if valor is None else valor for valor in columnas])
+
+
+def contar_filas(ruta):
+    """Filas de datos del archivo (sin el encabezado), sin cargarlo en memoria."""
+    if _es_csv(ruta):
+        # Con el lector de CSV, no por líneas: una celda entre comillas puede tener saltos de línea.
+        # Las filas vacías no cuentan, igual que en read_csv.
+        with open(ruta, newline='', encoding='utf-8', errors='replace') as archivo:
+            return max(0, sum(1 for fila in csv.reader(archivo) if fila) - 1)
+    libro = load_workbook(ruta, read_only=True)
+    try:
+        return max(0, (libro.active.max_row or 1) - 1)
+    finally:
+        libro.close()
+
+
+def leer_por_lotes(ruta, lote=FILAS_POR_LOTE, saltear=0):
+    """
+    Genera DataFrames (todo texto) de hasta `lote` filas, empezando después de
+    las primeras `saltear` filas de datos. El índice de cada DataFrame es la
+    posición de la fila en el archivo, para informar bien los errores.
+    """
+    posicion = saltear
+    if _es_csv(ruta):
+        partes = pd.read_csv(ruta, dtype=str, keep_default_na=False, chunksize=lote,
+                             skiprows=range(1, saltear + 1))
+        for parte in partes:
+            parte.index = pd.RangeIndex(posicion, posicion + len(parte))
+            posicion += len(parte)
+            yield parte
+        return
+
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = ['' if valor is None else str(valor) for valor in next(filas, ())]
+        ancho = len(encabezado)
+        bloque = []
+        for numero, fila in enumerate(filas):
+            if numero < saltear:
+                continue
+            valores = ['' if valor is None else str(valor) for valor in fila[:ancho]]
+            bloque.append(valores + [''] * (ancho - len(valores)))
+            if len(bloque) == lote:
+                yield pd.DataFrame(bloque, columns=encabezado, index=pd.RangeIndex(posicion, posicion + lote))
+                posicion += lote
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=encabezado, index=pd.RangeIndex(posicion, posicion + len(bloque)))
+    finally:
+        libro.close()
+
+
+# --- PREVISUALIZACIÓN (sin escribir nada) ---
+
+def _clave_previa(importacion_id):
+    return f'gestion:importacion:{importacion_id}:previa'
+
+
+def comparar_con_existentes(limpio):
+    """
+    Cruza las filas limpias con los productos que ya existen con esos códigos
+    (un SELECT por cada CODIGOS_POR_CONSULTA códigos: uno solo en una lista normal)
+    y marca, columna por columna y sin recorrer filas, qué cambiaría.
+    """
+    columnas = ['codigo', 'nombre_actual', 'venta_actual', 'costo_actual', 'stock_actual', 'categoria_actual',
+                'activo_actual']
+    codigos = limpio['codigo'].tolist()
+    existentes = []
+    for inicio in range(0, len(codigos), CODIGOS_POR_CONSULTA):
+        existentes.extend(Producto.objects.filter(codigo__in=codigos[inicio:inicio + CODIGOS_POR_CONSULTA]).values_list(
+            'codigo', 'nombre', 'precio_venta', 'precio_costo', 'stock_actual', 'categoria__nombre', 'activo',
+        ))
+    actuales = pd.DataFrame(existentes, columns=columnas)
+    for columna in ('venta_actual', 'costo_actual', 'stock_actual'):
+        actuales[columna] = actuales[columna].astype(float)
+
+    cambios = limpio.reset_index(names='posicion').merge(actuales, on='codigo', how='left', indicator=True)
+    cambios['nuevo'] = cambios['_merge'].eq('left_only')
+    existe = ~cambios['nuevo']
+    cambios['cambia_precio'] = existe & cambios['venta'].ne(cambios['venta_actual'].round(2))
+    cambios['cambia_costo'] = existe & cambios['costo'].ne(cambios['costo_actual'].round(2))
+    cambios['cambia_stock'] = existe & cambios['stock'].ne(cambios['stock_actual'].round(3))
+    cambios['cambia_otro'] = existe & (
+        cambios['nombre'].ne(cambios['nombre_actual'])
+        | cambios['categoria'].ne(cambios['categoria_actual'].fillna(''))
+        | cambios['activo_actual'].eq(False)
+    )
+    return cambios.drop(columns='_merge')
+
+
+def previsualizar(ruta, lote=FILAS_POR_LOTE):
+    """
+    Lee y limpia todo el archivo y calcula los cambios, sin guardar nada.
+    Devuelve {'filas', 'limpio', 'errores', 'cambios', 'resumen'}.
+    """
+    filas = 0
+    limpios, errores = [], []
+    for parte in leer_por_lotes(ruta, lote):
+        limpio, con_error = limpiar(parte)
+        limpios.append(limpio)
+        errores.append(con_error)
+        filas += len(parte)
+
+    if not limpios:
+        limpio, con_error = limpiar(pd.DataFrame(columns=list(COLUMNAS_REQUERIDAS), dtype=str))
+        limpios, errores = [limpio], [con_error]
+    limpio = pd.concat(limpios).drop_duplicates('codigo', keep='last')
+    errores = pd.concat(errores, ignore_index=True)
+    cambios = comparar_con_existentes(limpio)
+
+    sin_cambios = ~cambios[['nuevo', 'cambia_precio', 'cambia_costo', 'cambia_stock', 'cambia_otro']].any(axis=1)
+    return {
+        'filas': filas,
+        'limpio': limpio,
+        'errores': errores,
+        'cambios': cambios,
+        'resumen': {
+            'nuevos': int(cambios['nuevo'].sum()),
+            'precios': int(cambios['cambia_precio'].sum()),
+            'costos': int(cambios['cambia_costo'].sum()),
+            'stock': int(cambios['cambia_stock'].sum()),
+            'otros': int(cambios['cambia_otro'].sum()),
+            'sin_cambios': int(sin_cambios.sum()),
+            'con_error': len(errores),
+        },
+    }
+
+
+def obtener_previsualizacion(importacion, lote=FILAS_POR_LOTE):
+    """La previsualización guardada en el cache o, si venció, una nueva (y la guarda)."""
+    previa = cache.get(_clave_previa(importacion.id))
+    if previa is None:
+        previa = previsualizar(importacion.archivo.path, lote)
+        cache.set(_clave_previa(importacion.id), previa, SEGUNDOS_CACHE_PREVIA)
+    return previa
+
+
+def olvidar_previsualizacion(importacion_id):
+    cache.delete(_clave_previa(importacion_id))
+
+
+def _lotes_del_archivo(ruta, lote, saltear):
+    for parte in leer_por_lotes(ruta, lote, saltear):
+        limpio, errores = limpiar(parte)
+        yield len(parte), limpio, errores
+
+
+def _lotes_de_la_previa(previa, lote, saltear):
+    """Los mismos lotes que leería del archivo, pero cortados de la previsualización ya limpia."""
+    limpio, errores = previa['limpio'], previa['errores']
+    for inicio in range(saltear, previa['filas'], lote):
+        fin = min(inicio + lote, previa['filas'])
+        yield (
+            fin - inicio,
+            limpio[(limpio.index >= inicio) & (limpio.index < fin)],
+            errores[errores['fila'].between(inicio + 2, fin + 1)],
+        )
+
+
+def ejecutar_importacion(importacion_id, lote=FILAS_POR_LOTE):
+    """
+    Procesa (o retoma) una ImportacionProductos lote por lote. Cada lote se guarda
+    en su propia transacción junto con sus filas con error y el punto de control
+    (filas_procesadas), así un corte a mitad de camino no deja nada a medias.
+    """
+    importacion = ImportacionProductos.objects.get(pk=importacion_id)
+    registro = ImportacionProductos.objects.filter(pk=importacion_id)
+    try:
+        ruta = importacion.archivo.path
+        # Si se previsualizó, el archivo ya está leído y limpio en el cache
+        previa = cache.get(_clave_previa(importacion_id))
+        if previa is not None:
+            importacion.filas_totales = previa['filas']
+            lotes = _lotes_de_la_previa(previa, lote, importacion.filas_procesadas)
+        else:
+            importacion.filas_totales = importacion.filas_totales or contar_filas(ruta)
+            lotes = _lotes_del_archivo(ruta, lote, importacion.filas_procesadas)
+        importacion.estado = 'EN_CURSO'
+        importacion.error = ''
+        importacion.save(update_fields=['filas_totales', 'estado', 'error', 'actualizado'])
+
+        for filas, limpio, errores in lotes:
+            with transaction.atomic():
+                nuevos, actualizados = guardar_productos(limpio, lote)
+                FilaConError.objects.bulk_create([
+                    FilaConError(importacion_id=importacion_id, fila=fila, codigo=codigo, mensaje=mensaje)
+                    for fila, codigo, mensaje in errores.itertuples(index=False)
+                ])
+                registro.update(
+                    filas_procesadas=F('filas_procesadas') + filas,
+                    nuevos=F('nuevos') + nuevos,
+                    actualizados=F('actualizados') + actualizados,
+                    con_error=F('con_error') + len(errores),
+                    actualizado=timezone.now(),
+                )
+
+        registro.update(estado='LISTO', actualizado=timezone.now())
+        olvidar_previsualizacion(importacion_id)
+    except Exception as e:
+        registro.update(estado='ERROR', error=str(e), actualizado=timezone.now())
@@ -0,0 +1,71 @@
+"""
+Utilidades compartidas por los comandos bench_*.
+
+Los benchmarks corren SIEMPRE sobre una base de prueba descartable (igual que los
+tests), nunca sobre la base real del kiosco.
+"""
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection, connections
+
+
+@contextmanager
+def base_descartable():
+    """Crea una base de prueba con todas las migraciones y la borra al salir."""
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    if connection.vendor == 'sqlite':
+        # En SQLite usamos un archivo real (no memoria) para que los hilos compitan
+        # por el mismo archivo como pasa en el kiosco.
+        fd, archivo = tempfile.mkstemp(prefix='bench_kiosco_', suffix='.sqlite3')
+        os.close(fd)
+        test_settings['NAME'] = archivo
+
+    nombre_original = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+
+def correr_en_paralelo(clientes, trabajo):
+    """
+    Lanza `clientes` hilos que arrancan a la vez y ejecutan trabajo(numero_cliente).
+    Cada trabajo devuelve (latencias_en_segundos, errores).
+    Devuelve (segundos_totales, todas_las_latencias, errores).
+    """
+    largada = threading.Barrier(clientes + 1)
+    resultados = [None] * clientes
+
+    def correr(numero):
+        largada.wait()
+        try:
+            resultados[numero] = trabajo(numero)
+        finally:
+            connections.close_all()  # Cada hilo tiene sus propias conexiones
+
+    hilos = [threading.Thread(target=correr, args=(n,)) for n in range(clientes)]
+    for hilo in hilos:
+        hilo.start()
+    largada.wait()
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+
+    latencias = [lat for resultado in resultados if resultado for lat in resultado[0]]
+    errores = sum(resultado[1] for resultado in resultados if resultado)
+    return segundos, latencias, errores
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por el método del rango más cercano."""
+    if not valores:
+        return 0
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
@@ -0,0 +1,69 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+
+from gestion.caja import calcular_resumen, totales_recalculados
+from gestion.models import MovimientoCaja, SesionCaja, Venta
+
+from ._bench import base_descartable
+
+
+def resumen_anterior(sesion):
+    """El cálculo viejo de cierre_caja (seis agregaciones separadas), para comparar."""
+    return (
+        sesion.ventas.filter(metodo_pago='EFECTIVO').aggregate(Sum('total'))['total__sum'] or 0,
+        sesion.ventas.filter(metodo_pago='VALE').aggregate(Sum('total'))['total__sum'] or 0,
+        sesion.ventas.filter(metodo_pago__in=['DEBITO', 'MERCADOPAGO']).aggregate(Sum('total'))['total__sum'] or 0,
+        sesion.ventas.filter(metodo_pago='CREDITO').aggregate(Sum('total'))['total__sum'] or 0,
+        sesion.movimientos.filter(tipo='INGRESO').aggregate(Sum('monto'))['monto__sum'] or 0,
+        sesion.movimientos.filter(tipo='EGRESO').aggregate(Sum('monto'))['monto__sum'] or 0,
+    )
+
+
+class Command(BaseCommand):
+    help = "Benchmark del cálculo de cierre de caja sobre una sesión con muchas ventas (base descartable)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ventas', type=int, default=10000, help="Ventas en la sesión")
+        parser.add_argument('--sesiones', type=int, default=20, help="Otras sesiones de relleno")
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with base_descartable():
+            usuario = User.objects.create_user('bench')
+            metodos = [m for m, _ in Venta.METODOS_PAGO]
+
+            # Sesiones de relleno para que la tabla de ventas no sea solo la sesión medida
+            sesiones = [SesionCaja.objects.create(usuario=usuario, saldo_inicial=0, estado=False)
+                        for _ in range(options['sesiones'])]
+            sesion = SesionCaja.objects.create(usuario=usuario, saldo_inicial=1000)
+            for s in sesiones + [sesion]:
+                Venta.objects.bulk_create([
+                    Venta(sesion=s, usuario=usuario, total=random.randint(100, 5000),
+                          metodo_pago=random.choice(metodos), anulada=random.random() < 0.01)
+                    for _ in range(options['ventas'])
+                ], batch_size=2000)
+                MovimientoCaja.objects.bulk_create([
+                    MovimientoCaja(sesion=s, tipo=random.choice(['INGRESO', 'EGRESO']), monto=500, descripcion='bench')
+                    for _ in range(50)
+                ])
+
+            self.stdout.write(f"{'cálculo':<22}{'consultas':>10}{'ms promedio':>14}")
+            calculos = (
+                ('6 agregaciones', resumen_anterior),
+                ('pasada condicional', lambda s: totales_recalculados([s.id])),
+                ('totales acumulados', lambda s: calcular_resumen(SesionCaja.objects.get(pk=s.pk))),
+            )
+            for nombre, funcion in calculos:
+                with CaptureQueriesContext(connection) as consultas:
+                    funcion(sesion)
+                inicio = time.perf_counter()
+                for _ in range(options['repeticiones']):
+                    funcion(sesion)
+                ms = (time.perf_counter() - inicio) / options['repeticiones'] * 1000
+                self.stdout.write(f"{nombre:<22}{len(consultas):>10}{ms:>14.2f}")
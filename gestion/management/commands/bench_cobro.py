@@ -0,0 +1,58 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from gestion.cobro import cobrar
+from gestion.models import Producto, SesionCaja
+
+from ._bench import base_descartable, correr_en_paralelo, percentil
+
+
+class Command(BaseCommand):
+    help = ("Benchmark de concurrencia del cobro: N cajas cobrando en paralelo carritos que no "
+            "comparten productos, comparando el bloqueo de la caja abierta contra el modo sin bloqueo.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, nargs='+', default=[1, 2, 4, 8],
+                            help="Cantidades de cajas en paralelo a probar")
+        parser.add_argument('--ventas', type=int, default=50, help="Ventas por caja")
+        parser.add_argument('--items', type=int, default=5, help="Productos por carrito")
+
+    def handle(self, *args, **options):
+        clientes = options['clientes']
+        with base_descartable():
+            usuario = User.objects.create_user('bench')
+            SesionCaja.objects.create(usuario=usuario, saldo_inicial=0)
+
+            # Cada caja tiene su propio grupo de productos: los carritos no se pisan
+            por_cliente = options['items'] * 4
+            productos = Producto.objects.bulk_create([
+                Producto(codigo=f'BENCH{i:06d}', nombre=f'Producto {i}', precio_venta=100, stock_actual=10 ** 6)
+                for i in range(max(clientes) * por_cliente)
+            ])
+            ids = [p.id for p in productos]
+
+            def trabajo(numero, bloquear_sesion):
+                propios = ids[numero * por_cliente:(numero + 1) * por_cliente]
+                latencias, errores = [], 0
+                for _ in range(options['ventas']):
+                    items = [{'id': pid, 'cantidad': 1} for pid in random.sample(propios, options['items'])]
+                    inicio = time.perf_counter()
+                    try:
+                        cobrar(usuario, items, 'EFECTIVO', bloquear_sesion=bloquear_sesion)
+                    except Exception:
+                        errores += 1
+                        continue
+                    latencias.append(time.perf_counter() - inicio)
+                return latencias, errores
+
+            self.stdout.write(f"{'modo':<16}{'cajas':>6}{'ventas':>8}{'errores':>9}{'ventas/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+            for bloquear_sesion, modo in ((True, 'bloquea caja'), (False, 'sin bloqueo')):
+                for n in clientes:
+                    segundos, latencias, errores = correr_en_paralelo(n, lambda numero: trabajo(numero, bloquear_sesion))
+                    self.stdout.write(
+                        f"{modo:<16}{n:>6}{len(latencias):>8}{errores:>9}{len(latencias) / segundos:>10.1f}"
+                        f"{percentil(latencias, 50) * 1000:>9.1f}{percentil(latencias, 99) * 1000:>9.1f}"
+                    )
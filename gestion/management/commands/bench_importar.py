@@ -0,0 +1,97 @@
+import io
+import random
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+
+from gestion.importar import ejecutar_importacion
+from gestion.models import Categoria, ImportacionProductos, Producto
+
+from ._bench import base_descartable
+
+
+def importar_anterior(df):
+    """La importación vieja (iterrows + get_or_create + update_or_create por fila), para comparar."""
+    df.columns = df.columns.str.strip().str.lower()
+    with transaction.atomic():
+        for index, row in df.iterrows():
+            codigo = str(row['codigo']).strip().replace('.0', '')
+            categoria_obj, _ = Categoria.objects.get_or_create(nombre=str(row.get('categoria', 'General')).strip())
+            Producto.objects.update_or_create(codigo=codigo, defaults={
+                'nombre': str(row['nombre']).strip(),
+                'precio_venta': float(row['venta']) if pd.notna(row['venta']) else 0,
+                'precio_costo': float(row.get('costo', 0)) if pd.notna(row.get('costo')) else 0,
+                'stock_actual': float(row.get('stock', 0)) if pd.notna(row.get('stock')) else 0,
+                'categoria': categoria_obj,
+                'activo': True,
+            })
+
+
+def lista_de_proveedor(filas, desde=0):
+    """CSV como el que manda un proveedor: códigos EAN, ~40 categorías, precios con decimales."""
+    lineas = ['codigo,nombre,venta,costo,stock,categoria']
+    for i in range(desde, desde + filas):
+        costo = round(random.uniform(10, 5000), 2)
+        lineas.append(f'779{i:010d},Producto {i},{round(costo * 1.4, 2)},{costo},{random.randint(0, 200)},'
+                      f'Rubro {i % 40}')
+    return '\n'.join(lineas).encode()
+
+
+class Command(BaseCommand):
+    help = "Benchmark de la importación de productos con un archivo grande (base descartable)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=50000, help="Filas del archivo a importar")
+        parser.add_argument('--filas-anterior', type=int, default=2000,
+                            help="Filas para medir la importación vieja fila por fila (0 = no medirla)")
+
+    def medir(self, nombre, filas, importar):
+        consultas = 0
+
+        def contar(ejecutar, sql, params, many, context):
+            nonlocal consultas
+            consultas += 1
+            return ejecutar(sql, params, many, context)
+
+        with connection.execute_wrapper(contar):
+            inicio = time.perf_counter()
+            importar()
+            segundos = time.perf_counter() - inicio
+        self.stdout.write(f"{nombre:<28}{filas:>8}{consultas:>10}{segundos:>10.2f}{filas / segundos:>12.0f}")
+
+    def handle(self, *args, **options):
+        filas = options['filas']
+        media = tempfile.mkdtemp(prefix='bench_kiosco_')
+        try:
+            with base_descartable(), override_settings(MEDIA_ROOT=media):
+                usuario = User.objects.create_user('bench')
+                contenido = lista_de_proveedor(filas)
+
+                def importar():
+                    # Igual que la pantalla: el archivo subido se procesa por lotes con ejecutar_importacion
+                    importacion = ImportacionProductos.objects.create(
+                        usuario=usuario, nombre_archivo='lista.csv',
+                        archivo=SimpleUploadedFile('lista.csv', contenido),
+                    )
+                    ejecutar_importacion(importacion.id)
+                    importacion.refresh_from_db()
+                    if importacion.estado != 'LISTO':
+                        raise CommandError(f"La importación terminó en {importacion.estado}: {importacion.error}")
+
+                self.stdout.write(f"{'importación':<28}{'filas':>8}{'consultas':>10}{'segundos':>10}{'filas/s':>12}")
+                self.medir('por lotes (alta)', filas, importar)
+                self.medir('por lotes (actualización)', filas, importar)
+
+                if options['filas_anterior']:
+                    anteriores = options['filas_anterior']
+                    df = pd.read_csv(io.BytesIO(lista_de_proveedor(anteriores, desde=filas)))
+                    self.medir('fila por fila (anterior)', anteriores, lambda: importar_anterior(df))
+        finally:
+            shutil.rmtree(media, ignore_errors=True)
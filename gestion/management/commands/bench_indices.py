@@ -0,0 +1,187 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from gestion.caja import totales_recalculados
+from gestion.catalogo import codificar_cursor, pagina_productos
+from gestion.historial import pagina_ventas
+from gestion.models import Categoria, MovimientoCaja, Producto, SesionCaja, Venta
+
+from ._bench import base_descartable
+
+# (modelo, nombre) de los índices y restricciones que se comparan: se sacan para
+# medir "sin índices" y se vuelven a crear para medir "con índices"
+INDICES = (
+    (SesionCaja, 'una_sola_caja_abierta'),
+    (SesionCaja, 'sesioncaja_apertura'),
+    (Venta, 'venta_fecha_id'),
+    (Venta, 'venta_sesion_metodo'),
+    (MovimientoCaja, 'movimiento_sesion_tipo'),
+    (Producto, 'producto_catalogo'),
+    (Producto, 'producto_catalogo_categoria'),
+)
+
+VENTAS_POR_CAJA = 400
+
+
+def _buscar(modelo, nombre):
+    for indice in list(modelo._meta.indexes) + list(modelo._meta.constraints):
+        if indice.name == nombre:
+            return indice
+    raise LookupError(nombre)
+
+
+def sacar_indices():
+    with connection.schema_editor() as editor:
+        for modelo, nombre in INDICES:
+            indice = _buscar(modelo, nombre)
+            if indice in modelo._meta.constraints:
+                editor.remove_constraint(modelo, indice)
+            else:
+                editor.remove_index(modelo, indice)
+
+
+def poner_indices():
+    with connection.schema_editor() as editor:
+        for modelo, nombre in INDICES:
+            indice = _buscar(modelo, nombre)
+            if indice in modelo._meta.constraints:
+                editor.add_constraint(modelo, indice)
+            else:
+                editor.add_index(modelo, indice)
+
+
+def plan(sql):
+    """Plan de ejecución de la consulta (EXPLAIN QUERY PLAN en SQLite, EXPLAIN en el resto)."""
+    prefijo = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else connection.ops.explain_query_prefix() + ' '
+    with connection.cursor() as cursor:
+        cursor.execute(prefijo + sql)
+        return [str(fila[-1]) for fila in cursor.fetchall()]
+
+
+class Command(BaseCommand):
+    help = ("Benchmark de los índices de las consultas frecuentes: planes y tiempos sin y con "
+            "índices sobre un millón de ventas sintéticas (base descartable).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ventas', type=int, default=1_000_000)
+        parser.add_argument('--productos', type=int, default=20000)
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--sin-planes', action='store_true', help="Mostrar solo los tiempos")
+
+    def cargar_datos(self, ventas, productos):
+        usuario = User.objects.create_user('bench')
+        categorias = Categoria.objects.bulk_create([Categoria(nombre=f'Rubro {i}') for i in range(40)])
+        Producto.objects.bulk_create([
+            Producto(codigo=f'779{i:010d}', nombre=f'Producto {random.randint(0, 10 ** 6):07d}',
+                     categoria=categorias[i % 40], precio_venta=100, activo=random.random() > 0.1)
+            for i in range(productos)
+        ], batch_size=5000)
+
+        # Una caja por día, cerradas todas salvo la última
+        cajas = max(ventas // VENTAS_POR_CAJA, 1)
+        primer_dia = timezone.now() - datetime.timedelta(days=cajas)
+        sesiones = SesionCaja.objects.bulk_create([
+            SesionCaja(usuario=usuario, saldo_inicial=0, estado=numero == cajas - 1)
+            for numero in range(cajas)
+        ], batch_size=5000)
+        for numero, sesion in enumerate(sesiones):
+            sesion.fecha_apertura = primer_dia + datetime.timedelta(days=numero)
+        SesionCaja.objects.bulk_update(sesiones, ['fecha_apertura'], batch_size=2000)
+
+        metodos = [m for m, _ in Venta.METODOS_PAGO]
+        lote = []
+        for i in range(ventas):
+            numero = min(i // VENTAS_POR_CAJA, cajas - 1)
+            lote.append(Venta(
+                sesion_id=sesiones[numero].id, usuario=usuario, total=random.randint(100, 5000),
+                metodo_pago=random.choice(metodos), anulada=random.random() < 0.01,
+                fecha=primer_dia + datetime.timedelta(days=numero, seconds=(i % VENTAS_POR_CAJA) * 120),
+            ))
+            if len(lote) == 10000:
+                Venta.objects.bulk_create(lote)
+                lote = []
+                self.stdout.write(f"  {i + 1} ventas...", ending='\r')
+        Venta.objects.bulk_create(lote)
+        MovimientoCaja.objects.bulk_create([
+            MovimientoCaja(sesion=sesion, tipo=random.choice(['INGRESO', 'EGRESO']), monto=500, descripcion='bench')
+            for sesion in sesiones for _ in range(10)
+        ], batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return sesiones, categorias
+
+    def consultas(self, sesiones, categorias):
+        sesion = sesiones[len(sesiones) // 2]
+        hasta = timezone.localdate()
+        desde = hasta - datetime.timedelta(days=30)
+        inicio, fin = [timezone.make_aware(datetime.datetime.combine(d, datetime.time.min)) for d in (desde, hasta)]
+
+        # Cursor de la página 2000 del historial (50 ventas por página), o de la última si hay menos
+        posicion = min(2000 * 50, Venta.objects.count()) - 1
+        fecha, venta_id = Venta.objects.order_by('-fecha', '-id').values_list('fecha', 'id')[posicion]
+        cursor_historial = codificar_cursor(fecha.isoformat(), venta_id)
+        cursor_catalogo = codificar_cursor('Producto 0500000', 0)
+
+        return (
+            ('caja abierta', lambda: SesionCaja.objects.filter(estado=True).values_list('id', flat=True).last()),
+            ('totales de una caja', lambda: totales_recalculados([sesion.id])),
+            ('egresos de una caja', lambda: MovimientoCaja.objects.filter(sesion=sesion, tipo='EGRESO').aggregate(
+                total=Sum('monto'))),
+            ('tickets del último mes', lambda: Venta.objects.filter(
+                fecha__gte=inicio, fecha__lt=fin, anulada=False).count()),
+            ('gastos del último mes', lambda: MovimientoCaja.objects.filter(
+                sesion__fecha_apertura__gte=inicio, sesion__fecha_apertura__lt=fin, tipo='EGRESO',
+            ).aggregate(total=Sum('monto'))),
+            ('catálogo (mitad)', lambda: pagina_productos(cursor=cursor_catalogo)),
+            ('catálogo por categoría', lambda: pagina_productos(categoria=categorias[7].id)),
+            ('historial página 1', lambda: pagina_ventas()),
+            ('historial página 2000', lambda: pagina_ventas(cursor=cursor_historial)),
+        )
+
+    def medir(self, consultas, repeticiones, con_planes):
+        tiempos = {}
+        for nombre, consulta in consultas:
+            with CaptureQueriesContext(connection) as capturadas:
+                consulta()
+            muestras = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                consulta()
+                muestras.append(time.perf_counter() - inicio)
+            tiempos[nombre] = statistics.median(muestras) * 1000
+            if con_planes:
+                self.stdout.write(f"  {nombre}:")
+                for sql in [q['sql'] for q in capturadas.captured_queries if q['sql'].startswith('SELECT')]:
+                    for paso in plan(sql):
+                        self.stdout.write(f"      {paso}")
+        return tiempos
+
+    def handle(self, *args, **options):
+        with base_descartable():
+            self.stdout.write(f"Cargando {options['ventas']} ventas y {options['productos']} productos...")
+            sesiones, categorias = self.cargar_datos(options['ventas'], options['productos'])
+            consultas = self.consultas(sesiones, categorias)
+            con_planes = not options['sin_planes']
+
+            sacar_indices()
+            self.stdout.write("\nSIN ÍNDICES")
+            antes = self.medir(consultas, options['repeticiones'], con_planes)
+            poner_indices()
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write("\nCON ÍNDICES")
+            despues = self.medir(consultas, options['repeticiones'], con_planes)
+
+            self.stdout.write(f"\n{'consulta':<26}{'ms sin':>10}{'ms con':>10}{'veces':>8}")
+            for nombre, _ in consultas:
+                self.stdout.write(f"{nombre:<26}{antes[nombre]:>10.2f}{despues[nombre]:>10.2f}"
+                                  f"{antes[nombre] / max(despues[nombre], 1e-6):>8.1f}")
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from gestion.cobro import cobrar
+from gestion.exportar import filas_de_ventas
+from gestion.models import Producto, SesionCaja, Venta
+from gestion.reportes import calcular_reporte, rango_del_mes
+
+from ._bench import base_descartable, correr_en_paralelo, percentil
+
+# Perfil de fábrica de Django (journal DELETE, BEGIN DEFERRED, 5 s de espera) contra el de settings
+PERFILES = (
+    ('por defecto', {}, 'DELETE'),
+    ('producción', settings.SQLITE_PRODUCCION, 'WAL'),
+)
+
+
+def usar_perfil(opciones, journal):
+    """Cierra las conexiones y hace que las próximas (una por hilo) usen estas OPTIONS."""
+    connections.close_all()
+    connection.settings_dict['OPTIONS'] = dict(opciones)
+    with connection.cursor() as cursor:
+        # journal_mode queda guardado en el archivo: hay que volver a DELETE a mano
+        cursor.execute(f'PRAGMA journal_mode={journal}')
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ("Benchmark de escritura concurrente en SQLite: cajas cobrando en paralelo mientras "
+            "otros hilos leen reportes y exportaciones, con el perfil por defecto y el de producción.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, nargs='+', default=[1, 2, 4, 8],
+                            help="Cantidades de cajas en paralelo a probar")
+        parser.add_argument('--lectores', type=int, default=2, help="Hilos leyendo reportes mientras se cobra")
+        parser.add_argument('--ventas', type=int, default=50, help="Ventas por caja")
+        parser.add_argument('--historico', type=int, default=50000, help="Ventas previas que leen los reportes")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("Este benchmark es solo para SQLite.")
+
+        clientes = options['clientes']
+        with base_descartable():
+            usuario = User.objects.create_user('bench')
+            sesion = SesionCaja.objects.create(usuario=usuario, saldo_inicial=0)
+            por_cliente = 20
+            productos = Producto.objects.bulk_create([
+                Producto(codigo=f'BENCH{i:06d}', nombre=f'Producto {i}', precio_venta=100, stock_actual=10 ** 6)
+                for i in range(max(clientes) * por_cliente)
+            ])
+            ids = [p.id for p in productos]
+            Venta.objects.bulk_create([
+                Venta(sesion=sesion, usuario=usuario, total=random.randint(100, 5000), metodo_pago='EFECTIVO')
+                for _ in range(options['historico'])
+            ], batch_size=5000)
+            hoy = timezone.localdate()
+            desde, hasta = rango_del_mes(hoy.year, hoy.month)
+
+            def cobrador(numero):
+                propios = ids[numero * por_cliente:(numero + 1) * por_cliente]
+                latencias, errores = [], 0
+                for _ in range(options['ventas']):
+                    items = [{'id': pid, 'cantidad': 1} for pid in random.sample(propios, 5)]
+                    inicio = time.perf_counter()
+                    try:
+                        cobrar(usuario, items, 'EFECTIVO')
+                    except Exception:
+                        errores += 1
+                        continue
+                    latencias.append(time.perf_counter() - inicio)
+                return latencias, errores
+
+            def lector(terminaron, lecturas):
+                # Alterna el reporte del mes y una exportación completa (lecturas largas)
+                while not terminaron.is_set():
+                    inicio = time.perf_counter()
+                    try:
+                        calcular_reporte(desde, hasta)
+                        for _ in filas_de_ventas():
+                            pass
+                    except Exception:
+                        lecturas.append(None)
+                        continue
+                    lecturas.append(time.perf_counter() - inicio)
+
+            self.stdout.write(f"{'perfil':<14}{'cajas':>6}{'ventas':>8}{'errores':>9}{'ventas/s':>10}"
+                              f"{'p50 ms':>9}{'p99 ms':>9}{'lecturas':>10}")
+            for nombre, opciones, journal in PERFILES:
+                usar_perfil(opciones, journal)
+                for n in clientes:
+                    terminaron, lecturas, pendientes = threading.Event(), [], [n]
+                    candado = threading.Lock()
+
+                    def trabajo(numero):
+                        if numero >= n:
+                            lector(terminaron, lecturas)
+                            return [], 0
+                        try:
+                            return cobrador(numero)
+                        finally:
+                            with candado:
+                                pendientes[0] -= 1
+                                if not pendientes[0]:
+                                    terminaron.set()
+
+                    segundos, latencias, errores = correr_en_paralelo(n + options['lectores'], trabajo)
+                    self.stdout.write(
+                        f"{nombre:<14}{n:>6}{len(latencias):>8}{errores:>9}{len(latencias) / segundos:>10.1f}"
+                        f"{percentil(latencias, 50) * 1000:>9.1f}{percentil(latencias, 99) * 1000:>9.1f}"
+                        f"{len([x for x in lecturas if x is not None]):>10}"
+                    )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from gestion.models import DetalleVenta, Producto
+
+
+class Command(BaseCommand):
+    help = ("Completa DetalleVenta.costo_unitario en las ventas anteriores a que se guardara el costo, "
+            "usando el precio_costo actual de cada producto. Trabaja por lotes (una transacción por lote), "
+            "así se puede cortar y volver a correr sin problema.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help="Renglones por lote")
+
+    def handle(self, *args, **options):
+        costo_actual = Subquery(Producto.objects.filter(pk=OuterRef('producto_id')).values('precio_costo')[:1])
+        pendientes = DetalleVenta.objects.filter(costo_unitario__isnull=True).order_by('id')
+
+        ultimo_id = 0
+        total = 0
+        while True:
+            # Avanzamos por id (keyset): cada lote arranca donde terminó el anterior
+            ids = list(pendientes.filter(id__gt=ultimo_id).values_list('id', flat=True)[:options['lote']])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                total += DetalleVenta.objects.filter(id__in=ids).update(costo_unitario=costo_actual)
+            ultimo_id = ids[-1]
+            self.stdout.write(f"  {total} renglones completados...")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Listo: {total} renglones con costo completado."))
@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gestion.models import TrabajoExportacion
+
+
+class Command(BaseCommand):
+    help = "Borra las exportaciones (y sus archivos) con más de --dias días."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=7, help="Antigüedad mínima a borrar")
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - datetime.timedelta(days=options['dias'])
+        viejos = TrabajoExportacion.objects.filter(creado__lt=limite)
+
+        borrados = 0
+        for trabajo in viejos.iterator():
+            if trabajo.archivo:
+                trabajo.archivo.delete(save=False)
+            trabajo.delete()
+            borrados += 1
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Listo: {borrados} exportaciones borradas."))
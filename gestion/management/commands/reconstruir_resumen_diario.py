@@ -0,0 +1,30 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.reportes import reconstruir_resumen_diario
+
+
+def fecha(valor):
+    try:
+        return datetime.date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {valor} (use AAAA-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = ("Vuelve a calcular el resumen diario de ventas desde DetalleVenta. Sin fechas rehace todo; "
+            "con --desde/--hasta solo ese rango (inclusive). Corre en una sola transacción.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=fecha, help="Primer día a reconstruir (AAAA-MM-DD)")
+        parser.add_argument('--hasta', type=fecha, help="Último día a reconstruir (AAAA-MM-DD)")
+        parser.add_argument('--lote', type=int, default=2000, help="Renglones por INSERT")
+
+    def handle(self, *args, **options):
+        desde, hasta = options['desde'], options['hasta']
+        if desde and hasta and desde > hasta:
+            raise CommandError("--desde no puede ser posterior a --hasta")
+
+        generados = reconstruir_resumen_diario(desde, hasta, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"✅ Listo: {generados} renglones de resumen generados."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gestion.base_reportes import alias_de_reportes, copia_tomada, refrescar_copia
+
+
+class Command(BaseCommand):
+    help = ("Vuelve a copiar la base principal a la base de reportes (para cron, p. ej. después "
+            "del cierre de caja). Las vistas de reportes ya la refrescan solas cuando está vieja.")
+
+    def handle(self, *args, **options):
+        if not refrescar_copia():
+            self.stdout.write(f"No hay copia que refrescar (base de reportes: {alias_de_reportes() or 'ninguna'}).")
+            return
+        tomada = timezone.localtime(copia_tomada())
+        self.stdout.write(self.style.SUCCESS(f"✅ Listo: copia de reportes al {tomada:%d/%m/%Y %H:%M:%S}."))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from gestion.caja import CAMPOS_TOTALES, totales_recalculados
+from gestion.models import SesionCaja
+
+
+class Command(BaseCommand):
+    help = ("Compara los totales acumulados de cada caja (SesionCaja.ventas_*, total_ingresos, total_egresos) "
+            "contra las ventas y movimientos reales. Con --reparar los reconstruye.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sesion', type=int, nargs='*', help="Solo estas cajas (por id)")
+        parser.add_argument('--reparar', action='store_true', help="Reescribe los totales que no coinciden")
+
+    def handle(self, *args, **options):
+        sesiones = SesionCaja.objects.all()
+        if options['sesion']:
+            sesiones = sesiones.filter(pk__in=options['sesion'])
+
+        reales = totales_recalculados(options['sesion'] or None)
+        vacio = {campo: 0 for campo in CAMPOS_TOTALES}
+
+        diferencias = 0
+        for sesion in sesiones.only('id', *CAMPOS_TOTALES).iterator():
+            esperados = reales.get(sesion.id, vacio)
+            distintos = {campo: valor for campo, valor in esperados.items() if getattr(sesion, campo) != valor}
+            if not distintos:
+                continue
+
+            diferencias += 1
+            detalle = ', '.join(f"{campo}: {getattr(sesion, campo)} -> {valor}" for campo, valor in distintos.items())
+            self.stdout.write(self.style.WARNING(f"Caja {sesion.id}: {detalle}"))
+            if options['reparar']:
+                with transaction.atomic():
+                    SesionCaja.objects.filter(pk=sesion.id).update(**distintos)
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS("✅ Todos los totales de caja coinciden."))
+        elif options['reparar']:
+            self.stdout.write(self.style.SUCCESS(f"Se repararon {diferencias} cajas."))
+        else:
+            self.stdout.write(self.style.ERROR(f"{diferencias} cajas con diferencias. Corré con --reparar para corregirlas."))
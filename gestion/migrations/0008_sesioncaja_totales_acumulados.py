@@ -0,0 +1,77 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:19
+
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def calcular_totales_existentes(apps, schema_editor):
+    SesionCaja = apps.get_model('gestion', 'SesionCaja')
+    Venta = apps.get_model('gestion', 'Venta')
+    MovimientoCaja = apps.get_model('gestion', 'MovimientoCaja')
+
+    campos_venta = {
+        'EFECTIVO': 'ventas_efectivo',
+        'MERCADOPAGO': 'ventas_mercadopago',
+        'DEBITO': 'ventas_debito',
+        'CREDITO': 'ventas_credito',
+        'VALE': 'ventas_vales',
+    }
+    ventas = Venta.objects.filter(anulada=False).values('sesion_id').annotate(**{
+        campo: Sum('total', filter=Q(metodo_pago=metodo), default=0) for metodo, campo in campos_venta.items()
+    })
+    movimientos = MovimientoCaja.objects.values('sesion_id').annotate(
+        total_ingresos=Sum('monto', filter=Q(tipo='INGRESO'), default=0),
+        total_egresos=Sum('monto', filter=Q(tipo='EGRESO'), default=0),
+    )
+
+    totales = {}
+    for fila in list(ventas) + list(movimientos):
+        totales.setdefault(fila.pop('sesion_id'), {}).update(fila)
+    for sesion_id, campos in totales.items():
+        SesionCaja.objects.filter(pk=sesion_id).update(**campos)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0007_venta_anulada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sesioncaja',
+            name='total_egresos',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sesioncaja',
+            name='total_ingresos',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sesioncaja',
+            name='ventas_credito',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sesioncaja',
+            name='ventas_debito',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sesioncaja',
+            name='ventas_efectivo',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sesioncaja',
+            name='ventas_mercadopago',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sesioncaja',
+            name='ventas_vales',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(calcular_totales_existentes, migrations.RunPython.noop),
+    ]
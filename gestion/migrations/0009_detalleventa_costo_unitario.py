@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0008_sesioncaja_totales_acumulados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detalleventa',
+            name='costo_unitario',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Costo al momento de la venta', max_digits=10, null=True),
+        ),
+    ]
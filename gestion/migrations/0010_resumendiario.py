@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def generar_resumen_inicial(apps, schema_editor):
+    from gestion.reportes import reconstruir_resumen_diario
+    reconstruir_resumen_diario(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0009_detalleventa_costo_unitario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('metodo_pago', models.CharField(choices=[('EFECTIVO', 'Efectivo'), ('MERCADOPAGO', 'Mercado Pago'), ('DEBITO', 'Débito'), ('CREDITO', 'Crédito'), ('VALE', 'Vale / Fiado')], max_length=20)),
+                ('cantidad', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('costo', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tickets', models.IntegerField(default=0, help_text='Ventas que incluyeron el producto')),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='gestion.categoria')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='gestion.producto')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario',
+                'verbose_name_plural': 'Resúmenes diarios',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'metodo_pago', 'producto'), name='resumen_diario_unico')],
+            },
+        ),
+        migrations.RunPython(generar_resumen_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-17 23:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_trabajoexportacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacionProductos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.FileField(upload_to='importaciones/')),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'En curso'), ('LISTO', 'Listo'), ('ERROR', 'Error')], default='PENDIENTE', max_length=10)),
+                ('filas_totales', models.IntegerField(default=0)),
+                ('filas_procesadas', models.IntegerField(default=0)),
+                ('nuevos', models.IntegerField(default=0)),
+                ('actualizados', models.IntegerField(default=0)),
+                ('con_error', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Importación de productos',
+                'verbose_name_plural': 'Importaciones de productos',
+            },
+        ),
+        migrations.CreateModel(
+            name='FilaConError',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fila', models.IntegerField(help_text='Número de fila en el archivo (la 1 es el encabezado)')),
+                ('codigo', models.CharField(blank=True, max_length=100)),
+                ('mensaje', models.CharField(max_length=200)),
+                ('importacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='errores', to='gestion.importacionproductos')),
+            ],
+            options={
+                'ordering': ['fila'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_importacionproductos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importacionproductos',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'En curso'), ('LISTO', 'Listo'), ('ERROR', 'Error'), ('PREVIA', 'Esperando confirmación')], default='PENDIENTE', max_length=10),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-17 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0013_importacion_previa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='bajo_minimo',
+            field=models.GeneratedField(db_persist=True, expression=models.ExpressionWrapper(models.Q(('stock_actual__lte', models.F('stock_minimo'))), output_field=models.BooleanField()), output_field=models.BooleanField(), verbose_name='Bajo el mínimo'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True), ('bajo_minimo', True)), fields=['stock_actual', 'id'], name='producto_faltantes'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-18 00:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def cerrar_cajas_abiertas_de_mas(apps, schema_editor):
+    # El cobro siempre usó la última caja abierta: las anteriores que hayan quedado
+    # abiertas se cierran para poder crear el índice único de caja abierta.
+    SesionCaja = apps.get_model('gestion', 'SesionCaja')
+    abiertas = SesionCaja.objects.filter(estado=True).order_by('-id').values_list('id', flat=True)
+    SesionCaja.objects.filter(id__in=list(abiertas[1:])).update(estado=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0015_venta_fecha_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(cerrar_cajas_abiertas_de_mas, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='movimientocaja',
+            index=models.Index(fields=['sesion', 'tipo'], name='movimiento_sesion_tipo'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['nombre', 'id'], name='producto_catalogo'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['categoria', 'nombre', 'id'], name='producto_catalogo_categoria'),
+        ),
+        migrations.AddIndex(
+            model_name='sesioncaja',
+            index=models.Index(fields=['fecha_apertura'], name='sesioncaja_apertura'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['sesion', 'metodo_pago', 'anulada', 'total'], name='venta_sesion_metodo'),
+        ),
+        migrations.AddConstraint(
+            model_name='sesioncaja',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', True)), fields=('estado',), name='una_sola_caja_abierta'),
+        ),
+    ]
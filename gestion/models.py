@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -40,6 +41,28 @@ class Producto(models.Model):
     
     activo = models.BooleanField(default=True)
     imagen = models.ImageField(upload_to='productos/', blank=True, null=True) 
+    # Última modificación (el cobro la pone también al descontar stock con update()).
+    # Sirve para saber si una exportación ya generada sigue vigente.
+    actualizado = models.DateTimeField(auto_now=True)
+    # Lo mantiene la base (columna generada): queda al día en cualquier escritura,
+    # también en los update() del cobro, la anulación, la importación y el admin.
+    bajo_minimo = models.GeneratedField(
+        expression=ExpressionWrapper(Q(stock_actual__lte=F('stock_minimo')), output_field=models.BooleanField()),
+        output_field=models.BooleanField(),
+        db_persist=True,
+        verbose_name="Bajo el mínimo",
+    )
+
+    class Meta:
+        indexes = [
+            # Índice parcial: solo entran los activos bajo el mínimo (los pocos que mira el reporte de faltantes)
+            models.Index(fields=['stock_actual', 'id'], condition=Q(activo=True, bajo_minimo=True),
+                         name='producto_faltantes'),
+            # Catálogo de la pantalla de ventas: solo activos, ordenados por (nombre, id), con o sin categoría
+            models.Index(fields=['nombre', 'id'], condition=Q(activo=True), name='producto_catalogo'),
+            models.Index(fields=['categoria', 'nombre', 'id'], condition=Q(activo=True),
+                         name='producto_catalogo_categoria'),
+        ]
 
     def esta_en_alerta(self):
         """Devuelve True si el stock actual es menor o igual al mínimo."""
@@ -72,6 +95,40 @@ class SesionCaja(models.Model):
     justificacion = models.TextField(blank=True, null=True, verbose_name="Notas de Auditoría (Dueña)", help_text="Usar para explicar faltantes o sobrantes.")
 
     estado = models.BooleanField(default=True, help_text="True si está abierta")
+
+    # --- TOTALES ACUMULADOS ---
+    # Se actualizan con F() al cobrar, anular y registrar movimientos, así el cierre
+    # no tiene que recorrer todas las ventas. Se verifican con: manage.py verificar_totales_caja
+    ventas_efectivo = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    ventas_mercadopago = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    ventas_debito = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    ventas_credito = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    ventas_vales = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    total_ingresos = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    total_egresos = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+
+    # Método de pago de la venta -> columna acumulada
+    CAMPO_TOTAL_POR_METODO = {
+        'EFECTIVO': 'ventas_efectivo',
+        'MERCADOPAGO': 'ventas_mercadopago',
+        'DEBITO': 'ventas_debito',
+        'CREDITO': 'ventas_credito',
+        'VALE': 'ventas_vales',
+    }
+    CAMPO_TOTAL_POR_TIPO_MOVIMIENTO = {
+        'INGRESO': 'total_ingresos',
+        'EGRESO': 'total_egresos',
+    }
+
+    class Meta:
+        constraints = [
+            # Índice único parcial: como mucho una caja abierta, y buscarla es un salto en un índice de una fila
+            models.UniqueConstraint(fields=['estado'], condition=Q(estado=True), name='una_sola_caja_abierta'),
+        ]
+        indexes = [
+            # Los gastos del reporte se filtran por la fecha de apertura de la caja
+            models.Index(fields=['fecha_apertura'], name='sesioncaja_apertura'),
+        ]
     
     def __str__(self):
         fecha_local = timezone.localtime(self.fecha_apertura)
@@ -98,6 +155,15 @@ class Venta(models.Model):
     # --- ESTO ES LO NUEVO ---
     anulada = models.BooleanField(default=False) 
 
+    class Meta:
+        indexes = [
+            # Historial paginado por clave (fecha, id): ver historial.pagina_ventas
+            models.Index(fields=['fecha', 'id'], name='venta_fecha_id'),
+            # Totales de una caja por método de pago (totales_recalculados, verificar_totales_caja):
+            # con anulada y total adentro el índice alcanza solo, sin leer la tabla
+            models.Index(fields=['sesion', 'metodo_pago', 'anulada', 'total'], name='venta_sesion_metodo'),
+        ]
+
     def __str__(self):
         # Actualizamos para que el administrador vea si está anulada
         estado = " (ANULADA)" if self.anulada else ""
@@ -112,6 +178,9 @@ class DetalleVenta(models.Model):
     cantidad = models.DecimalField(max_digits=10, decimal_places=3, default=1)
     
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2, help_text="Precio al momento de la venta")
+    # Foto del costo al vender: los reportes de ganancia no dependen del precio_costo actual
+    # (ni necesitan unir con Producto). Las ventas viejas se completan con: manage.py completar_costos_detalle
+    costo_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Costo al momento de la venta")
     subtotal = models.DecimalField(max_digits=12, decimal_places=2)
 
     def save(self, *args, **kwargs):
@@ -142,5 +211,124 @@ class MovimientoCaja(models.Model):
     monto = models.DecimalField(max_digits=12, decimal_places=2)
     descripcion = models.CharField(max_length=200)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sesion', 'tipo'], name='movimiento_sesion_tipo'),
+        ]
+
     def __str__(self):
-        return f"{self.get_tipo_display()} - {self.get_categoria_display()}: ${self.monto}"
\ No newline at end of file
+        return f"{self.get_tipo_display()} - {self.get_categoria_display()}: ${self.monto}"
+# 8. RESUMEN DIARIO (tabla precalculada para los reportes)
+class ResumenDiario(models.Model):
+    """
+    Un renglón por (día, método de pago, producto) con lo vendido ese día, sin
+    contar ventas anuladas. Se actualiza al cobrar y al anular (reportes.sumar_al_resumen_diario)
+    y se reconstruye con: manage.py reconstruir_resumen_diario
+    """
+    fecha = models.DateField()
+    metodo_pago = models.CharField(max_length=20, choices=Venta.METODOS_PAGO)
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
+    # Categoría del producto al momento de la venta (no forma parte de la clave)
+    categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True)
+
+    cantidad = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    costo = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tickets = models.IntegerField(default=0, help_text="Ventas que incluyeron el producto")
+
+    class Meta:
+        verbose_name = "Resumen diario"
+        verbose_name_plural = "Resúmenes diarios"
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'metodo_pago', 'producto'], name='resumen_diario_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.metodo_pago} - {self.producto_id}: ${self.ingresos}"
+
+# 9. EXPORTACIONES (se generan en segundo plano, ver trabajos.py)
+class TrabajoExportacion(models.Model):
+    TIPOS = [
+        ('VENTAS', 'Ventas'),
+        ('PRODUCTOS', 'Lista de precios y stock'),
+    ]
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_CURSO', 'En curso'),
+        ('LISTO', 'Listo'),
+        ('ERROR', 'Error'),
+    ]
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    parametros = models.JSONField(default=dict)
+    # Tipo + parámetros + estado de los datos: si nada cambió, se reusa el archivo
+    clave = models.CharField(max_length=64, db_index=True)
+
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='PENDIENTE')
+    filas_totales = models.IntegerField(default=0)
+    filas_hechas = models.IntegerField(default=0)
+    archivo = models.FileField(upload_to='exportaciones/', blank=True)
+    error = models.TextField(blank=True)
+
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Exportación"
+        verbose_name_plural = "Exportaciones"
+
+    @property
+    def progreso(self):
+        if self.estado == 'LISTO':
+            return 100
+        # En productos también se cuentan las filas de totales por categoría
+        return min(100, int(self.filas_hechas * 100 / self.filas_totales)) if self.filas_totales else 0
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.id} ({self.get_estado_display()})"
+
+# 10. IMPORTACIONES DE PRODUCTOS (por lotes, se pueden retomar; ver importar.py)
+class ImportacionProductos(models.Model):
+    # PREVIA: se mostró la previsualización de cambios y falta que la confirmen
+    ESTADOS = TrabajoExportacion.ESTADOS + [('PREVIA', 'Esperando confirmación')]
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    archivo = models.FileField(upload_to='importaciones/')
+    nombre_archivo = models.CharField(max_length=255)
+
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='PENDIENTE')
+    filas_totales = models.IntegerField(default=0)
+    # Punto de control: filas del archivo ya guardadas. Si se corta, se retoma desde acá
+    filas_procesadas = models.IntegerField(default=0)
+    nuevos = models.IntegerField(default=0)
+    actualizados = models.IntegerField(default=0)
+    con_error = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Importación de productos"
+        verbose_name_plural = "Importaciones de productos"
+
+    @property
+    def progreso(self):
+        if self.estado == 'LISTO':
+            return 100
+        return min(100, int(self.filas_procesadas * 100 / self.filas_totales)) if self.filas_totales else 0
+
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.get_estado_display()})"
+
+
+class FilaConError(models.Model):
+    """Fila del archivo que no se importó, para el reporte de errores descargable."""
+    importacion = models.ForeignKey(ImportacionProductos, on_delete=models.CASCADE, related_name='errores')
+    fila = models.IntegerField(help_text="Número de fila en el archivo (la 1 es el encabezado)")
+    codigo = models.CharField(max_length=100, blank=True)
+    mensaje = models.CharField(max_length=200)
+
+    class Meta:
+        ordering = ['fila']
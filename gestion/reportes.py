@@ -0,0 +1,238 @@
+import datetime
+import time
+
+from django.apps import apps as apps_globales
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Sum, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .base_reportes import anotar_cambio, datos_completos_hasta
+from .models import MovimientoCaja, ResumenDiario, Venta
+
+
+def rango_del_mes(anio, mes):
+    """
+    Primer día del mes (inclusive) y primer día del mes siguiente (exclusivo).
+    Filtrar con fecha__gte/fecha__lt usa el índice de la columna directamente,
+    en vez de extraer mes y año fila por fila (fecha__month/fecha__year).
+    """
+    inicio = datetime.date(anio, mes, 1)
+    fin = datetime.date(anio + 1, 1, 1) if mes == 12 else datetime.date(anio, mes + 1, 1)
+    return inicio, fin
+
+
+def sumar_meses(fecha, meses):
+    """Corre una fecha `meses` meses (negativo = hacia atrás), sin pasarse del último día del mes."""
+    total = fecha.year * 12 + fecha.month - 1 + meses
+    anio, mes = divmod(total, 12)
+    siguiente = datetime.date(anio + 1, 1, 1) if mes == 11 else datetime.date(anio, mes + 2, 1)
+    return datetime.date(anio, mes + 1, min(fecha.day, (siguiente - datetime.timedelta(days=1)).day))
+
+
+def periodo_comparado(desde, hasta, modo):
+    """
+    Período contra el cual comparar [desde, hasta):
+      'anterior' = el período inmediatamente anterior (meses enteros si el rango
+                   son meses enteros, si no la misma cantidad de días).
+      'anio'     = las mismas fechas un año antes.
+    """
+    if modo == 'anio':
+        return sumar_meses(desde, -12), sumar_meses(hasta, -12)
+    if modo == 'anterior':
+        if desde.day == 1 and hasta.day == 1:
+            meses = (hasta.year - desde.year) * 12 + hasta.month - desde.month
+            return sumar_meses(desde, -meses), desde
+        return desde - (hasta - desde), desde
+    raise ValueError(f"Comparación desconocida: {modo}")
+
+
+def inicio_del_dia(fecha):
+    """Medianoche de la fecha en la hora local, como datetime con zona horaria."""
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+
+def calcular_reporte(desde, hasta):
+    """
+    Números del reporte entre las fechas desde (inclusive) y hasta (exclusiva),
+    leídos del resumen diario: unas decenas de renglones por mes en lugar de
+    todos los detalles de venta. Las ventas anuladas no cuentan.
+    """
+    resumen = ResumenDiario.objects.filter(fecha__gte=desde, fecha__lt=hasta)
+    totales = resumen.aggregate(ingresos=Sum('ingresos', default=0), costo=Sum('costo', default=0))
+
+    # Los tickets no se pueden sumar desde el resumen (un ticket aparece en un
+    # renglón por producto): los contamos por el índice de fecha de Venta
+    inicio, fin = inicio_del_dia(desde), inicio_del_dia(hasta)
+    cantidad_ventas = Venta.objects.filter(fecha__gte=inicio, fecha__lt=fin, anulada=False).count()
+
+    metodos = resumen.values('metodo_pago').annotate(total=Sum('ingresos')).order_by('metodo_pago')
+    top_productos = resumen.values('producto__nombre').annotate(
+        cantidad=Sum('cantidad')
+    ).order_by('-cantidad')[:5]
+
+    total_gastos = MovimientoCaja.objects.filter(
+        sesion__fecha_apertura__gte=inicio,
+        sesion__fecha_apertura__lt=fin,
+        tipo='EGRESO'
+    ).aggregate(total=Sum('monto', default=0))['total']
+
+    return {
+        'total_ventas': totales['ingresos'],
+        'costo_mercaderia': totales['costo'],
+        'total_gastos': total_gastos,
+        'cantidad_ventas': cantidad_ventas,
+        'metodos': [(m['metodo_pago'], m['total']) for m in metodos],
+        'top_productos': [(p['producto__nombre'], p['cantidad']) for p in top_productos],
+    }
+
+
+# --- CACHE DE PERÍODOS CERRADOS ---
+
+# Un período que terminó antes de hoy ya no recibe ventas nuevas: sus números solo
+# cambian si se anula una venta vieja (o se carga un gasto en una caja de otro día).
+# En esos casos subimos la versión y todos los reportes cacheados quedan viejos de
+# una sola vez, sin tener que saber qué rangos se habían pedido.
+# Sin CACHES compartido cada proceso tiene su propio LocMem y la versión solo sube en
+# el proceso que anuló: versión y reportes vencen a los SEGUNDOS_CACHE_REPORTES para
+# que el resto no muestre números viejos más que eso.
+CLAVE_VERSION_REPORTES = 'gestion:reportes:version'
+SEGUNDOS_CACHE_REPORTES = 60 * 10
+
+
+def version_reportes():
+    # Arranca en el reloj y no en 1: una versión nueva (cache vacío o vencido) nunca
+    # coincide con la de reportes que hayan quedado guardados
+    return cache.get_or_set(CLAVE_VERSION_REPORTES, time.time_ns, SEGUNDOS_CACHE_REPORTES)
+
+
+def reporte_del_periodo(desde, hasta):
+    """calcular_reporte() con cache para los períodos cerrados (hasta <= hoy)."""
+    if hasta > timezone.localdate():
+        return calcular_reporte(desde, hasta)
+
+    version = version_reportes()
+    clave = f'gestion:reporte:{version}:{desde.isoformat()}:{hasta.isoformat()}'
+    reporte = cache.get(clave)
+    if reporte is None:
+        reporte = calcular_reporte(desde, hasta)
+        # Leído de una copia de reportes anterior al cierre (o a una anulación): sirve, pero no se guarda
+        if datos_completos_hasta(inicio_del_dia(hasta)):
+            cache.set(clave, reporte, SEGUNDOS_CACHE_REPORTES)
+    return reporte
+
+
+def olvidar_reportes(fecha=None):
+    """
+    Invalida los reportes cacheados cuando cambia algo del día `fecha`.
+    Los cambios de hoy no tocan ningún período cerrado, así que no invalidan nada.
+    """
+    if fecha is not None and fecha >= timezone.localdate():
+        return
+    # La copia de reportes todavía tiene los números de antes: hasta que se rehaga no se cachea nada leído de ella
+    anotar_cambio()
+    try:
+        cache.incr(CLAVE_VERSION_REPORTES)
+    except ValueError:
+        pass  # Sin versión guardada no hay reportes cacheados
+
+
+# --- RESUMEN DIARIO ---
+
+def sumar_al_resumen_diario(fecha, metodo_pago, renglones, signo=1):
+    """
+    Suma (signo=1, al cobrar) o resta (signo=-1, al anular) una venta al resumen
+    diario con DOS consultas, tenga los productos que tenga:
+      1. bulk_create ignorando conflictos, para que existan los renglones del día.
+      2. Un UPDATE con F() + Case/When que incrementa cada renglón.
+
+    renglones: [(producto_id, categoria_id, cantidad, subtotal, costo)], un producto por renglón.
+    """
+    # Si el mismo producto viene repetido (ventas viejas), lo juntamos en un renglón
+    agrupados = {}
+    for producto_id, categoria_id, cantidad, subtotal, costo in renglones:
+        if producto_id in agrupados:
+            _, _, cantidad_previa, subtotal_previo, costo_previo = agrupados[producto_id]
+            cantidad, subtotal, costo = cantidad + cantidad_previa, subtotal + subtotal_previo, costo + costo_previo
+        agrupados[producto_id] = (producto_id, categoria_id, cantidad, subtotal, costo)
+    renglones = list(agrupados.values())
+    if not renglones:
+        return
+
+    ResumenDiario.objects.bulk_create([
+        ResumenDiario(fecha=fecha, metodo_pago=metodo_pago, producto_id=producto_id, categoria_id=categoria_id)
+        for producto_id, categoria_id, *_ in renglones
+    ], ignore_conflicts=True)
+
+    def incremento(campo, posicion):
+        return Case(
+            *[When(producto_id=renglon[0], then=F(campo) + signo * renglon[posicion]) for renglon in renglones],
+            output_field=DecimalField(),
+        )
+
+    ResumenDiario.objects.filter(
+        fecha=fecha, metodo_pago=metodo_pago, producto_id__in=[renglon[0] for renglon in renglones]
+    ).update(
+        cantidad=incremento('cantidad', 2),
+        ingresos=incremento('ingresos', 3),
+        costo=incremento('costo', 4),
+        tickets=F('tickets') + signo,
+    )
+
+
+def reconstruir_resumen_diario(desde=None, hasta=None, apps=None, lote=2000):
+    """
+    Borra y vuelve a calcular el resumen diario entre las fechas desde y hasta
+    (inclusive; None = sin límite) a partir de DetalleVenta, en una transacción.
+    `apps` permite usarla desde una migración con los modelos históricos.
+    Devuelve la cantidad de renglones generados.
+    """
+    apps = apps or apps_globales
+    DetalleVenta = apps.get_model('gestion', 'DetalleVenta')
+    Resumen = apps.get_model('gestion', 'ResumenDiario')
+
+    resumenes = Resumen.objects.all()
+    detalles = DetalleVenta.objects.filter(venta__anulada=False)
+    if desde:
+        resumenes = resumenes.filter(fecha__gte=desde)
+        detalles = detalles.filter(venta__fecha__gte=inicio_del_dia(desde))
+    if hasta:
+        resumenes = resumenes.filter(fecha__lte=hasta)
+        detalles = detalles.filter(venta__fecha__lt=inicio_del_dia(hasta + datetime.timedelta(days=1)))
+
+    filas = detalles.annotate(
+        dia=TruncDate('venta__fecha', tzinfo=timezone.get_current_timezone()),
+    ).values(
+        'dia', 'venta__metodo_pago', 'producto_id', 'producto__categoria_id',
+    ).annotate(
+        total_cantidad=Sum('cantidad'),
+        total_ingresos=Sum('subtotal'),
+        # Las ventas viejas sin costo guardado usan el costo actual del producto
+        total_costo=Sum(F('cantidad') * Coalesce('costo_unitario', 'producto__precio_costo')),
+        total_tickets=Count('venta_id', distinct=True),
+    ).order_by()
+
+    generados = 0
+    with transaction.atomic():
+        resumenes.delete()
+        pendientes = []
+        for fila in filas.iterator(chunk_size=lote):
+            pendientes.append(Resumen(
+                fecha=fila['dia'],
+                metodo_pago=fila['venta__metodo_pago'],
+                producto_id=fila['producto_id'],
+                categoria_id=fila['producto__categoria_id'],
+                cantidad=fila['total_cantidad'],
+                ingresos=fila['total_ingresos'],
+                costo=fila['total_costo'] or 0,
+                tickets=fila['total_tickets'],
+            ))
+            if len(pendientes) >= lote:
+                Resumen.objects.bulk_create(pendientes)
+                generados += len(pendientes)
+                pendientes = []
+        Resumen.objects.bulk_create(pendientes)
+        generados += len(pendientes)
+    transaction.on_commit(olvidar_reportes)
+    return generados
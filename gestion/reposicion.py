@@ -0,0 +1,78 @@
+"""
+Cantidades sugeridas para reponer, a partir de lo que se viene vendiendo.
+
+La velocidad de venta de cada producto sale del resumen diario de los últimos
+DIAS_DE_VENTAS días cerrados (hoy no cuenta) y queda en el cache como los
+reportes (ver reportes.SEGUNDOS_CACHE_REPORTES). Con eso y el stock actual se calcula, para una página del
+reporte de faltantes, cuántos días de stock quedan y cuánto pedir para cubrir
+DIAS_DE_COBERTURA días.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .base_reportes import datos_completos_hasta
+from .models import ResumenDiario
+from .reportes import SEGUNDOS_CACHE_REPORTES, inicio_del_dia, version_reportes
+
+DIAS_DE_VENTAS = 28
+DIAS_DE_COBERTURA = 14
+
+
+def ventas_diarias(dias=DIAS_DE_VENTAS):
+    """
+    {producto_id: unidades (o kilos) vendidas por día} en los últimos `dias` días
+    cerrados. Solo aparecen los productos que se vendieron.
+    La clave del cache lleva la fecha y la versión de los reportes: cambia al día
+    siguiente o si se anula una venta de un día pasado (ver reportes.olvidar_reportes).
+    """
+    hoy = timezone.localdate()
+    version = version_reportes()
+    clave = f'gestion:reposicion:{version}:{hoy.isoformat()}:{dias}'
+    ventas = cache.get(clave)
+    if ventas is None:
+        vendido = ResumenDiario.objects.filter(
+            fecha__gte=hoy - datetime.timedelta(days=dias), fecha__lt=hoy,
+        ).values('producto_id').annotate(cantidad=Sum('cantidad')).values_list('producto_id', 'cantidad')
+        por_producto = pd.Series(dict(vendido), dtype=float)
+        ventas = (por_producto / dias).round(3).to_dict()
+        if datos_completos_hasta(inicio_del_dia(hoy)):
+            cache.set(clave, ventas, SEGUNDOS_CACHE_REPORTES)
+    return ventas
+
+
+def sugerir(productos, cobertura=DIAS_DE_COBERTURA, dias=DIAS_DE_VENTAS):
+    """
+    Para cada producto (con id, stock_actual, stock_minimo y tipo_venta) calcula,
+    en columnas y sin recorrer filas:
+      venta_diaria  - promedio vendido por día
+      dias_de_stock - días que alcanza el stock actual (None si no se vende)
+      sugerido      - lo que hay que pedir para cubrir `cobertura` días, y como
+                      mínimo para volver al stock mínimo. Entero salvo los que se
+                      venden por peso (redondeado hacia arriba a 100 g).
+    Devuelve {producto_id: {'venta_diaria', 'dias_de_stock', 'sugerido'}}.
+    """
+    if not productos:
+        return {}
+    tabla = pd.DataFrame({
+        'id': [p.id for p in productos],
+        'stock': [float(p.stock_actual) for p in productos],
+        'minimo': [p.stock_minimo for p in productos],
+        'por_peso': [p.tipo_venta == 'PESO' for p in productos],
+    })
+    tabla['venta_diaria'] = tabla['id'].map(ventas_diarias(dias)).fillna(0.0)
+
+    stock = tabla['stock'].clip(lower=0)
+    se_vende = tabla['venta_diaria'] > 0
+    tabla['dias_de_stock'] = np.where(se_vende, stock / tabla['venta_diaria'].where(se_vende, 1), np.nan)
+
+    faltante = np.maximum(tabla['venta_diaria'] * cobertura, tabla['minimo']) - stock
+    faltante = faltante.clip(lower=0)
+    tabla['sugerido'] = np.where(tabla['por_peso'], np.ceil(faltante * 10 - 1e-9) / 10, np.ceil(faltante - 1e-9))
+
+    tabla['dias_de_stock'] = tabla['dias_de_stock'].round(1).astype(object).where(se_vende, None)
+    return tabla.set_index('id')[['venta_diaria', 'dias_de_stock', 'sugerido']].to_dict('index')
@@ -0,0 +1,36 @@
+from django.conf import settings
+
+from .base_reportes import alias_de_reportes, en_reportes
+
+# Modelos que leen los reportes. Los trabajos (TrabajoExportacion, ImportacionProductos)
+# siguen en la base principal: se crean y se actualizan mientras el reporte corre.
+MODELOS_DE_REPORTES = {
+    'categoria', 'producto', 'sesioncaja', 'venta', 'detalleventa', 'movimientocaja', 'resumendiario',
+}
+
+
+class RouterReportes:
+    """Manda a la base de reportes las lecturas hechas dentro de base_reportes.base_de_reportes()."""
+
+    def db_for_read(self, model, **hints):
+        if not en_reportes.get():
+            return None
+        if model._meta.app_label == 'gestion' and model._meta.model_name in MODELOS_DE_REPORTES:
+            return alias_de_reportes()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Un objeto leído de la copia es el mismo registro que en la principal
+        bases = {'default', getattr(settings, 'KIOSCO_BASE_REPORTES', None)}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La copia trae el esquema de la principal: nunca se migra por separado
+        if db == getattr(settings, 'KIOSCO_BASE_REPORTES', None):
+            return False
+        return None
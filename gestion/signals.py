@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalogo import olvidar_categorias, olvidar_productos, subir_version_catalogo
+from .models import Categoria, Producto
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_cache_codigos(sender, instance, **kwargs):
+    # Por id (por si cambió el código) y por código (por si estaba cacheado con otro id)
+    olvidar_productos(producto_ids=[instance.pk], codigos=[instance.codigo])
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_version_catalogo(sender, **kwargs):
+    # Después del commit: antes, otro pedido podría guardar datos viejos con la versión nueva
+    transaction.on_commit(subir_version_catalogo)
+    if sender is Categoria:
+        transaction.on_commit(olvidar_categorias)
@@ -1,3 +1,1137 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+
+from .base_reportes import alias_de_reportes, base_de_reportes, datos_completos_hasta, en_reportes, refrescar_copia
+from .caja import calcular_resumen
+from .catalogo import buscar_por_codigo, digito_verificador_ean13, olvidar_todos_los_codigos, version_catalogo
+from .cobro import ErrorVenta, cobrar, registrar_venta
+from .exportar import filas_de_productos, filas_de_ventas
+from .historial import pagina_ventas
+from .importar import FILAS_POR_LOTE, ejecutar_importacion
+from .models import (
+    Categoria, DetalleVenta, ImportacionProductos, MovimientoCaja, Producto, ResumenDiario, SesionCaja,
+    TrabajoExportacion, Venta,
+)
+from .reposicion import sugerir, ventas_diarias
+from .reportes import inicio_del_dia, periodo_comparado, reporte_del_periodo, sumar_meses
+from .tickets import CORTE, INICIAR, escpos_de_la_caja, ticket_de_la_venta
+
+
+def importar_csv(usuario, contenido, lote=FILAS_POR_LOTE):
+    """Importa el CSV igual que la pantalla (ejecutar_importacion), con el archivo en una carpeta que se borra."""
+    media = tempfile.mkdtemp(prefix='kiosco_test_')
+    try:
+        with override_settings(MEDIA_ROOT=media):
+            importacion = ImportacionProductos.objects.create(
+                usuario=usuario, nombre_archivo='lista.csv',
+                archivo=SimpleUploadedFile('lista.csv', contenido.encode()),
+            )
+            ejecutar_importacion(importacion.id, lote=lote)
+    finally:
+        shutil.rmtree(media, ignore_errors=True)
+    importacion.refresh_from_db()
+    return importacion
+
+
+class CobroTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cajera', password='clave')
+        cls.sesion = SesionCaja.objects.create(usuario=cls.usuario, saldo_inicial=0)
+        categoria = Categoria.objects.create(nombre='Golosinas')
+        cls.productos = Producto.objects.bulk_create([
+            Producto(codigo=f'779{i:04d}', nombre=f'Producto {i}', categoria=categoria,
+                     precio_costo=50, precio_venta=100, stock_actual=10)
+            for i in range(30)
+        ])
+
+    def carrito(self, cantidad_items):
+        return [{'id': p.id, 'cantidad': 2} for p in self.productos[:cantidad_items]]
+
+    def contar_consultas(self, items):
+        with CaptureQueriesContext(connection) as consultas:
+            with transaction.atomic():
+                registrar_venta(self.sesion.id, self.usuario, items, 'EFECTIVO')
+        return len(consultas)
+
+    def test_cantidad_de_consultas_no_crece_con_el_carrito(self):
+        # Savepoint + SELECT FOR UPDATE + INSERT venta + bulk INSERT detalles + UPDATE stock
+        # + INSERT/UPDATE resumen diario + UPDATE totales de caja + release
+        with self.assertNumQueries(9):
+            with transaction.atomic():
+                registrar_venta(self.sesion.id, self.usuario, self.carrito(30), 'EFECTIVO')
+        self.assertEqual(self.contar_consultas(self.carrito(1)), self.contar_consultas(self.carrito(15)))
+
+    @skipUnless(connection.vendor == 'sqlite', "Perfil de SQLite")
+    def test_perfil_sqlite_de_produccion(self):
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+    def test_registra_detalles_total_y_stock(self):
+        items = self.carrito(3) + [{'id': self.productos[0].id, 'cantidad': '0.5'}]
+        with transaction.atomic():
+            venta = registrar_venta(self.sesion.id, self.usuario, items, 'DEBITO')
+
+        self.assertEqual(venta.total, Decimal('650'))
+        self.assertEqual(venta.detalles.count(), 3)
+        detalle = DetalleVenta.objects.get(venta=venta, producto=self.productos[0])
+        self.assertEqual(detalle.cantidad, Decimal('2.5'))
+        self.assertEqual(detalle.subtotal, Decimal('250'))
+        self.productos[0].refresh_from_db()
+        self.assertEqual(self.productos[0].stock_actual, Decimal('7.5'))
+
+    def test_stock_insuficiente_no_guarda_nada(self):
+        items = [{'id': self.productos[0].id, 'cantidad': 1}, {'id': self.productos[1].id, 'cantidad': 11}]
+        with self.assertRaises(ErrorVenta):
+            with transaction.atomic():
+                registrar_venta(self.sesion.id, self.usuario, items, 'EFECTIVO')
+
+        self.assertFalse(Venta.objects.exists())
+        self.productos[0].refresh_from_db()
+        self.assertEqual(self.productos[0].stock_actual, 10)
+
+    def test_cobrar_no_usa_una_caja_cerrada_cacheada(self):
+        cache.clear()
+        venta = cobrar(self.usuario, self.carrito(1), 'EFECTIVO')
+        self.assertEqual(venta.sesion_id, self.sesion.id)
+
+        # Se cierra la caja sin avisarle al cache: el cobro igual tiene que darse cuenta
+        SesionCaja.objects.filter(pk=self.sesion.pk).update(estado=False)
+        with self.assertRaisesMessage(ErrorVenta, 'No hay caja abierta'):
+            cobrar(self.usuario, self.carrito(1), 'EFECTIVO')
+
+    def test_vista_procesar_venta(self):
+        self.client.force_login(self.usuario)
+        respuesta = self.client.post('/cobrar/', json.dumps({'items': self.carrito(2), 'metodo_pago': 'EFECTIVO'}),
+                                     content_type='application/json')
+        datos = respuesta.json()
+        self.assertEqual(datos['status'], 'success')
+        self.assertEqual(Venta.objects.get(id=datos['venta_id']).total, Decimal('400'))
+
+
+class CatalogoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cajera', password='clave')
+        cls.bebidas = Categoria.objects.create(nombre='Bebidas')
+        Producto.objects.bulk_create(
+            [Producto(codigo=f'B{i}', nombre=f'Agua {i % 3}', categoria=cls.bebidas, precio_venta=10) for i in range(7)]
+            + [Producto(codigo=f'S{i}', nombre=f'Suelto {i}', precio_venta=10) for i in range(3)]
+            + [Producto(codigo='INACTIVO', nombre='Agua vieja', activo=False)]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def recorrer(self, **filtros):
+        vistos, cursor = [], None
+        while True:
+            params = dict(filtros, limite=3, **({'cursor': cursor} if cursor else {}))
+            datos = self.client.get('/api/productos/', params).json()
+            vistos += [(p['nombre'], p['id']) for p in datos['productos']]
+            cursor = datos['siguiente']
+            if not cursor:
+                return vistos
+
+    def test_paginacion_por_cursor_recorre_todo_sin_repetir(self):
+        vistos = self.recorrer()
+        self.assertEqual(len(vistos), 10)
+        self.assertEqual(vistos, sorted(vistos))
+
+    def test_filtros_de_categoria_y_texto(self):
+        self.assertEqual(len(self.recorrer(categoria=self.bebidas.id)), 7)
+        self.assertEqual(len(self.recorrer(categoria='SIN_CAT')), 3)
+        self.assertEqual(len(self.recorrer(texto='agua 1')), 2)
+        self.assertEqual(len(self.recorrer(texto='S2')), 1)
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get('/api/productos/', {'cursor': 'basura'}).status_code, 400)
+
+    def test_la_pantalla_de_ventas_no_renderiza_el_catalogo(self):
+        respuesta = self.client.get('/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotContains(respuesta, 'Suelto 1')
+
+    def test_catalogo_con_etag(self):
+        respuesta = self.client.get('/api/productos/')
+        etag = respuesta['ETag']
+        self.assertEqual(len(respuesta.json()['productos']), 10)
+
+        # Sin cambios: 304 y solo las consultas del login (sesión + usuario)
+        with self.assertNumQueries(2):
+            respuesta = self.client.get('/api/productos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.get(codigo='S0').save()
+        respuesta = self.client.get('/api/productos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_la_version_sube_con_cada_cambio_del_catalogo(self):
+        def version_cambia(cambio):
+            antes = version_catalogo()
+            with self.captureOnCommitCallbacks(execute=True):
+                cambio()
+            return version_catalogo() != antes
+
+        self.assertTrue(version_cambia(lambda: Categoria.objects.create(nombre='Almacén')))
+        self.assertTrue(version_cambia(lambda: Categoria.objects.get(nombre='Almacén').delete()))
+        self.assertTrue(version_cambia(lambda: Producto.objects.create(codigo='N1', nombre='Nuevo')))
+        self.assertTrue(version_cambia(
+            lambda: importar_csv(self.usuario, 'codigo,nombre,venta,costo,stock\nB1,Agua 1,12,6,5')))
+        SesionCaja.objects.create(usuario=self.usuario, saldo_inicial=0)
+        producto = Producto.objects.get(codigo='B1')
+        self.assertTrue(version_cambia(lambda: cobrar(self.usuario, [{'id': producto.id, 'cantidad': 1}], 'EFECTIVO')))
+        self.assertFalse(version_cambia(lambda: self.client.get('/api/productos/')))
+
+    def test_pantalla_de_ventas_desde_el_cache(self):
+        SesionCaja.objects.create(usuario=self.usuario, saldo_inicial=0)
+        self.client.get('/')
+        # Sesión + usuario: la caja abierta y las categorías salen del cache
+        with self.assertNumQueries(2):
+            respuesta = self.client.get('/')
+        self.assertTrue(respuesta.context['caja_abierta'])
+        self.assertContains(respuesta, 'Bebidas')
+
+        # Cobrar no vuelve a pedir las categorías; cambiar una sí
+        producto = Producto.objects.get(codigo='B1')
+        producto.stock_actual = 10
+        producto.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            cobrar(self.usuario, [{'id': producto.id, 'cantidad': 1}], 'EFECTIVO')
+        with self.assertNumQueries(2):
+            self.client.get('/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Categoria.objects.create(nombre='Almacén')
+        self.assertContains(self.client.get('/'), 'Almacén')
+
+
+class FaltantesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.duena = User.objects.create_user('duena', password='clave', is_staff=True)
+        SesionCaja.objects.create(usuario=cls.duena, saldo_inicial=0)
+        cls.bebidas = Categoria.objects.create(nombre='Bebidas')
+        cls.agua = Producto.objects.create(codigo='1', nombre='Agua', categoria=cls.bebidas, precio_venta=10,
+                                           stock_actual=6, stock_minimo=5)
+        Producto.objects.bulk_create(
+            [Producto(codigo=f'B{i}', nombre=f'Soda {i}', categoria=cls.bebidas, stock_actual=i) for i in range(4)]
+            + [Producto(codigo=f'S{i}', nombre=f'Suelto {i}', stock_actual=0) for i in range(3)]
+            + [Producto(codigo='LLENO', nombre='Lleno', stock_actual=50),
+               Producto(codigo='INACTIVO', nombre='Inactivo', stock_actual=0, activo=False)]
+        )
+
+    def setUp(self):
+        cache.clear()  # La venta diaria queda cacheada por día
+        self.client.force_login(self.duena)
+
+    def bajo_minimo(self, producto):
+        return Producto.objects.values_list('bajo_minimo', flat=True).get(pk=producto.pk)
+
+    def test_la_marca_sigue_al_stock_en_cobro_anulacion_e_importacion(self):
+        self.assertFalse(self.bajo_minimo(self.agua))
+        venta = cobrar(self.duena, [{'id': self.agua.id, 'cantidad': 1}], 'EFECTIVO')
+        self.assertTrue(self.bajo_minimo(self.agua))
+
+        self.client.post(f'/anular/{venta.id}/')
+        self.assertFalse(self.bajo_minimo(self.agua))
+
+        importar_csv(self.duena, 'codigo,nombre,venta,stock\n1,Agua,10,2')
+        self.assertTrue(self.bajo_minimo(self.agua))
+
+    def test_reporte_paginado_y_por_categoria(self):
+        respuesta = self.client.get('/reporte-faltantes/')
+        self.assertEqual(respuesta.context['pagina'].paginator.count, 7)
+        self.assertNotIn('Lleno', [p.nombre for p in respuesta.context['productos']])
+        self.assertNotIn('Inactivo', [p.nombre for p in respuesta.context['productos']])
+
+        respuesta = self.client.get('/reporte-faltantes/', {'categoria': self.bebidas.id})
+        self.assertEqual([p.stock_actual for p in respuesta.context['productos']], [0, 1, 2, 3])
+        respuesta = self.client.get('/reporte-faltantes/', {'categoria': 'SIN_CAT'})
+        self.assertEqual(respuesta.context['pagina'].paginator.count, 3)
+
+        with mock.patch('gestion.views.FALTANTES_POR_PAGINA', 5):
+            segunda = self.client.get('/reporte-faltantes/', {'pagina': 2})
+        self.assertEqual(len(segunda.context['productos']), 2)
+        self.assertContains(segunda, 'Página 2 de 2')
+
+    def test_sugerido_segun_la_venta_diaria(self):
+        hoy = timezone.localdate()
+        soda = Producto.objects.get(codigo='B1')
+        fiambre = Producto.objects.create(codigo='F', nombre='Fiambre', tipo_venta='PESO', stock_actual='0.2',
+                                          stock_minimo=1)
+        ResumenDiario.objects.bulk_create([
+            # 28 unidades en 28 días = 1 por día; lo de hoy no cuenta
+            ResumenDiario(fecha=hoy - datetime.timedelta(days=d), metodo_pago='EFECTIVO', producto=soda, cantidad=2)
+            for d in range(1, 15)
+        ] + [
+            ResumenDiario(fecha=hoy, metodo_pago='EFECTIVO', producto=soda, cantidad=50),
+            ResumenDiario(fecha=hoy - datetime.timedelta(days=3), metodo_pago='EFECTIVO', producto=fiambre,
+                          cantidad='4.2'),
+        ])
+        productos = [soda, fiambre, Producto.objects.get(codigo='S0')]
+        sugerencias = sugerir(productos, cobertura=14)
+        self.assertEqual(sugerencias[soda.id], {'venta_diaria': 1.0, 'dias_de_stock': 1.0, 'sugerido': 13.0})
+        self.assertEqual(sugerencias[fiambre.id]['sugerido'], 1.9)  # 0.15 kg/día x 14 = 2.1 - 0.2
+        # Sin ventas: se sugiere volver al mínimo
+        self.assertEqual(sugerencias[productos[2].id], {'venta_diaria': 0.0, 'dias_de_stock': None, 'sugerido': 5.0})
+
+        # La velocidad de venta queda en el cache del día: no se vuelve a consultar
+        with self.assertNumQueries(0):
+            sugerir(productos, cobertura=30)
+            ventas_diarias()
+        Producto.objects.create(codigo='MAYORISTA', nombre='Pack mayorista', categoria=self.bebidas, stock_actual=0,
+                                stock_minimo=2000000)
+        respuesta = self.client.get('/reporte-faltantes/', {'categoria': self.bebidas.id, 'cobertura': 7})
+        self.assertContains(respuesta, 'value="6"')
+        # Sin notación exponencial ni separadores: el input numérico tiene que poder leerlo
+        self.assertContains(respuesta, 'value="2000000"')
+
+    def test_usa_el_indice_parcial(self):
+        consulta = Producto.objects.filter(activo=True, bajo_minimo=True).order_by('stock_actual', 'id')
+        self.assertIn('producto_faltantes', consulta.explain())
+
+
+class CodigoDeBarrasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cajera', password='clave')
+        cls.alfajor = Producto.objects.create(codigo='7790001', nombre='Alfajor', precio_venta=500, stock_actual=10)
+        cls.jamon = Producto.objects.create(codigo='123', nombre='Jamón', tipo_venta='PESO', precio_venta=8000,
+                                            stock_actual=5)
+
+    def setUp(self):
+        olvidar_todos_los_codigos()
+
+    def etiqueta(self, prefijo, plu, valor):
+        primeros = f'{prefijo}{plu:05d}{valor:05d}'
+        return primeros + str(digito_verificador_ean13(primeros))
+
+    def test_el_segundo_escaneo_no_consulta_la_base(self):
+        buscar_por_codigo('7790001')
+        with self.assertNumQueries(0):
+            producto, cantidad = buscar_por_codigo('7790001')
+        self.assertEqual(producto['nombre'], 'Alfajor')
+        self.assertIsNone(cantidad)
+
+    def test_guardar_el_producto_invalida_el_cache(self):
+        buscar_por_codigo('7790001')
+        self.alfajor.precio_venta = 600
+        self.alfajor.save()
+        self.assertEqual(buscar_por_codigo('7790001')[0]['precio_venta'], 600)
+
+    def test_cobrar_invalida_el_stock_cacheado(self):
+        SesionCaja.objects.create(usuario=self.usuario, saldo_inicial=0)
+        buscar_por_codigo('7790001')
+        with self.captureOnCommitCallbacks(execute=True):
+            cobrar(self.usuario, [{'id': self.alfajor.id, 'cantidad': 3}], 'EFECTIVO')
+        self.assertEqual(buscar_por_codigo('7790001')[0]['stock_actual'], 7)
+
+    def test_etiqueta_de_balanza_con_peso_y_con_precio(self):
+        producto, cantidad = buscar_por_codigo(self.etiqueta('20', 123, 350))
+        self.assertEqual(producto['id'], self.jamon.id)
+        self.assertEqual(cantidad, Decimal('0.350'))
+
+        producto, cantidad = buscar_por_codigo(self.etiqueta('21', 123, 2000))  # $2000 a $8000/kg
+        self.assertEqual(cantidad, Decimal('0.250'))
+
+    def test_etiqueta_invalida_o_de_producto_por_unidad(self):
+        etiqueta = self.etiqueta('20', 123, 350)
+        self.assertEqual(buscar_por_codigo(etiqueta[:-1] + str((int(etiqueta[-1]) + 1) % 10)), (None, None))
+        Producto.objects.create(codigo='77', nombre='Gaseosa', precio_venta=100)
+        self.assertEqual(buscar_por_codigo(self.etiqueta('20', 77, 350)), (None, None))
+
+    def test_vista_api_codigo(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get('/api/codigo/', {'codigo': '7790001'}).json()['producto']['id'], self.alfajor.id)
+        self.assertEqual(self.client.get('/api/codigo/', {'codigo': 'nada'}).status_code, 404)
+
+
+class HistorialVentasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.duena = User.objects.create_user('duena', password='clave', is_staff=True)
+        cls.cajera = User.objects.create_user('cajera', password='clave')
+        cls.sesion = SesionCaja.objects.create(usuario=cls.cajera, saldo_inicial=0)
+        cls.agua = Producto.objects.create(codigo='1', nombre='Agua', precio_venta=10, stock_actual=100)
+        ahora = timezone.now()
+        # Varias ventas en el mismo instante: el id desempata
+        ventas = Venta.objects.bulk_create([
+            Venta(sesion=cls.sesion, usuario=cls.cajera if i % 2 else cls.duena, total=10,
+                  fecha=ahora - datetime.timedelta(minutes=i // 3),
+                  metodo_pago='DEBITO' if i % 5 == 0 else 'EFECTIVO', anulada=i == 7)
+            for i in range(20)
+        ])
+        DetalleVenta.objects.bulk_create([
+            DetalleVenta(venta=v, producto=cls.agua, cantidad=1, precio_unitario=10, subtotal=10) for v in ventas
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.duena)
+
+    def recorrer(self, **filtros):
+        vistas, cursor = [], None
+        while True:
+            ventas, cursor = pagina_ventas(cursor=cursor, limite=3, **filtros)
+            vistas += [(v.fecha, v.id) for v in ventas]
+            if not cursor:
+                return vistas
+
+    def test_paginacion_por_clave_recorre_todo_sin_repetir(self):
+        vistas = self.recorrer()
+        self.assertEqual(len(vistas), 20)
+        self.assertEqual(vistas, sorted(vistas, reverse=True))
+
+    def test_filtros(self):
+        self.assertEqual(len(self.recorrer(usuario=self.cajera.id)), 10)
+        self.assertEqual(len(self.recorrer(metodo_pago='DEBITO')), 4)
+        self.assertEqual(len(self.recorrer(anulada=True)), 1)
+        self.assertEqual(len(self.recorrer(sesion=self.sesion.id, anulada=False)), 19)
+        ayer = timezone.localdate() - datetime.timedelta(days=1)
+        self.assertEqual(len(self.recorrer(hasta=ayer)), 0)
+        self.assertEqual(len(self.recorrer(desde=datetime.date.min, hasta=datetime.date.max)), 20)
+
+    def test_pagina_con_consultas_fijas(self):
+        # Sesión + usuario + página de ventas (con JOINs) + detalles con su producto + cajeros del filtro
+        with self.assertNumQueries(5):
+            respuesta = self.client.get('/historial/', {'usuario': self.cajera.id})
+        self.assertEqual(len(respuesta.context['ventas']), 10)
+        self.assertContains(respuesta, '1 x Agua')
+
+        primera = self.client.get('/historial/')
+        self.assertEqual(len(primera.context['ventas']), 20)
+        self.assertIsNone(primera.context['siguiente'])
+
+    def test_cursor_invalido(self):
+        respuesta = self.client.get('/historial/', {'cursor': 'basura'})
+        self.assertRedirects(respuesta, '/historial/', fetch_redirect_response=False)
+
+    def test_fechas_en_los_extremos_del_calendario(self):
+        respuesta = self.client.get('/historial/', {'desde': '0001-01-01', 'hasta': '9999-12-31'})
+        self.assertEqual(len(respuesta.context['ventas']), 20)
+
+    def test_ticket_sale_del_cache_hasta_que_se_anula(self):
+        venta = Venta.objects.filter(anulada=False).first()
+        # Sesión + usuario + estado de la venta + venta con caja y cajero + detalles con su producto
+        with self.assertNumQueries(5):
+            respuesta = self.client.get(f'/ticket/{venta.id}/')
+        self.assertContains(respuesta, 'x Agua')
+        self.assertNotContains(respuesta, 'ANULADA')
+        with self.assertNumQueries(3):
+            self.client.get(f'/ticket/{venta.id}/')
+
+        Venta.objects.filter(pk=venta.pk).update(anulada=True)
+        self.assertContains(self.client.get(f'/ticket/{venta.id}/'), 'VENTA ANULADA')
+        self.assertEqual(self.client.get('/ticket/999999/').status_code, 404)
+
+    def test_ticket_escpos(self):
+        venta = Venta.objects.filter(anulada=False).first()
+        respuesta = self.client.get(f'/ticket/{venta.id}/', {'formato': 'escpos'})
+        self.assertEqual(respuesta['Content-Type'], 'application/octet-stream')
+        datos = respuesta.content
+        self.assertTrue(datos.startswith(INICIAR))
+        self.assertTrue(datos.endswith(CORTE))
+        self.assertIn('DOÑA PEPITA'.encode('cp858'), datos)
+        renglones = datos.split(b'\n')
+        self.assertIn(b'1 x Agua' + b' ' * 18 + b'$10,00', renglones)
+        self.assertTrue(all(len(r) <= 32 for r in renglones if not r.startswith(b'\x1b')))
+
+    def test_tickets_de_la_caja_en_un_solo_chorro(self):
+        url = f'/caja/{self.sesion.id}/tickets/'
+        # Sesión + usuario + caja + ventas de la caja + un lote de ventas con detalles
+        with self.assertNumQueries(6):
+            datos = self.client.get(url).content
+        self.assertEqual(datos.count(CORTE), 20)
+        self.assertEqual(datos.count(b'*** VENTA ANULADA ***'), 1)
+        # Ya armados: solo se consulta qué ventas tiene la caja
+        with self.assertNumQueries(4):
+            self.assertEqual(self.client.get(url).content, datos)
+
+    def test_enviar_a_la_impresora(self):
+        recibido = []
+        with socket.create_server(('127.0.0.1', 0)) as servidor:
+            def impresora():
+                conexion, _ = servidor.accept()
+                with conexion:
+                    while parte := conexion.recv(4096):
+                        recibido.append(parte)
+            hilo = threading.Thread(target=impresora)
+            hilo.start()
+            host, puerto = servidor.getsockname()
+            with override_settings(KIOSCO_IMPRESORA=f'{host}:{puerto}'):
+                respuesta = self.client.post(f'/caja/{self.sesion.id}/tickets/')
+            hilo.join(5)
+        self.assertEqual(respuesta.json()['status'], 'success')
+        self.assertEqual(b''.join(recibido), escpos_de_la_caja(self.sesion.id))
+
+        directorio = tempfile.mkdtemp(prefix='kiosco_test_')
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        archivo = os.path.join(directorio, 'impresora.bin')
+        venta = Venta.objects.first()
+        with override_settings(KIOSCO_IMPRESORA=archivo):
+            self.client.post(f'/ticket/{venta.id}/?formato=escpos')
+        with open(archivo, 'rb') as impreso:
+            self.assertEqual(impreso.read(), ticket_de_la_venta(venta.id, 'escpos'))
+
+        respuesta = self.client.post(f'/ticket/{venta.id}/?formato=escpos')
+        self.assertEqual(respuesta.status_code, 503)
+
+    def test_usa_el_indice(self):
+        consulta = Venta.objects.order_by('-fecha', '-id')[:50]
+        self.assertIn('venta_fecha_id', consulta.explain())
+
+
+class CierreCajaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cajera', password='clave', is_staff=True)
+        cls.sesion = SesionCaja.objects.create(usuario=cls.usuario, saldo_inicial=1000)
+        for metodo, total, anulada in [('EFECTIVO', 300, False), ('EFECTIVO', 999, True), ('MERCADOPAGO', 200, False),
+                                       ('DEBITO', 100, False), ('CREDITO', 50, False), ('VALE', 25, False)]:
+            Venta.objects.create(sesion=cls.sesion, usuario=cls.usuario, total=total, metodo_pago=metodo, anulada=anulada)
+        MovimientoCaja.objects.create(sesion=cls.sesion, tipo='INGRESO', monto=70, descripcion='Cambio')
+        MovimientoCaja.objects.create(sesion=cls.sesion, tipo='EGRESO', monto=20, descripcion='Bolsitas')
+        # Las ventas se crearon a mano: reconstruimos los totales acumulados
+        call_command('verificar_totales_caja', '--reparar', stdout=StringIO())
+
+    def test_resumen_sin_consultas_y_sin_anuladas(self):
+        sesion = SesionCaja.objects.get(pk=self.sesion.pk)
+        with self.assertNumQueries(0):
+            resumen = calcular_resumen(sesion)
+        self.assertEqual(resumen.ventas_efectivo, 300)
+        self.assertEqual(resumen.ventas_debito, 300)
+        self.assertEqual(resumen.ventas_credito, 50)
+        self.assertEqual(resumen.ventas_vales, 25)
+        self.assertEqual(resumen.esperado_efectivo, 1000 + 300 + 70 - 20)
+
+    def test_una_sola_caja_abierta(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SesionCaja.objects.create(usuario=self.usuario, saldo_inicial=0)
+        SesionCaja.objects.create(usuario=self.usuario, saldo_inicial=0, estado=False)
+        self.assertEqual(SesionCaja.objects.filter(estado=True).count(), 1)
+
+    def test_totales_recalculados_coinciden(self):
+        salida = StringIO()
+        call_command('verificar_totales_caja', stdout=salida)
+        self.assertIn('coinciden', salida.getvalue())
+
+    def test_cobrar_anular_y_movimientos_mantienen_los_totales(self):
+        producto = Producto.objects.create(codigo='1', nombre='Chicle', precio_venta=10, stock_actual=100)
+        self.client.force_login(self.usuario)
+        venta = cobrar(self.usuario, [{'id': producto.id, 'cantidad': 4}], 'CREDITO')
+        self.client.post('/movimiento/', {'tipo': 'EGRESO', 'categoria': 'GASTO_VARIO', 'monto': '5.50',
+                                          'descripcion': 'Lavandina'})
+        sesion = SesionCaja.objects.get(pk=self.sesion.pk)
+        self.assertEqual(sesion.ventas_credito, 90)
+        self.assertEqual(sesion.total_egresos, Decimal('25.50'))
+
+        self.client.post(f'/anular/{venta.id}/')
+        sesion.refresh_from_db()
+        self.assertEqual(sesion.ventas_credito, 50)
+
+        salida = StringIO()
+        call_command('verificar_totales_caja', stdout=salida)
+        self.assertIn('coinciden', salida.getvalue())
+
+    def test_pantalla_de_cierre_guarda_el_esperado(self):
+        self.client.force_login(self.usuario)
+        respuesta = self.client.get('/cierre/')
+        self.assertEqual(respuesta.context['esperado_efectivo'], 1350)
+        self.sesion.refresh_from_db()
+        self.assertEqual(self.sesion.saldo_final_esperado, 1350)
+
+
+class ReporteMensualTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.duena = User.objects.create_user('duena', password='clave', is_staff=True)
+        cls.sesion = SesionCaja.objects.create(usuario=cls.duena, saldo_inicial=0)
+        cls.productos = Producto.objects.bulk_create([
+            Producto(codigo=str(i), nombre=f'Producto {i}', precio_costo=60, precio_venta=100, stock_actual=1000)
+            for i in range(10)
+        ])
+
+    def vender(self, cantidad_ventas):
+        for _ in range(cantidad_ventas):
+            cobrar(self.duena, [{'id': p.id, 'cantidad': 2} for p in self.productos], 'EFECTIVO')
+
+    def consultas_del_reporte(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get('/reporte-mensual/')
+        return respuesta, len(consultas)
+
+    def test_costo_de_mercaderia_con_cantidad_fija_de_consultas(self):
+        self.client.force_login(self.duena)
+        self.vender(1)
+        respuesta, consultas_con_una_venta = self.consultas_del_reporte()
+        self.assertEqual(respuesta.context['costo_mercaderia'], 10 * 2 * 60)
+
+        self.vender(5)
+        respuesta, consultas_con_seis_ventas = self.consultas_del_reporte()
+        self.assertEqual(respuesta.context['costo_mercaderia'], 6 * 10 * 2 * 60)
+        self.assertEqual(respuesta.context['cantidad_ventas'], 6)
+        self.assertEqual(consultas_con_una_venta, consultas_con_seis_ventas)
+
+    def test_el_costo_queda_fijo_al_momento_de_la_venta(self):
+        self.client.force_login(self.duena)
+        self.vender(1)
+        Producto.objects.update(precio_costo=90)
+        self.assertEqual(self.client.get('/reporte-mensual/').context['costo_mercaderia'], 10 * 2 * 60)
+
+    def test_completar_costos_de_ventas_viejas(self):
+        self.vender(2)
+        DetalleVenta.objects.update(costo_unitario=None)
+        call_command('completar_costos_detalle', '--lote', '7', stdout=StringIO())
+        self.assertFalse(DetalleVenta.objects.filter(costo_unitario__isnull=True).exists())
+        self.assertEqual(set(DetalleVenta.objects.values_list('costo_unitario', flat=True)), {60})
+
+
+class ResumenDiarioTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('duena', password='clave', is_staff=True)
+        cls.sesion = SesionCaja.objects.create(usuario=cls.usuario, saldo_inicial=0)
+        cls.categoria = Categoria.objects.create(nombre='Bebidas')
+        cls.agua = Producto.objects.create(codigo='1', nombre='Agua', categoria=cls.categoria,
+                                           precio_costo=40, precio_venta=100, stock_actual=100)
+        cls.soda = Producto.objects.create(codigo='2', nombre='Soda', precio_costo=30, precio_venta=50, stock_actual=100)
+
+    def renglones(self):
+        return {
+            (r.metodo_pago, r.producto_id): (r.cantidad, r.ingresos, r.costo, r.tickets)
+            for r in ResumenDiario.objects.exclude(tickets=0)
+        }
+
+    def test_cobrar_y_anular_actualizan_el_resumen(self):
+        cobrar(self.usuario, [{'id': self.agua.id, 'cantidad': 2}, {'id': self.soda.id, 'cantidad': 1}], 'EFECTIVO')
+        cobrar(self.usuario, [{'id': self.agua.id, 'cantidad': 1}], 'EFECTIVO')
+        anulada = cobrar(self.usuario, [{'id': self.soda.id, 'cantidad': 3}], 'DEBITO')
+        self.assertEqual(ResumenDiario.objects.get(producto=self.agua).categoria, self.categoria)
+        self.assertEqual(self.renglones()[('EFECTIVO', self.agua.id)], (3, 300, 120, 2))
+
+        self.client.force_login(self.usuario)
+        self.client.post(f'/anular/{anulada.id}/')
+        self.assertNotIn(('DEBITO', self.soda.id), self.renglones())
+        self.assertEqual(self.renglones()[('EFECTIVO', self.soda.id)], (1, 50, 30, 1))
+
+    def test_reconstruir_coincide_con_lo_incremental(self):
+        for metodo in ('EFECTIVO', 'EFECTIVO', 'CREDITO'):
+            cobrar(self.usuario, [{'id': self.agua.id, 'cantidad': 2}, {'id': self.soda.id, 'cantidad': 5}], metodo)
+        incremental = self.renglones()
+
+        call_command('reconstruir_resumen_diario', stdout=StringIO())
+        self.assertEqual(self.renglones(), incremental)
+
+        hoy = timezone.localdate().isoformat()
+        call_command('reconstruir_resumen_diario', '--desde', hoy, '--hasta', hoy, '--lote', '1', stdout=StringIO())
+        self.assertEqual(self.renglones(), incremental)
+
+    def test_reporte_mensual_lee_el_resumen(self):
+        cobrar(self.usuario, [{'id': self.agua.id, 'cantidad': 2}], 'EFECTIVO')
+        cobrar(self.usuario, [{'id': self.soda.id, 'cantidad': 4}], 'DEBITO')
+        self.client.force_login(self.usuario)
+        contexto = self.client.get('/reporte-mensual/').context
+        self.assertEqual(contexto['total_ventas'], 400)
+        self.assertEqual(contexto['costo_mercaderia'], 200)
+        self.assertEqual(contexto['cantidad_ventas'], 2)
+        self.assertEqual(json.loads(contexto['labels_prod_js']), ['Soda', 'Agua'])
+
+
+class ReportePorPeriodoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.duena = User.objects.create_user('duena', password='clave', is_staff=True)
+        SesionCaja.objects.create(usuario=cls.duena, saldo_inicial=0)
+        cls.producto = Producto.objects.create(codigo='1', nombre='Yerba', precio_costo=60, precio_venta=100,
+                                               stock_actual=100)
+        cls.mes_pasado = sumar_meses(timezone.localdate().replace(day=1), -1)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.duena)
+
+    def vender_el_mes_pasado(self, cantidad):
+        venta = cobrar(self.duena, [{'id': self.producto.id, 'cantidad': cantidad}], 'EFECTIVO')
+        Venta.objects.filter(pk=venta.pk).update(fecha=inicio_del_dia(self.mes_pasado.replace(day=10)))
+        call_command('reconstruir_resumen_diario', stdout=StringIO())
+        return venta
+
+    def reporte(self, **parametros):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get('/reporte-mensual/', parametros)
+        tablas_de_ventas = [c['sql'] for c in consultas if 'gestion_venta' in c['sql'] or 'gestion_resumen' in c['sql']]
+        return respuesta.context, tablas_de_ventas
+
+    def test_periodo_cerrado_sale_del_cache_y_se_invalida_al_anular(self):
+        vieja = self.vender_el_mes_pasado(3)
+        self.vender_el_mes_pasado(1)
+        periodo = {'desde': self.mes_pasado.isoformat(), 'hasta': (timezone.localdate().replace(day=1)
+                                                                     - datetime.timedelta(days=1)).isoformat()}
+        contexto, consultas = self.reporte(**periodo)
+        self.assertEqual(contexto['total_ventas'], 400)
+        self.assertTrue(contexto['es_un_mes'])
+        self.assertTrue(consultas)
+
+        contexto, consultas = self.reporte(**periodo)
+        self.assertEqual(contexto['total_ventas'], 400)
+        self.assertEqual(consultas, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/anular/{vieja.id}/')
+        contexto, consultas = self.reporte(**periodo)
+        self.assertEqual(contexto['total_ventas'], 100)
+        self.assertEqual(contexto['cantidad_ventas'], 1)
+
+    def test_comparar_con_el_mes_anterior(self):
+        self.vender_el_mes_pasado(2)
+        cobrar(self.duena, [{'id': self.producto.id, 'cantidad': 3}], 'EFECTIVO')
+        contexto, _ = self.reporte(comparar='anterior')
+        self.assertEqual(contexto['total_ventas'], 300)
+        self.assertEqual(contexto['comparacion']['total_ventas'], 200)
+        self.assertEqual(contexto['comparacion']['desde'], self.mes_pasado)
+        self.assertEqual(contexto['comparacion']['filas'][0], ('Ventas', 300, 200, 50.0, True))
+
+    def test_periodos_comparados(self):
+        self.assertEqual(periodo_comparado(datetime.date(2024, 3, 1), datetime.date(2024, 4, 1), 'anterior'),
+                         (datetime.date(2024, 2, 1), datetime.date(2024, 3, 1)))
+        self.assertEqual(periodo_comparado(datetime.date(2024, 3, 10), datetime.date(2024, 3, 17), 'anterior'),
+                         (datetime.date(2024, 3, 3), datetime.date(2024, 3, 10)))
+        self.assertEqual(periodo_comparado(datetime.date(2024, 2, 29), datetime.date(2024, 3, 1), 'anio'),
+                         (datetime.date(2023, 2, 28), datetime.date(2023, 3, 1)))
+
+    def test_fechas_invalidas_muestran_el_mes_actual(self):
+        contexto, _ = self.reporte(desde='2024-13-01')
+        self.assertEqual(contexto['desde'], timezone.localdate().replace(day=1))
+        # Fechas válidas que se salen del calendario al correrlas
+        for parametros in ({'hasta': '9999-12-31'}, {'desde': '0001-01-01', 'comparar': 'anterior'},
+                           {'desde': '0001-03-01', 'hasta': '0001-03-31', 'comparar': 'anio'}):
+            contexto, _ = self.reporte(**parametros)
+            self.assertEqual(contexto['desde'], timezone.localdate().replace(day=1))
+
+
+class BaseReportesTests(TransactionTestCase):
+    # TransactionTestCase: el backup no se puede hacer con la transacción de TestCase abierta
+    databases = {'default', 'reportes'}
+
+    def setUp(self):
+        cache.clear()
+
+    def test_en_los_tests_no_se_desvia_nada(self):
+        # TEST['MIRROR']: el alias de reportes apunta a la misma base que 'default'
+        self.assertIsNone(alias_de_reportes())
+        with base_de_reportes():
+            self.assertFalse(en_reportes.get())
+            self.assertEqual(router.db_for_read(Venta), 'default')
+
+    def test_router_desvia_solo_las_lecturas_de_reportes(self):
+        self.assertEqual(router.db_for_read(Venta), 'default')
+        marca = en_reportes.set(True)
+        try:
+            with mock.patch('gestion.routers.alias_de_reportes', return_value='reportes'):
+                self.assertEqual(router.db_for_read(Venta), 'reportes')
+                self.assertEqual(router.db_for_read(ResumenDiario), 'reportes')
+                self.assertEqual(router.db_for_read(TrabajoExportacion), 'default')
+                self.assertEqual(router.db_for_read(User), 'default')
+                self.assertEqual(router.db_for_write(Venta), 'default')
+        finally:
+            en_reportes.reset(marca)
+        self.assertFalse(router.allow_migrate('reportes', 'gestion'))
+
+    def test_copia_con_la_api_de_backup(self):
+        Producto.objects.create(codigo='1', nombre='Yerba', precio_venta=100, stock_actual=5)
+        directorio = tempfile.mkdtemp(prefix='kiosco_test_')
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        destino = os.path.join(directorio, 'reportes.sqlite3')
+        with transaction.atomic():
+            self.assertFalse(refrescar_copia(destino))
+        self.assertTrue(refrescar_copia(destino))
+        with sqlite3.connect(destino) as copia:
+            filas = copia.execute('SELECT nombre FROM gestion_producto').fetchall()
+        self.assertEqual(filas, [('Yerba',)])
+        self.assertFalse(os.path.exists(destino + '.nueva'))
+
+    def test_no_se_cachea_un_periodo_leido_de_una_copia_vieja(self):
+        hoy = inicio_del_dia(timezone.localdate())
+        self.assertTrue(datos_completos_hasta(hoy))
+        marca = en_reportes.set(True)
+        try:
+            with mock.patch('gestion.base_reportes.copia_tomada', return_value=hoy - datetime.timedelta(hours=1)):
+                self.assertFalse(datos_completos_hasta(hoy))
+            with mock.patch('gestion.base_reportes.copia_tomada', return_value=hoy + datetime.timedelta(hours=1)):
+                self.assertTrue(datos_completos_hasta(hoy))
+        finally:
+            en_reportes.reset(marca)
+
+    def test_despues_de_anular_no_se_cachea_lo_leido_de_la_copia_vieja(self):
+        duena = User.objects.create_user('duena', password='clave', is_staff=True)
+        SesionCaja.objects.create(usuario=duena, saldo_inicial=0)
+        yerba = Producto.objects.create(codigo='1', nombre='Yerba', precio_venta=100, stock_actual=5)
+        hoy = timezone.localdate()
+        ayer = hoy - datetime.timedelta(days=1)
+        venta = cobrar(duena, [{'id': yerba.id, 'cantidad': 1}], 'EFECTIVO')
+        Venta.objects.filter(pk=venta.pk).update(fecha=inicio_del_dia(ayer))
+        call_command('reconstruir_resumen_diario', stdout=StringIO())
+
+        # Una copia de verdad en un archivo aparte, en vez del espejo de los tests
+        directorio = tempfile.mkdtemp(prefix='kiosco_test_')
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        reportes = connections['reportes']
+        self.addCleanup(reportes.close)
+        archivo = {**reportes.settings_dict, 'NAME': os.path.join(directorio, 'reportes.sqlite3')}
+        with mock.patch.object(reportes, 'settings_dict', archivo):
+            self.assertEqual(alias_de_reportes(), 'reportes')
+            self.assertTrue(refrescar_copia())
+            with base_de_reportes():
+                self.assertEqual(reporte_del_periodo(ayer, hoy)['total_ventas'], 100)
+
+            self.client.force_login(duena)
+            self.client.post(f'/anular/{venta.id}/')
+            # La copia todavía tiene la venta: se muestra, pero no se cachea, y se pide una copia nueva
+            with mock.patch('gestion.trabajos.encolar') as encolar, base_de_reportes():
+                self.assertEqual(reporte_del_periodo(ayer, hoy)['total_ventas'], 100)
+            encolar.assert_called_once_with(refrescar_copia, None, False)
+
+            # Lo pedido desde ahora (como una exportación) no lee esa copia: se rehace antes
+            with base_de_reportes(desde=timezone.now()):
+                self.assertEqual(reporte_del_periodo(ayer, hoy)['total_ventas'], 0)
+
+
+@override_settings(KIOSCO_TRABAJOS_EN_SEGUNDO_PLANO=False)
+class ExportarVentasTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Los archivos generados van a una carpeta propia que se borra al terminar la clase
+        media = tempfile.mkdtemp(prefix='kiosco_test_')
+        cls.addClassCleanup(shutil.rmtree, media, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cajera', password='clave')
+        cls.sesion = SesionCaja.objects.create(usuario=cls.usuario, saldo_inicial=0)
+        otra = SesionCaja.objects.create(usuario=cls.usuario, saldo_inicial=0, estado=False)
+        Venta.objects.bulk_create(
+            [Venta(sesion=cls.sesion, usuario=cls.usuario, total=10 + i, metodo_pago='EFECTIVO') for i in range(30)]
+            + [Venta(sesion=otra, usuario=cls.usuario, total=5, metodo_pago='DEBITO', anulada=True)]
+        )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def exportar(self, url='/exportar/', **parametros):
+        """Pide la exportación y devuelve (trabajo, contenido del archivo)."""
+        respuesta = self.client.get(url, parametros)
+        trabajo = TrabajoExportacion.objects.get(pk=respuesta.url.strip('/').split('/')[-1])
+        self.assertEqual(trabajo.estado, 'LISTO', trabajo.error)
+        estado = self.client.get(respuesta.url, {'formato': 'json'}).json()
+        self.assertEqual(estado['progreso'], 100)
+        descarga = self.client.get(estado['descarga'])
+        return trabajo, b''.join(descarga.streaming_content)
+
+    def test_filas_con_una_sola_consulta(self):
+        with self.assertNumQueries(1):
+            filas = list(filas_de_ventas(sesion_id=self.sesion.id))
+        self.assertEqual(len(filas), 30)
+        self.assertEqual(filas[0][2:5], ('cajera', 'EFECTIVO', 39.0))
+
+    def test_csv(self):
+        _, contenido = self.exportar(formato='csv', sesion=self.sesion.id)
+        lineas = contenido.decode('utf-8-sig').splitlines()
+        self.assertEqual(lineas[0].split(';')[2], 'Cajero/Usuario')
+        self.assertEqual(len(lineas), 31)
+        self.assertEqual(lineas[1].split(';')[2:5], ['cajera', 'EFECTIVO', '39.0'])
+
+    def test_xlsx_con_filtro_de_fechas(self):
+        hoy = timezone.localdate().isoformat()
+        _, contenido = self.exportar(desde=hoy, hasta=hoy)
+        filas = list(load_workbook(BytesIO(contenido)).active.iter_rows(values_only=True))
+        self.assertEqual(len(filas), 32)
+        self.assertEqual(filas[1][-1], 'SI')
+
+        ayer = (timezone.localdate() - datetime.timedelta(days=1)).isoformat()
+        _, contenido = self.exportar(hasta=ayer)
+        self.assertEqual(load_workbook(BytesIO(contenido)).active.max_row, 1)
+
+        # El último día del calendario no tiene día siguiente: se exporta todo
+        _, contenido = self.exportar(hasta='9999-12-31')
+        self.assertEqual(load_workbook(BytesIO(contenido)).active.max_row, 32)
+
+    def test_reusa_el_archivo_si_los_datos_no_cambiaron(self):
+        primero, _ = self.exportar(formato='csv')
+        segundo, _ = self.exportar(formato='csv')
+        self.assertEqual(primero.pk, segundo.pk)
+
+        Venta.objects.filter(pk=Venta.objects.first().pk).update(anulada=True)
+        tercero, _ = self.exportar(formato='csv')
+        self.assertNotEqual(primero.pk, tercero.pk)
+
+    def test_otro_usuario_no_ve_la_exportacion(self):
+        trabajo, _ = self.exportar()
+        self.client.force_login(User.objects.create_user('otra'))
+        self.assertEqual(self.client.get(f'/exportaciones/{trabajo.id}/').status_code, 404)
+        # La misma exportación pedida por otra cajera es un trabajo suyo, no el de la primera
+        suyo, _ = self.exportar()
+        self.assertNotEqual(suyo.pk, trabajo.pk)
+
+    def test_lista_de_productos(self):
+        Producto.objects.create(codigo='1', nombre='Yerba', precio_costo=60, precio_venta=100, stock_actual=3)
+        self.usuario.is_staff = True
+        self.usuario.save()
+        _, contenido = self.exportar('/exportar-productos/')
+        filas = list(load_workbook(BytesIO(contenido)).active.iter_rows(values_only=True))
+        self.assertEqual(filas[1], ('1', 'Yerba', '-', 60, 100, 40, 40, 3, 180))
+
+    def test_renombrar_una_categoria_rehace_la_lista_de_productos(self):
+        almacen = Categoria.objects.create(nombre='Almacén')
+        Producto.objects.create(codigo='1', nombre='Yerba', precio_venta=100, stock_actual=3, categoria=almacen)
+        self.usuario.is_staff = True
+        self.usuario.save()
+        primero, _ = self.exportar('/exportar-productos/')
+        almacen.nombre = 'Infusiones'
+        almacen.save()
+        segundo, contenido = self.exportar('/exportar-productos/')
+        self.assertNotEqual(primero.pk, segundo.pk)
+        self.assertEqual(load_workbook(BytesIO(contenido)).active['C2'].value, 'Infusiones')
+
+    def test_productos_con_totales_por_categoria_en_una_consulta(self):
+        bebidas, almacen = Categoria.objects.create(nombre='Bebidas'), Categoria.objects.create(nombre='Almacén')
+        Producto.objects.bulk_create([
+            Producto(codigo='1', nombre='Soda', precio_costo=50, precio_venta=80, stock_actual=4, categoria=bebidas),
+            Producto(codigo='2', nombre='Agua', precio_costo=30, precio_venta=60, stock_actual=10, categoria=bebidas),
+            Producto(codigo='3', nombre='Fideos', precio_costo='12.5', precio_venta=20, stock_actual=2,
+                     categoria=almacen),
+            Producto(codigo='4', nombre='Regalo', precio_costo=5, precio_venta=0, stock_actual=1),
+            Producto(codigo='5', nombre='Viejo', precio_costo=5, precio_venta=9, stock_actual=100, activo=False),
+        ])
+        with self.assertNumQueries(1):
+            filas = list(filas_de_productos())
+
+        self.assertEqual([(f[1], f[-1]) for f in filas], [
+            ('Fideos', 25), ('Total Almacén', 25),
+            ('Agua', 300), ('Soda', 200), ('Total Bebidas', 500),
+            ('Regalo', 5), ('Total -', 5),
+            ('TOTAL INVENTARIO', 530),
+        ])
+        self.assertEqual(filas[0][5:7], (7.5, 37.5))
+        self.assertEqual(filas[5][5:7], (-5, 0))
+
+    def test_filtro_invalido(self):
+        self.assertRedirects(self.client.get('/exportar/', {'desde': 'ayer'}), '/', fetch_redirect_response=False)
+
+
+@override_settings(KIOSCO_TRABAJOS_EN_SEGUNDO_PLANO=False)
+class ImportarProductosTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Los archivos subidos van a una carpeta propia que se borra al terminar la clase
+        media = tempfile.mkdtemp(prefix='kiosco_test_')
+        cls.addClassCleanup(shutil.rmtree, media, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.duena = User.objects.create_user('duena', password='clave', is_staff=True)
+        cls.bebidas = Categoria.objects.create(nombre='Bebidas')
+        Producto.objects.create(codigo='7790001', nombre='Agua vieja', precio_venta=50, stock_actual=1,
+                                categoria=cls.bebidas, activo=False)
+
+    def setUp(self):
+        cache.clear()  # Las previsualizaciones quedan en el cache por id de importación
+
+    def csv(self, filas, encabezado='codigo,nombre,venta,costo,stock,categoria'):
+        return '\n'.join([encabezado] + filas)
+
+    def importar(self, contenido, nombre='lista.csv'):
+        self.client.force_login(self.duena)
+        archivo = SimpleUploadedFile(nombre, contenido.encode())
+        return self.client.post('/importar/', {'archivo_excel': archivo}, follow=True)
+
+    def test_crea_actualiza_y_normaliza_codigos(self):
+        respuesta = self.importar(self.csv([
+            '7790001.0,Agua 500,"120,50",80,10,Bebidas',
+            '12.001,Caramelo,5,2,100,',
+            ' A1.0B ,Chicle,3,,,Golosinas',
+            ',Sin código,1,1,1,',
+        ]))
+        self.assertContains(respuesta, 'Se crearon 2 productos y se actualizaron 1')
+        self.assertEqual(respuesta.context['importacion'].estado, 'LISTO')
+
+        agua = Producto.objects.get(codigo='7790001')
+        self.assertEqual((agua.nombre, agua.precio_venta, agua.stock_actual, agua.activo),
+                         ('Agua 500', Decimal('120.50'), 10, True))
+        self.assertEqual(agua.categoria, self.bebidas)
+        self.assertEqual(Producto.objects.get(codigo='12.001').categoria.nombre, 'General')
+        self.assertEqual(Producto.objects.get(codigo='A1.0B').precio_costo, 0)
+        self.assertEqual(Categoria.objects.filter(nombre='Golosinas').count(), 1)
+
+    def test_consultas_por_lote_y_no_por_fila(self):
+        def consultas(cantidad, desde):
+            contenido = self.csv([f'{i},Producto {i},10,,,{"AB"[i % 2]}' for i in range(desde, desde + cantidad)])
+            importacion = ImportacionProductos.objects.create(
+                usuario=self.duena, nombre_archivo='lista.csv',
+                archivo=SimpleUploadedFile('lista.csv', contenido.encode()),
+            )
+            with CaptureQueriesContext(connection) as capturadas:
+                ejecutar_importacion(importacion.id)
+            return len(capturadas)
+
+        # SQLite limita los parámetros por consulta: el INSERT se parte en unos pocos lotes. Aparte van
+        # las cuatro del trabajo (leerlo, marcarlo en curso, el punto de control y el final)
+        self.assertLessEqual(consultas(10, 0), 10)
+        self.assertLess(consultas(500, 1000), 19)
+        self.assertEqual(Producto.objects.count(), 511)
+
+    def test_faltan_columnas(self):
+        respuesta = self.importar(self.csv(['1,Agua'], encabezado='codigo,nombre'))
+        self.assertContains(respuesta, 'DEBE tener las columnas')
+        self.assertEqual(Producto.objects.count(), 1)
+
+    def test_filas_con_error_no_frenan_el_resto(self):
+        respuesta = self.importar(self.csv([
+            '1,Agua,100,,,',
+            '2,Soda,cien,,,',
+            '3,,10,,,',
+            '4,Jugo,50,-3,,',
+            '5,Yerba,900,,mucho,',
+        ]))
+        importacion = respuesta.context['importacion']
+        self.assertEqual((importacion.nuevos, importacion.con_error), (1, 4))
+
+        reporte = b''.join(self.client.get(f'/importaciones/{importacion.id}/errores/').streaming_content)
+        lineas = reporte.decode('utf-8-sig').splitlines()
+        self.assertEqual(lineas, ['Fila;Código;Error', '3;2;Precio de venta inválido', '4;3;Falta el nombre',
+                                  '5;4;Costo negativo', '6;5;Stock inválido'])
+
+    def test_xlsx_por_lotes(self):
+        libro = Workbook()
+        libro.active.append(['Codigo', 'Nombre', 'Venta', 'Stock'])
+        for i in range(25):
+            libro.active.append([7790100 + i, f'Producto {i}', 10.5, None if i % 2 else 3])
+        libro.active.append([None, 'Sin código', 1, 1])
+        contenido = BytesIO()
+        libro.save(contenido)
+
+        importacion = ImportacionProductos.objects.create(
+            usuario=self.duena, nombre_archivo='lista.xlsx',
+            archivo=SimpleUploadedFile('lista.xlsx', contenido.getvalue()),
+        )
+        ejecutar_importacion(importacion.id, lote=10)
+        importacion.refresh_from_db()
+        self.assertEqual((importacion.estado, importacion.filas_totales, importacion.filas_procesadas), ('LISTO', 26, 26))
+        self.assertEqual((importacion.nuevos, importacion.con_error), (25, 1))
+        self.assertEqual(importacion.errores.get().fila, 27)
+        self.assertEqual(Producto.objects.get(codigo='7790101').precio_venta, Decimal('10.50'))
+
+    def test_retomar_una_importacion_cortada(self):
+        contenido = self.csv([f'{i},Producto {i},10,,,' for i in range(1, 8)])
+        importacion = ImportacionProductos.objects.create(
+            usuario=self.duena, nombre_archivo='lista.csv', archivo=SimpleUploadedFile('lista.csv', contenido.encode()),
+        )
+        # Simulamos que se cortó después de guardar el primer lote de 3 filas
+        ejecutar_importacion(importacion.id, lote=3)
+        Producto.objects.filter(codigo__in=['4', '5', '6', '7']).delete()
+        Producto.objects.filter(codigo='1').update(nombre='Cambiado a mano')
+        ImportacionProductos.objects.filter(pk=importacion.pk).update(estado='ERROR', filas_procesadas=3, nuevos=3)
+
+        self.client.force_login(self.duena)
+        self.client.post(f'/importaciones/{importacion.id}/reanudar/')
+        importacion.refresh_from_db()
+        self.assertEqual((importacion.estado, importacion.filas_procesadas, importacion.nuevos), ('LISTO', 7, 7))
+        self.assertTrue(Producto.objects.filter(codigo='7').exists())
+        self.assertEqual(Producto.objects.get(codigo='1').nombre, 'Cambiado a mano')
+
+    def test_celdas_con_saltos_de_linea_no_inflan_el_total(self):
+        contenido = self.csv(['1,"Agua\nsin gas",10,,,', '', '2,"Soda\r\n1,5 L",20,,,'])
+        importacion = ImportacionProductos.objects.create(
+            usuario=self.duena, nombre_archivo='lista.csv', archivo=SimpleUploadedFile('lista.csv', contenido.encode()),
+        )
+        ejecutar_importacion(importacion.id)
+        importacion.refresh_from_db()
+        self.assertEqual((importacion.estado, importacion.filas_totales, importacion.filas_procesadas), ('LISTO', 2, 2))
+        self.assertEqual(Producto.objects.get(codigo='1').nombre, 'Agua\nsin gas')
+
+    def test_previsualizar_no_guarda_nada(self):
+        Producto.objects.create(codigo='7790002', nombre='Soda', precio_venta=80, precio_costo=40, stock_actual=5,
+                                categoria=self.bebidas)
+        self.client.force_login(self.duena)
+        archivo = SimpleUploadedFile('lista.csv', self.csv([
+            '7790001,Agua vieja,50,0,1,Bebidas',
+            '7790002,Soda,95,40,5,Bebidas',
+            '7790003,Jugo,120,,8,Bebidas',
+            '7790004,,10,,,',
+        ]).encode())
+        respuesta = self.client.post('/importar/', {'archivo_excel': archivo, 'previsualizar': 'on'}, follow=True)
+
+        self.assertTemplateUsed(respuesta, 'gestion/importacion_previa.html')
+        self.assertEqual(respuesta.context['resumen'], {
+            'nuevos': 1, 'precios': 1, 'costos': 0, 'stock': 0, 'otros': 1, 'sin_cambios': 0, 'con_error': 1,
+        })
+        self.assertEqual([p['codigo'] for p in respuesta.context['precios']], ['7790002'])
+        self.assertEqual(respuesta.context['precios'][0]['venta_actual'], 80)
+        self.assertEqual(respuesta.context['errores'][0]['fila'], 5)
+        self.assertEqual(respuesta.context['importacion'].estado, 'PREVIA')
+        self.assertFalse(Producto.objects.filter(codigo='7790003').exists())
+        self.assertEqual(Producto.objects.get(codigo='7790002').precio_venta, 80)
+
+        # La pantalla de estado manda de vuelta a la previsualización
+        importacion = respuesta.context['importacion']
+        self.assertRedirects(self.client.get(f'/importaciones/{importacion.id}/'),
+                             f'/importaciones/{importacion.id}/previa/')
+
+    def test_aplicar_usa_la_previsualizacion_guardada(self):
+        self.client.force_login(self.duena)
+        archivo = SimpleUploadedFile('lista.csv', self.csv([f'{i},Producto {i},10,,,' for i in range(1, 6)]).encode())
+        respuesta = self.client.post('/importar/', {'archivo_excel': archivo, 'previsualizar': 'on'}, follow=True)
+        importacion = respuesta.context['importacion']
+
+        # Al aplicar no se vuelve a leer el archivo: sale del cache de la previsualización
+        importacion.archivo.delete(save=False)
+        self.client.post(f'/importaciones/{importacion.id}/previa/', {'accion': 'aplicar'})
+        importacion.refresh_from_db()
+        self.assertEqual((importacion.estado, importacion.nuevos, importacion.filas_procesadas), ('LISTO', 5, 5))
+        self.assertEqual(Producto.objects.filter(codigo__in=['1', '2', '3', '4', '5']).count(), 5)
+        self.assertIsNone(cache.get(f'gestion:importacion:{importacion.id}:previa'))
+
+    def test_cancelar_la_previsualizacion(self):
+        self.client.force_login(self.duena)
+        archivo = SimpleUploadedFile('lista.csv', self.csv(['1,Agua,100,,,']).encode())
+        respuesta = self.client.post('/importar/', {'archivo_excel': archivo, 'previsualizar': 'on'}, follow=True)
+        importacion = respuesta.context['importacion']
+
+        respuesta = self.client.post(f'/importaciones/{importacion.id}/previa/', {'accion': 'cancelar'}, follow=True)
+        self.assertContains(respuesta, 'Importación cancelada')
+        self.assertFalse(ImportacionProductos.objects.filter(pk=importacion.pk).exists())
+        self.assertFalse(Producto.objects.filter(codigo='1').exists())
+
+    def test_importacion_de_otro_usuario(self):
+        importacion = ImportacionProductos.objects.create(usuario=self.duena, nombre_archivo='x.csv', archivo='x.csv')
+        self.client.force_login(User.objects.create_user('cajera'))
+        self.assertEqual(self.client.get(f'/importaciones/{importacion.id}/').status_code, 404)
@@ -0,0 +1,163 @@
+"""
+Tickets de venta, en HTML (para el navegador) o en ESC/POS (bytes crudos para
+la impresora térmica).
+
+Una venta no cambia después de cobrada salvo para anularse, así que cada ticket
+se arma una vez y queda en el cache con la venta y su estado en la clave:
+reimprimir cuesta una consulta chiquita (¿existe?, ¿está anulada?) y una
+lectura del cache. Al anular cambia la clave y el ticket se vuelve a armar con
+la marca de anulada. Los nombres de los productos quedan como estaban la
+primera vez que se imprimió, igual que en el papel.
+"""
+import socket
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.formats import number_format
+
+from .models import DetalleVenta, Venta
+
+SEGUNDOS_CACHE_TICKET = 60 * 60 * 24 * 7
+SEGUNDOS_IMPRESORA = 5
+# Ventas por consulta al armar los tickets de una caja entera
+VENTAS_POR_LOTE = 500
+
+# Comandos ESC/POS
+INICIAR = b'\x1b@'
+PAGINA_DE_CODIGOS = b'\x1bt\x13'  # PC858: latín con ñ, acentos y €
+CENTRADO, IZQUIERDA = b'\x1ba\x01', b'\x1ba\x00'
+NEGRITA, SIN_NEGRITA = b'\x1bE\x01', b'\x1bE\x00'
+CORTE = b'\x1dVB\x03'  # avanza 3 líneas y corta (corte parcial)
+
+
+class ErrorImpresora(Exception):
+    """No se pudo mandar el ticket a la impresora (no configurada, apagada, sin papel en la red, etc)."""
+
+
+def ventas_para_ticket():
+    """Ventas con todo lo que muestra el ticket: caja y cajero por JOIN, detalles con su producto en una consulta más."""
+    return Venta.objects.select_related('sesion__usuario').prefetch_related(
+        Prefetch('detalles', queryset=DetalleVenta.objects.select_related('producto').order_by('id')),
+    )
+
+
+def clave_ticket(venta_id, anulada, formato='html'):
+    return f"gestion:ticket:{formato}:{venta_id}:{'anulada' if anulada else 'valida'}"
+
+
+def _html(venta):
+    return render_to_string('gestion/ticket.html', {
+        'venta': venta,
+        'fecha': venta.fecha,
+        'items': venta.detalles.all(),
+        'total': venta.total,
+        'metodo_pago': venta.metodo_pago,
+    })
+
+
+def _cantidad(cantidad):
+    """1.000 -> '1', 0.250 -> '0,25' (los productos por peso llevan decimales)."""
+    texto = f'{cantidad:f}'
+    if '.' in texto:
+        texto = texto.rstrip('0').rstrip('.')
+    return texto.replace('.', ',')
+
+
+def _renglon(izquierda, derecha, ancho):
+    """Texto a la izquierda (recortado si no entra) e importe alineado a la derecha."""
+    lugar = ancho - len(derecha) - 1
+    return izquierda[:lugar].ljust(lugar) + ' ' + derecha
+
+
+def escpos(venta, ancho=None):
+    """Bytes ESC/POS del ticket (mismo contenido que ticket.html), terminados en un corte de papel."""
+    ancho = ancho or settings.KIOSCO_TICKET_COLUMNAS
+    separador = '-' * ancho
+
+    def texto(linea):
+        return linea.encode('cp858', errors='replace') + b'\n'
+
+    partes = [INICIAR, PAGINA_DE_CODIGOS, CENTRADO, NEGRITA, texto('KIOSCO DOÑA PEPITA'), SIN_NEGRITA,
+              texto('Tucumán, Argentina'), texto(separador), IZQUIERDA,
+              texto(f"Fecha: {timezone.localtime(venta.fecha):%d/%m/%Y %H:%M}"),
+              texto(f'Ticket #: {venta.id}'),
+              texto(f'Vendedor: {venta.sesion.usuario.username}')]
+    if venta.anulada:
+        partes += [CENTRADO, NEGRITA, texto('*** VENTA ANULADA ***'), SIN_NEGRITA, IZQUIERDA]
+    partes.append(texto(separador))
+    for detalle in venta.detalles.all():
+        partes.append(texto(_renglon(
+            f'{_cantidad(detalle.cantidad)} x {detalle.producto.nombre}',
+            f'${number_format(detalle.subtotal, 2)}', ancho,
+        )))
+    partes += [
+        texto(separador),
+        NEGRITA, texto(_renglon('TOTAL:', f'${number_format(venta.total, 2)}', ancho)), SIN_NEGRITA,
+        texto(_renglon('Pago:', venta.metodo_pago, ancho)),
+        CENTRADO, texto(''), texto('¡Gracias por su compra!'), texto('*' * 24), IZQUIERDA,
+        CORTE,
+    ]
+    return b''.join(partes)
+
+
+FORMATOS = {'html': _html, 'escpos': escpos}
+
+
+def ticket_de_la_venta(venta_id, formato='html'):
+    """Ticket de la venta en el formato pedido ('html' o 'escpos'). Levanta Venta.DoesNotExist si no existe."""
+    anulada = Venta.objects.values_list('anulada', flat=True).get(pk=venta_id)
+    clave = clave_ticket(venta_id, anulada, formato)
+    datos = cache.get(clave)
+    if datos is None:
+        datos = FORMATOS[formato](ventas_para_ticket().get(pk=venta_id))
+        cache.set(clave, datos, SEGUNDOS_CACHE_TICKET)
+    return datos
+
+
+def escpos_de_la_caja(sesion_id):
+    """
+    Un solo chorro ESC/POS con todos los tickets de la caja, del primero al
+    último (cada uno con su corte), para reimprimirlos de una vez. Los que ya
+    están en el cache no se vuelven a armar; el resto se arma en lotes de
+    VENTAS_POR_LOTE con dos consultas por lote.
+    """
+    claves = {
+        venta_id: clave_ticket(venta_id, anulada, 'escpos')
+        for venta_id, anulada in Venta.objects.filter(sesion_id=sesion_id).order_by('fecha', 'id')
+        .values_list('id', 'anulada')
+    }
+    tickets = cache.get_many(claves.values())
+    faltan = [venta_id for venta_id, clave in claves.items() if clave not in tickets]
+    for inicio in range(0, len(faltan), VENTAS_POR_LOTE):
+        nuevos = {
+            claves[venta.id]: escpos(venta)
+            for venta in ventas_para_ticket().filter(pk__in=faltan[inicio:inicio + VENTAS_POR_LOTE])
+        }
+        cache.set_many(nuevos, SEGUNDOS_CACHE_TICKET)
+        tickets.update(nuevos)
+    return b''.join(tickets[clave] for clave in claves.values())
+
+
+def enviar_a_impresora(datos, destino=None):
+    """
+    Manda los bytes a la impresora de settings.KIOSCO_IMPRESORA (o a `destino`):
+    'host:puerto' es una impresora de red (RAW, normalmente el puerto 9100) y
+    cualquier otra cosa una ruta a la que se agregan los bytes, sea el
+    dispositivo (/dev/usb/lp0) o un archivo común para probar sin impresora.
+    """
+    destino = destino or settings.KIOSCO_IMPRESORA
+    if not destino:
+        raise ErrorImpresora("No hay impresora configurada (KIOSCO_IMPRESORA).")
+    host, _, puerto = destino.rpartition(':')
+    try:
+        if host and puerto.isdigit():
+            with socket.create_connection((host, int(puerto)), timeout=SEGUNDOS_IMPRESORA) as conexion:
+                conexion.sendall(datos)
+        else:
+            with open(destino, 'ab') as archivo:
+                archivo.write(datos)
+    except OSError as e:
+        raise ErrorImpresora(f"No se pudo imprimir en {destino}: {e}")
@@ -0,0 +1,187 @@
+"""
+Trabajos en segundo plano (exportaciones e importaciones).
+
+La vista crea el trabajo y vuelve enseguida; el trabajo corre en un hilo del
+pool y la pantalla consulta el progreso hasta que termina. En las exportaciones,
+si se pide lo mismo y los datos no cambiaron, se devuelve el archivo que ya estaba hecho.
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .base_reportes import base_de_reportes
+from .exportar import (
+    ENCABEZADOS_PRODUCTOS, ENCABEZADOS_VENTAS, escribir_csv, escribir_xlsx, filas_de_productos, filas_de_ventas,
+)
+from .historial import filtrar_ventas
+from .models import Categoria, Producto, TrabajoExportacion, Venta
+
+CARPETA = 'exportaciones'
+
+# Cada cuántas filas se guarda el progreso (un UPDATE chico)
+FILAS_POR_AVANCE = 2000
+
+# Un trabajo sin avances en este tiempo se da por muerto (se reinició el servidor, etc)
+TRABAJO_COLGADO = datetime.timedelta(minutes=10)
+
+_ejecutor = None
+_lock_ejecutor = threading.Lock()
+
+
+def _pool():
+    global _ejecutor
+    with _lock_ejecutor:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'KIOSCO_TRABAJOS_HILOS', 2),
+                thread_name_prefix='trabajo',
+            )
+        return _ejecutor
+
+
+def _en_hilo(funcion, *args):
+    try:
+        funcion(*args)
+    finally:
+        connection.close()  # Cada hilo del pool tiene su propia conexión
+
+
+def encolar(funcion, *args):
+    """Corre funcion(*args) en el pool, o en línea si KIOSCO_TRABAJOS_EN_SEGUNDO_PLANO es False."""
+    if getattr(settings, 'KIOSCO_TRABAJOS_EN_SEGUNDO_PLANO', True):
+        _pool().submit(_en_hilo, funcion, *args)
+    else:
+        funcion(*args)
+
+
+def _ventas_filtradas(parametros):
+    fechas = {campo: datetime.date.fromisoformat(parametros[campo])
+              for campo in ('desde', 'hasta') if parametros.get(campo)}
+    return filtrar_ventas(Venta.objects.all(), sesion=parametros.get('sesion'), **fechas)
+
+
+def huella_de_datos(tipo, parametros):
+    """
+    Resumen barato (una consulta) de los datos que entran en la exportación:
+    cambia si se agregan, borran o modifican filas.
+    Ventas: cantidad, último id y cantidad de anuladas. Productos: cantidad y última
+    modificación, más los nombres de las categorías (son pocas y renombrar una no
+    toca ningún producto); esa es una segunda consulta.
+    Se calcula en la base principal aunque la vista lea de la de reportes: una
+    copia vieja daría la huella de antes y se reusaría el archivo con datos viejos.
+    """
+    if tipo == 'VENTAS':
+        datos = _ventas_filtradas(parametros).using(DEFAULT_DB_ALIAS).aggregate(
+            cantidad=Count('id'), ultima=Max('id'), anuladas=Count('id', filter=Q(anulada=True)),
+        )
+    else:
+        datos = Producto.objects.using(DEFAULT_DB_ALIAS).filter(activo=True).aggregate(
+            cantidad=Count('id'), ultima=Max('actualizado'),
+        )
+        categorias = json.dumps(list(
+            Categoria.objects.using(DEFAULT_DB_ALIAS).order_by('id').values_list('id', 'nombre')
+        ))
+        datos['categorias'] = hashlib.sha256(categorias.encode()).hexdigest()
+    return json.dumps(datos, default=str, sort_keys=True)
+
+
+def _clave(tipo, parametros, huella):
+    crudo = json.dumps([tipo, parametros, huella], sort_keys=True)
+    return hashlib.sha256(crudo.encode()).hexdigest()
+
+
+def pedir_exportacion(usuario, tipo, parametros):
+    """
+    Devuelve el TrabajoExportacion para (tipo, parametros): el mismo de antes si
+    los datos no cambiaron (terminado o todavía en curso), o uno nuevo ya encolado.
+    Solo se reusan los trabajos del mismo usuario: los cajeros no ven los ajenos.
+    parametros: dict serializable a JSON; 'formato' es 'xlsx' o 'csv'.
+    """
+    clave = _clave(tipo, parametros, huella_de_datos(tipo, parametros))
+    previo = TrabajoExportacion.objects.filter(clave=clave, usuario=usuario).exclude(estado='ERROR')
+    previo = previo.order_by('-id').first()
+    if previo is not None:
+        if previo.estado == 'LISTO' and previo.archivo and os.path.exists(previo.archivo.path):
+            return previo
+        if previo.estado in ('PENDIENTE', 'EN_CURSO') and timezone.now() - previo.actualizado < TRABAJO_COLGADO:
+            return previo
+
+    trabajo = TrabajoExportacion.objects.create(usuario=usuario, tipo=tipo, parametros=parametros, clave=clave)
+    encolar(ejecutar_exportacion, trabajo.id)
+    trabajo.refresh_from_db()
+    return trabajo
+
+
+def _con_avance(trabajo_id, filas):
+    """Deja pasar las filas y cada FILAS_POR_AVANCE guarda cuántas van."""
+    hechas = 0
+    for fila in filas:
+        yield fila
+        hechas += 1
+        if hechas % FILAS_POR_AVANCE == 0:
+            TrabajoExportacion.objects.filter(pk=trabajo_id).update(filas_hechas=hechas, actualizado=timezone.now())
+
+
+def ejecutar_exportacion(trabajo_id):
+    """
+    Genera el archivo del trabajo. Corre en un hilo del pool (o en línea, ver settings)
+    y lee los datos de la base de reportes, no de la que usan los cobros. La copia
+    tiene que ser posterior al pedido: la huella de la clave salió de la base principal.
+    """
+    trabajo = TrabajoExportacion.objects.get(pk=trabajo_id)
+    try:
+        with base_de_reportes(desde=trabajo.creado):
+            _generar_archivo(trabajo)
+    except Exception as e:
+        TrabajoExportacion.objects.filter(pk=trabajo_id).update(
+            estado='ERROR', error=str(e), actualizado=timezone.now(),
+        )
+
+
+def _generar_archivo(trabajo):
+    parametros = trabajo.parametros
+    if trabajo.tipo == 'VENTAS':
+        total = _ventas_filtradas(parametros).count()
+        desde, hasta = parametros.get('desde'), parametros.get('hasta')
+        filas = filas_de_ventas(
+            datetime.date.fromisoformat(desde) if desde else None,
+            datetime.date.fromisoformat(hasta) if hasta else None,
+            parametros.get('sesion'),
+        )
+        encabezados, titulo = ENCABEZADOS_VENTAS, 'Ventas'
+    else:
+        total = Producto.objects.filter(activo=True).count()
+        filas = filas_de_productos()
+        encabezados, titulo = ENCABEZADOS_PRODUCTOS, 'Productos'
+
+    trabajo.estado = 'EN_CURSO'
+    trabajo.filas_totales = total
+    trabajo.save(update_fields=['estado', 'filas_totales', 'actualizado'])
+
+    formato = 'csv' if parametros.get('formato') == 'csv' else 'xlsx'
+    nombre = f'{CARPETA}/{trabajo.tipo.lower()}_{trabajo.id}.{formato}'
+    ruta = os.path.join(settings.MEDIA_ROOT, nombre)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+    # Se escribe en un temporal y se renombra: nunca se descarga un archivo a medias
+    temporal = ruta + '.parcial'
+    filas = _con_avance(trabajo.id, filas)
+    if formato == 'csv':
+        with open(temporal, 'w', encoding='utf-8', newline='') as destino:
+            escribir_csv(encabezados, filas, destino)
+    else:
+        escribir_xlsx(encabezados, filas, temporal, titulo)
+    os.replace(temporal, ruta)
+
+    trabajo.archivo.name = nombre
+    trabajo.estado = 'LISTO'
+    trabajo.filas_hechas = total
+    trabajo.save(update_fields=['archivo', 'estado', 'filas_hechas', 'actualizado'])
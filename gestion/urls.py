@@ -3,15 +3,24 @@ from . import views
 
 urlpatterns = [
     path('', views.ventas, name='ventas'),
+    path('api/productos/', views.api_productos, name='api_productos'),
+    path('api/codigo/', views.api_codigo, name='api_codigo'),
     path('cobrar/', views.procesar_venta, name='procesar_venta'),
     path('exportar/', views.exportar_ventas_excel, name='exportar_excel'),
     path('cierre/', views.cierre_caja, name='cierre_caja'),
     path('apertura/', views.apertura_caja, name='apertura_caja'),
     path('movimiento/', views.registrar_movimiento, name='registrar_movimiento'),
     path('exportar-productos/', views.exportar_productos_excel, name='exportar_productos_excel'),
+    path('exportaciones/<int:trabajo_id>/', views.estado_exportacion, name='estado_exportacion'),
+    path('exportaciones/<int:trabajo_id>/descargar/', views.descargar_exportacion, name='descargar_exportacion'),
     path('reporte-mensual/', views.reporte_mensual, name='reporte_mensual'),
     path('ticket/<int:venta_id>/', views.imprimir_ticket, name='imprimir_ticket'),
+    path('caja/<int:sesion_id>/tickets/', views.tickets_de_la_caja, name='tickets_de_la_caja'),
     path('importar/', views.importar_productos, name='importar_productos'),
+    path('importaciones/<int:importacion_id>/', views.estado_importacion, name='estado_importacion'),
+    path('importaciones/<int:importacion_id>/previa/', views.previa_importacion, name='previa_importacion'),
+    path('importaciones/<int:importacion_id>/errores/', views.errores_importacion, name='errores_importacion'),
+    path('importaciones/<int:importacion_id>/reanudar/', views.reanudar_importacion, name='reanudar_importacion'),
     path('reporte-faltantes/', views.reporte_faltantes, name='reporte_faltantes'),
     path('historial/', views.historial_ventas, name='historial_ventas'),
     path('anular/<int:venta_id>/', views.anular_venta, name='anular_venta'),
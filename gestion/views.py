@@ -1,39 +1,97 @@
 import json
+import os
 from django.db import models 
 from django.db.models import Sum, Count, F
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.db import transaction
-from .models import Producto, Venta, DetalleVenta, SesionCaja, MovimientoCaja, Categoria
-import pandas as pd 
-from django.http import HttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.db import IntegrityError, transaction
+from .models import (
+    Producto, Venta, SesionCaja, MovimientoCaja, Categoria, TrabajoExportacion, ImportacionProductos,
+)
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.db.models import Sum
-from django.shortcuts import render, redirect
+from django.shortcuts import get_object_or_404, render, redirect
+from django.core.paginator import Paginator
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
 import datetime
 from decimal import Decimal 
 from .forms import ImportarProductosForm
+from .cobro import cobrar, olvidar_sesion_abierta, sesion_abierta_id
+from .exportar import lineas_csv
+from .importar import (
+    ErrorImportacion, ejecutar_importacion, obtener_previsualizacion, olvidar_previsualizacion, verificar_encabezado,
+)
+from .trabajos import TRABAJO_COLGADO, encolar, pedir_exportacion
+from .reportes import (
+    olvidar_reportes, periodo_comparado, rango_del_mes, reporte_del_periodo, sumar_al_resumen_diario, sumar_meses,
+)
+from .reposicion import DIAS_DE_COBERTURA, DIAS_DE_VENTAS, sugerir
+from .base_reportes import usar_base_de_reportes
+from .historial import pagina_ventas
+from .tickets import ErrorImpresora, enviar_a_impresora, escpos_de_la_caja, ticket_de_la_venta
+from .caja import calcular_resumen, guardar_esperado, sumar_movimiento, sumar_venta
+from .catalogo import (
+    pagina_productos, buscar_por_codigo, categorias_catalogo, etag_catalogo, TAMANIO_PAGINA, TAMANIO_PAGINA_MAXIMO,
+)
 
 @login_required
 def ventas(request):
-    
-    caja_abierta = SesionCaja.objects.filter(estado=True).exists()
+    # Caja abierta y categorías salen del cache
+    caja_abierta = sesion_abierta_id() is not None
 
-    productos = Producto.objects.filter(activo=True)
-    
-    
-    categorias = Categoria.objects.all() 
+    # Los productos ya no se renderizan acá: la tabla los pide por páginas a api_productos.
+    # Los faltantes son un EXISTS sobre el índice parcial producto_faltantes
+    hay_faltantes = request.user.is_staff and Producto.objects.filter(activo=True, bajo_minimo=True).exists()
+
+    categorias = categorias_catalogo()
 
     context = {
-        'productos': productos,
         'caja_abierta': caja_abierta,
+        'hay_faltantes': hay_faltantes,
         'categorias': categorias, 
     }
     return render(request, 'gestion/ventas.html', context)
 
 
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_catalogo)
+def api_productos(request):
+    """
+    Catálogo en JSON para la pantalla de ventas, paginado por cursor (ver catalogo.pagina_productos).
+    La versión del catálogo es el ETag: si no cambió nada el navegador recibe un 304.
+    """
+    try:
+        limite = min(int(request.GET.get('limite', TAMANIO_PAGINA)), TAMANIO_PAGINA_MAXIMO)
+        productos, siguiente = pagina_productos(
+            cursor=request.GET.get('cursor') or None,
+            categoria=request.GET.get('categoria') or None,
+            texto=request.GET.get('texto', '').strip() or None,
+            limite=max(limite, 1),
+        )
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=400)
+
+    return JsonResponse({'status': 'success', 'productos': productos, 'siguiente': siguiente})
+
+
+@login_required
+def api_codigo(request):
+    """Lector de código de barras: un producto por código (o etiqueta de balanza) en tiempo constante."""
+    codigo = request.GET.get('codigo', '').strip()
+    producto, cantidad = buscar_por_codigo(codigo) if codigo else (None, None)
+    if producto is None:
+        return JsonResponse({'status': 'error', 'mensaje': f'No se encontró el código {codigo}'}, status=404)
+
+    return JsonResponse({'status': 'success', 'producto': producto, 'cantidad': cantidad})
+
+
 @login_required
 def procesar_venta(request):
     if request.method == 'POST':
@@ -45,49 +103,10 @@ def procesar_venta(request):
             if not items:
                 return JsonResponse({'status': 'error', 'mensaje': 'El carrito está vacío'})
 
-            with transaction.atomic():
-                sesion_actual = SesionCaja.objects.filter(estado=True).select_for_update().last()
-                
-                if not sesion_actual:
-                    return JsonResponse({'status': 'error', 'mensaje': 'No hay caja abierta. Abra una sesión primero.'})
-
-                venta = Venta.objects.create(
-                    sesion=sesion_actual,
-                    total=0,
-                    metodo_pago=metodo_pago,
-                    usuario=request.user # Aseguramos registrar quién vende
-                )
-
-                total_acumulado = 0
-
-                for item in items:
-                    # SEGURIDAD ANTICHOQUE: select_for_update() bloquea la fila del producto
-                    # para que ninguna otra venta lo modifique hasta que esta termine.
-                    producto = Producto.objects.select_for_update().get(id=item['id'])
-                    
-                    cantidad = Decimal(str(item['cantidad'])) 
-                    
-                    if producto.stock_actual < cantidad:
-                         raise Exception(f"No hay suficiente stock de {producto.nombre}. Disponible: {producto.stock_actual}")
-
-                    subtotal = producto.precio_venta * cantidad
-                    
-                    DetalleVenta.objects.create(
-                        venta=venta,
-                        producto=producto,
-                        cantidad=cantidad,
-                        precio_unitario=producto.precio_venta,
-                        subtotal=subtotal
-                    )
-
-                    # Descuento de stock seguro
-                    producto.stock_actual -= cantidad
-                    producto.save()
-                    
-                    total_acumulado += subtotal
-
-                venta.total = total_acumulado
-                venta.save()
+            # SEGURIDAD ANTICHOQUE: cobrar() bloquea solo las filas de los productos del carrito
+            # (en una sola consulta) y descuenta el stock con un UPDATE condicional.
+            # La caja abierta se resuelve sin bloqueo exclusivo, así las cajas no se esperan entre sí.
+            venta = cobrar(request.user, items, metodo_pago)
 
             return JsonResponse({
                 'status': 'success', 
@@ -101,36 +120,57 @@ def procesar_venta(request):
     return JsonResponse({'status': 'error', 'mensaje': 'Método no permitido'})
 
 @login_required
+@usar_base_de_reportes
 def exportar_ventas_excel(request):
-    
-    ventas = Venta.objects.all().order_by('-fecha')
+    # Filtros opcionales: ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD (inclusive), ?sesion=<id>
+    try:
+        desde = datetime.date.fromisoformat(request.GET['desde']) if request.GET.get('desde') else None
+        hasta = datetime.date.fromisoformat(request.GET['hasta']) if request.GET.get('hasta') else None
+        sesion_id = int(request.GET['sesion']) if request.GET.get('sesion') else None
+    except ValueError:
+        messages.error(request, "Filtro de exportación inválido.")
+        return redirect('ventas')
 
-    
-    data = []
-    for v in ventas:
-        
-        fecha_local = timezone.localtime(v.fecha).strftime('%d/%m/%Y %H:%M')
-        
-        data.append({
-            'ID Venta': v.id,
-            'Fecha': fecha_local,
-            'Cajero/Usuario': v.sesion.usuario.username,
-            'Método Pago': v.metodo_pago,
-            'Total': float(v.total), 
-            'ID Sesión Caja': v.sesion.id
-        })
+    # El archivo se genera en segundo plano: el pedido vuelve enseguida a la pantalla de progreso
+    trabajo = pedir_exportacion(request.user, 'VENTAS', {
+        'desde': desde.isoformat() if desde else None,
+        'hasta': hasta.isoformat() if hasta else None,
+        'sesion': sesion_id,
+        'formato': 'csv' if request.GET.get('formato') == 'csv' else 'xlsx',
+    })
+    return redirect('estado_exportacion', trabajo_id=trabajo.id)
 
-    
-    df = pd.DataFrame(data)
 
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="reporte_ventas.xlsx"'
+def _del_usuario(request, modelo, pk):
+    """Un trabajo (exportación o importación), solo si es del usuario (o el usuario es staff)."""
+    trabajos = modelo.objects.all()
+    if not request.user.is_staff:
+        trabajos = trabajos.filter(usuario=request.user)
+    return get_object_or_404(trabajos, pk=pk)
 
-    
-    df.to_excel(response, index=False, engine='openpyxl')
-    
-    return response
+
+@login_required
+def estado_exportacion(request, trabajo_id):
+    trabajo = _del_usuario(request, TrabajoExportacion, trabajo_id)
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({
+            'estado': trabajo.estado,
+            'progreso': trabajo.progreso,
+            'filas_hechas': trabajo.filas_hechas,
+            'filas_totales': trabajo.filas_totales,
+            'error': trabajo.error,
+            'descarga': reverse('descargar_exportacion', args=[trabajo.id]) if trabajo.estado == 'LISTO' else None,
+        })
+    return render(request, 'gestion/exportacion.html', {'trabajo': trabajo})
+
+
+@login_required
+def descargar_exportacion(request, trabajo_id):
+    trabajo = _del_usuario(request, TrabajoExportacion, trabajo_id)
+    if trabajo.estado != 'LISTO' or not trabajo.archivo:
+        raise Http404("La exportación todavía no está lista")
+    nombre = os.path.basename(trabajo.archivo.name)
+    return FileResponse(trabajo.archivo.open('rb'), as_attachment=True, filename=nombre)
 
 
 @login_required
@@ -143,11 +183,18 @@ def apertura_caja(request):
         saldo_inicial = request.POST.get('saldo_inicial', 0)
         
         
-        SesionCaja.objects.create(
-            usuario=request.user,
-            saldo_inicial=saldo_inicial,
-            estado=True
-        )
+        try:
+            with transaction.atomic():
+                SesionCaja.objects.create(
+                    usuario=request.user,
+                    saldo_inicial=saldo_inicial,
+                    estado=True
+                )
+        except IntegrityError:
+            # Otra terminal abrió la caja entre el chequeo de arriba y este INSERT (una_sola_caja_abierta)
+            messages.info(request, "La caja ya estaba abierta.")
+            return redirect('ventas')
+        olvidar_sesion_abierta()
         
         return redirect('ventas')
 
@@ -175,45 +222,39 @@ def cierre_caja(request):
         
         # Total real
         sesion.saldo_final_real = efectivo + vales + debito + credito
+
+        # Recalculamos el esperado al cerrar por si hubo ventas después de abrir esta pantalla
+        sesion.saldo_final_esperado = calcular_resumen(sesion).esperado_efectivo
         
         sesion.fecha_cierre = timezone.now()
         sesion.estado = False
-        sesion.save()
+        sesion.save(update_fields=[
+            'monto_efectivo_real', 'monto_vales_real', 'monto_debito_real', 'monto_credito_real',
+            'saldo_final_real', 'saldo_final_esperado', 'fecha_cierre', 'estado',
+        ])
+        olvidar_sesion_abierta()
         
         return redirect('ventas') # O reporte_mensual
 
     # --- CÁLCULOS PARA LA VALIDACIÓN (Escondidos en el HTML) ---
-    
-    # 1. Ventas desglosadas
-    ventas_efectivo = sesion.ventas.filter(metodo_pago='EFECTIVO').aggregate(Sum('total'))['total__sum'] or 0
-    ventas_vales = sesion.ventas.filter(metodo_pago='VALE').aggregate(Sum('total'))['total__sum'] or 0
-    ventas_debito = sesion.ventas.filter(metodo_pago__in=['DEBITO', 'MERCADOPAGO']).aggregate(Sum('total'))['total__sum'] or 0
-    ventas_credito = sesion.ventas.filter(metodo_pago='CREDITO').aggregate(Sum('total'))['total__sum'] or 0
-    
-    # Nota: Agrupé MercadoPago con Débito, si querés separarlo avisame.
-    
-    # 2. Movimientos de Caja
-    ingresos = sesion.movimientos.filter(tipo='INGRESO').aggregate(Sum('monto'))['monto__sum'] or 0
-    egresos = sesion.movimientos.filter(tipo='EGRESO').aggregate(Sum('monto'))['monto__sum'] or 0
+    # Una sola pasada sobre las ventas (sin anuladas) y otra sobre los movimientos.
+    # Nota: MercadoPago va agrupado con Débito.
+    resumen = calcular_resumen(sesion)
 
-    # 3. Cálculo de ESPERADOS (Lo que el sistema sabe)
-    esperado_efectivo = sesion.saldo_inicial + ventas_efectivo + ingresos - egresos
-    
-    # Guardamos el esperado total para referencia
-    sesion.saldo_final_esperado = esperado_efectivo 
-    sesion.save()
+    # Guardamos el esperado total para referencia (solo esa columna y solo si cambió)
+    guardar_esperado(sesion, resumen)
 
     context = {
         'sesion': sesion,
         # Pasamos los valores esperados al template para que JS los use (ocultos)
-        'esperado_efectivo': esperado_efectivo,
-        'esperado_vales': ventas_vales,
-        'esperado_debito': ventas_debito,
-        'esperado_credito': ventas_credito,
+        'esperado_efectivo': resumen.esperado_efectivo,
+        'esperado_vales': resumen.ventas_vales,
+        'esperado_debito': resumen.ventas_debito,
+        'esperado_credito': resumen.ventas_credito,
         
         # Totales para el resumen visual de arriba
-        'ventas_efectivo': ventas_efectivo,
-        'ventas_digital': ventas_debito + ventas_credito,
+        'ventas_efectivo': resumen.ventas_efectivo,
+        'ventas_digital': resumen.ventas_digital,
     }
     return render(request, 'gestion/cierre_caja.html', context)
 
@@ -230,13 +271,23 @@ def registrar_movimiento(request):
         monto = request.POST.get('monto')
         descripcion = request.POST.get('descripcion')
 
-        MovimientoCaja.objects.create(
-            sesion=caja,
-            tipo=tipo,
-            categoria=categoria, 
-            monto=monto,
-            descripcion=descripcion
-        )
+        if tipo not in SesionCaja.CAMPO_TOTAL_POR_TIPO_MOVIMIENTO:
+            messages.error(request, "Tipo de movimiento inválido.")
+            return redirect('ventas')
+
+        with transaction.atomic():
+            movimiento = MovimientoCaja.objects.create(
+                sesion=caja,
+                tipo=tipo,
+                categoria=categoria, 
+                monto=monto,
+                descripcion=descripcion
+            )
+            # Totales acumulados de la caja (ver SesionCaja)
+            sumar_movimiento(caja.id, tipo, Decimal(str(movimiento.monto)))
+            # Si la caja se abrió otro día, cambian los gastos de un período ya cerrado
+            fecha_caja = timezone.localdate(caja.fecha_apertura)
+            transaction.on_commit(lambda: olvidar_reportes(fecha_caja))
           
         messages.success(request, f"Movimiento registrado: {descripcion} (${monto})")
 
@@ -244,108 +295,122 @@ def registrar_movimiento(request):
     return redirect('ventas')
 
 
-@login_required 
+@login_required
+@usar_base_de_reportes
 def exportar_productos_excel(request):
     
     if not request.user.is_staff:
         return redirect('ventas')
 
-    productos = Producto.objects.filter(activo=True).order_by('nombre')
-
-    data = []
-    for p in productos:
-        ganancia_unitaria = p.precio_venta - p.precio_costo
-        valor_inventario = p.precio_costo * p.stock_actual 
-        
-        data.append({
-            'Código': p.codigo,
-            'Nombre': p.nombre,
-            'Categoría': p.categoria.nombre if p.categoria else '-',
-            'Costo ($)': float(p.precio_costo), 
-            'Precio Venta ($)': float(p.precio_venta),
-            'Ganancia x Unid ($)': float(ganancia_unitaria),
-            'Stock': p.stock_actual,
-            'Dinero Invertido ($)': float(valor_inventario)
-        })
-
-    df = pd.DataFrame(data)
-    
-    
-    df = df[['Código', 'Nombre', 'Categoría', 'Costo ($)', 'Precio Venta ($)', 'Ganancia x Unid ($)', 'Stock', 'Dinero Invertido ($)']]
+    trabajo = pedir_exportacion(request.user, 'PRODUCTOS', {
+        'formato': 'csv' if request.GET.get('formato') == 'csv' else 'xlsx',
+    })
+    return redirect('estado_exportacion', trabajo_id=trabajo.id)
+
+
+def _numeros_del_reporte(reporte):
+    """Agrega a los números de calcular_reporte() las ganancias y el margen."""
+    numeros = dict(reporte)
+    ganancia_bruta = reporte['total_ventas'] - reporte['costo_mercaderia']
+    ganancia_neta = ganancia_bruta - reporte['total_gastos']
+    margen = (ganancia_neta / reporte['total_ventas'] * 100) if reporte['total_ventas'] > 0 else 0
+    numeros.update({
+        'total_ventas': float(reporte['total_ventas']),
+        'costo_mercaderia': float(reporte['costo_mercaderia']),
+        'total_gastos': float(reporte['total_gastos']),
+        'ganancia_bruta': float(ganancia_bruta),
+        'ganancia_neta': float(ganancia_neta),
+        'margen': round(margen, 1),
+    })
+    return numeros
 
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="lista_precios_stock.xlsx"'
-    df.to_excel(response, index=False, engine='openpyxl')
-    
-    return response
 
+def _variacion(actual, anterior):
+    """Variación porcentual, o None si el período comparado es cero."""
+    if not anterior:
+        return None
+    return round((actual - anterior) / abs(anterior) * 100, 1)
 
 
 @login_required
+@usar_base_de_reportes
 def reporte_mensual(request):
     # Verificación de permisos para el staff
     if not request.user.is_staff:
         return redirect('ventas')
 
-    # Configuración de fecha actual
-    hoy = datetime.date.today()
-    mes_actual = hoy.month
-    anio_actual = hoy.year
+    # Configuración de fecha actual (en la hora de Argentina, no la del servidor)
+    hoy = timezone.localdate()
+
+    # Período pedido: ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD (inclusive). Por defecto, el mes actual
+    # ?comparar=anterior (período anterior) o ?comparar=anio (mismo período del año pasado)
+    comparar = request.GET.get('comparar', '')
+    if comparar not in ('', 'anterior', 'anio'):
+        comparar = ''
 
-    # Obtener ventas del mes
-    ventas = Venta.objects.filter(fecha__month=mes_actual, fecha__year=anio_actual)
-    total_ventas = ventas.aggregate(Sum('total'))['total__sum'] or 0
-    cantidad_ventas = ventas.count()
+    # Fechas válidas pero en los bordes del calendario (9999-12-31, 0001-01-01 con
+    # comparación) se salen de rango al correrlas: también vuelven al mes actual
+    try:
+        inicio, fin = rango_del_mes(hoy.year, hoy.month)
+        if request.GET.get('desde'):
+            inicio = datetime.date.fromisoformat(request.GET['desde'])
+        if request.GET.get('hasta'):
+            fin = datetime.date.fromisoformat(request.GET['hasta']) + datetime.timedelta(days=1)
+        if fin <= inicio:
+            messages.error(request, "El período termina antes de empezar, se muestra el mes actual.")
+            inicio, fin = rango_del_mes(hoy.year, hoy.month)
+        periodo_comp = periodo_comparado(inicio, fin, comparar) if comparar else None
+    except (ValueError, OverflowError):
+        messages.error(request, "Fecha inválida, se muestra el mes actual.")
+        inicio, fin = rango_del_mes(hoy.year, hoy.month)
+        periodo_comp = periodo_comparado(inicio, fin, comparar) if comparar else None
+
+    # Los números salen del resumen diario; los períodos cerrados, directo del cache
+    reporte = _numeros_del_reporte(reporte_del_periodo(inicio, fin))
+
+    comparacion = None
+    if periodo_comp:
+        inicio_comp, fin_comp = periodo_comp
+        comparacion = _numeros_del_reporte(reporte_del_periodo(inicio_comp, fin_comp))
+        comparacion['desde'] = inicio_comp
+        comparacion['hasta'] = fin_comp - datetime.timedelta(days=1)
+        comparacion['filas'] = [
+            (titulo, reporte[campo], comparacion[campo], _variacion(reporte[campo], comparacion[campo]), es_dinero)
+            for titulo, campo, es_dinero in (
+                ('Ventas', 'total_ventas', True), ('Tickets', 'cantidad_ventas', False),
+                ('Costo mercadería', 'costo_mercaderia', True), ('Gastos', 'total_gastos', True),
+                ('Ganancia neta', 'ganancia_neta', True),
+            )
+        ]
 
     # --- 1. DATOS PARA GRÁFICO: MÉTODOS DE PAGO ---
-    # Agrupamos las ventas del mes por método de pago y sumamos sus totales
-    metodos_data = ventas.values('metodo_pago').annotate(total=Sum('total'))
-    labels_metodos = [m['metodo_pago'] for m in metodos_data]
-    valores_metodos = [float(m['total']) for m in metodos_data]
+    labels_metodos = [metodo for metodo, _ in reporte['metodos']]
+    valores_metodos = [float(total) for _, total in reporte['metodos']]
 
     # --- 2. DATOS PARA GRÁFICO: PRODUCTOS TOP 5 ---
-    # Buscamos en los detalles de las ventas del mes los productos más vendidos
-    top_productos = DetalleVenta.objects.filter(
-        venta__fecha__month=mes_actual,
-        venta__fecha__year=anio_actual
-    ).values('producto__nombre').annotate(
-        cantidad=Sum('cantidad')
-    ).order_by('-cantidad')[:5]
-    
-    labels_productos = [p['producto__nombre'] for p in top_productos]
-    valores_productos = [float(p['cantidad']) for p in top_productos]
-
-    # --- CÁLCULOS DE RENTABILIDAD ---
-    costo_mercaderia = 0
-    # Cálculo manual del costo basado en el precio de costo histórico del producto
-    for venta in ventas:
-        for detalle in venta.detalles.all():
-            costo_mercaderia += detalle.producto.precio_costo * detalle.cantidad
-
-    # Obtener egresos del mes registrados en caja
-    movimientos = MovimientoCaja.objects.filter(
-        sesion__fecha_apertura__month=mes_actual, 
-        sesion__fecha_apertura__year=anio_actual,
-        tipo='EGRESO'
-    )
-    total_gastos = movimientos.aggregate(Sum('monto'))['monto__sum'] or 0
-
-    # Cálculos finales de rentabilidad
-    ganancia_bruta = total_ventas - costo_mercaderia
-    ganancia_neta = ganancia_bruta - total_gastos
-    margin_rentabilidad = (ganancia_neta / total_ventas * 100) if total_ventas > 0 else 0
+    labels_productos = [nombre for nombre, _ in reporte['top_productos']]
+    valores_productos = [float(cantidad) for _, cantidad in reporte['top_productos']]
+
+    mes_anterior = sumar_meses(inicio.replace(day=1), -1)
 
     # Contexto unificado para el HTML
     context = {
-        'mes': hoy.strftime("%B"), 
-        'anio': anio_actual,
-        'total_ventas': float(total_ventas),
-        'costo_mercaderia': float(costo_mercaderia),
-        'total_gastos': float(total_gastos),
-        'ganancia_bruta': float(ganancia_bruta),
-        'ganancia_neta': float(ganancia_neta),
-        'margen': round(margin_rentabilidad, 1),
-        'cantidad_ventas': cantidad_ventas,
+        'mes': inicio.strftime("%B"), 
+        'anio': inicio.year,
+        'desde': inicio,
+        'hasta': fin - datetime.timedelta(days=1),
+        'es_un_mes': inicio.day == 1 and fin == sumar_meses(inicio, 1),
+        'comparar': comparar,
+        'comparacion': comparacion,
+        'mes_anterior_desde': mes_anterior,
+        'mes_anterior_hasta': inicio.replace(day=1) - datetime.timedelta(days=1),
+        'total_ventas': reporte['total_ventas'],
+        'costo_mercaderia': reporte['costo_mercaderia'],
+        'total_gastos': reporte['total_gastos'],
+        'ganancia_bruta': reporte['ganancia_bruta'],
+        'ganancia_neta': reporte['ganancia_neta'],
+        'margen': reporte['margen'],
+        'cantidad_ventas': reporte['cantidad_ventas'],
         
         # Datos convertidos a JSON para JavaScript (Gráficos)
         'labels_metodos_js': json.dumps(labels_metodos),
@@ -359,18 +424,35 @@ def reporte_mensual(request):
 
 @login_required
 def imprimir_ticket(request, venta_id):
-    
-    venta = Venta.objects.get(id=venta_id)
-    items = DetalleVenta.objects.filter(venta=venta)
-    
-    context = {
-        'venta': venta,
-        'fecha': venta.fecha,
-        'items': items,
-        'total': venta.total,
-        'metodo_pago': venta.metodo_pago
-    }
-    return render(request, 'gestion/ticket.html', context)
+    # El ticket sale del cache al reimprimir (ver tickets.py). ?formato=escpos: para la impresora térmica
+    formato = 'escpos' if request.GET.get('formato') == 'escpos' else 'html'
+    try:
+        datos = ticket_de_la_venta(venta_id, formato)
+    except Venta.DoesNotExist:
+        raise Http404("La venta no existe")
+    if formato == 'html':
+        return HttpResponse(datos)
+    return _salida_escpos(request, datos, f'ticket_{venta_id}.bin')
+
+
+@login_required
+def tickets_de_la_caja(request, sesion_id):
+    """Todos los tickets de una caja en un solo chorro ESC/POS, para reimprimirlos de una vez."""
+    sesion = get_object_or_404(SesionCaja, pk=sesion_id)
+    return _salida_escpos(request, escpos_de_la_caja(sesion.id), f'caja_{sesion.id}.bin')
+
+
+def _salida_escpos(request, datos, nombre_archivo):
+    """GET: descarga los bytes. POST: los manda a la impresora configurada (KIOSCO_IMPRESORA)."""
+    if request.method == 'POST':
+        try:
+            enviar_a_impresora(datos)
+        except ErrorImpresora as e:
+            return JsonResponse({'status': 'error', 'mensaje': str(e)}, status=503)
+        return JsonResponse({'status': 'success', 'bytes': len(datos)})
+    respuesta = HttpResponse(datos, content_type='application/octet-stream')
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return respuesta
 
 
 
@@ -381,64 +463,28 @@ def importar_productos(request):
         form = ImportarProductosForm(request.POST, request.FILES)
         if form.is_valid():
             archivo = request.FILES['archivo_excel']
+            importacion = ImportacionProductos.objects.create(
+                usuario=request.user, archivo=archivo, nombre_archivo=archivo.name,
+            )
             try:
-                # 1. Detectar si es Excel o CSV
-                if archivo.name.endswith('.csv'):
-                    df = pd.read_csv(archivo)
-                else:
-                    df = pd.read_excel(archivo)
-
-                # 2. Normalizar columnas (minúsculas y sin espacios para evitar errores)
-                df.columns = df.columns.str.strip().str.lower()
-
-                # 3. Validar columnas obligatorias
-                requeridas = ['codigo', 'nombre', 'venta']
-                if not all(col in df.columns for col in requeridas):
-                    messages.error(request, "❌ Error: El archivo DEBE tener las columnas: codigo, nombre, venta")
-                    return render(request, 'gestion/importar.html', {'form': form})
-
-                contador_nuevos = 0
-                contador_actualizados = 0
-
-                # 4. Transacción Atómica (Si falla uno, no se guarda nada a medias)
-                with transaction.atomic():
-                    for index, row in df.iterrows():
-                        # Convertimos a string y limpiamos espacios
-                        codigo = str(row['codigo']).strip().replace('.0', '') # Evita que 123 sea "123.0"
-                        nombre = str(row['nombre']).strip()
-                        
-                        # Manejo de Categoría (Si no existe, la crea)
-                        cat_nombre = str(row.get('categoria', 'General')).strip()
-                        categoria_obj, _ = Categoria.objects.get_or_create(nombre=cat_nombre)
-
-                        # Valores numéricos seguros
-                        precio_venta = float(row['venta']) if pd.notna(row['venta']) else 0
-                        precio_costo = float(row.get('costo', 0)) if pd.notna(row.get('costo')) else 0
-                        stock = float(row.get('stock', 0)) if pd.notna(row.get('stock')) else 0
-
-                        # CREAR O ACTUALIZAR PRODUCTO
-                        producto, created = Producto.objects.update_or_create(
-                            codigo=codigo,
-                            defaults={
-                                'nombre': nombre,
-                                'precio_venta': precio_venta,
-                                'precio_costo': precio_costo,
-                                'stock_actual': stock, # OJO: Esto sobreescribe el stock. Si querés sumar, avisame.
-                                'categoria': categoria_obj,
-                                'activo': True
-                            }
-                        )
-                        
-                        if created:
-                            contador_nuevos += 1
-                        else:
-                            contador_actualizados += 1
-
-                messages.success(request, f"✅ Éxito: Se crearon {contador_nuevos} productos y se actualizaron {contador_actualizados}.")
-                return redirect('ventas')
-
+                # Antes de encolar controlamos el encabezado (solo lee la primera fila)
+                verificar_encabezado(importacion.archivo.path)
+            except ErrorImportacion as e:
+                messages.error(request, f"❌ Error: {e}")
             except Exception as e:
                 messages.error(request, f"🔥 Error crítico al procesar el archivo: {str(e)}")
+            else:
+                if form.cleaned_data['previsualizar']:
+                    importacion.estado = 'PREVIA'
+                    importacion.save(update_fields=['estado'])
+                    return redirect('previa_importacion', importacion_id=importacion.id)
+
+                # El archivo se procesa por lotes en segundo plano (ver importar.ejecutar_importacion)
+                encolar(ejecutar_importacion, importacion.id)
+                return redirect('estado_importacion', importacion_id=importacion.id)
+
+            importacion.archivo.delete(save=False)
+            importacion.delete()
 
     else:
         form = ImportarProductosForm()
@@ -446,18 +492,132 @@ def importar_productos(request):
     return render(request, 'gestion/importar.html', {'form': form})
 
 
+# Filas de cada tipo de cambio que se muestran en la previsualización
+FILAS_EN_PREVIA = 100
+
+
+@login_required
+def previa_importacion(request, importacion_id):
+    importacion = _del_usuario(request, ImportacionProductos, importacion_id)
+    if importacion.estado != 'PREVIA':
+        return redirect('estado_importacion', importacion_id=importacion.id)
+
+    if request.method == 'POST':
+        if request.POST.get('accion') == 'aplicar':
+            # ejecutar_importacion toma el archivo ya limpio del cache de la previsualización
+            importacion.estado = 'PENDIENTE'
+            importacion.save(update_fields=['estado', 'actualizado'])
+            encolar(ejecutar_importacion, importacion.id)
+            return redirect('estado_importacion', importacion_id=importacion.id)
+
+        olvidar_previsualizacion(importacion.id)
+        importacion.archivo.delete(save=False)
+        importacion.delete()
+        messages.info(request, "Importación cancelada: no se cambió ningún producto.")
+        return redirect('importar_productos')
+
+    previa = obtener_previsualizacion(importacion)
+    cambios = previa['cambios']
+
+    def primeras(filtro, columnas):
+        return cambios.loc[filtro, columnas].head(FILAS_EN_PREVIA).to_dict('records')
+
+    context = {
+        'importacion': importacion,
+        'resumen': previa['resumen'],
+        'filas_en_previa': FILAS_EN_PREVIA,
+        'nuevos': primeras(cambios['nuevo'], ['codigo', 'nombre', 'categoria', 'venta', 'stock']),
+        'precios': primeras(cambios['cambia_precio'], ['codigo', 'nombre', 'venta_actual', 'venta']),
+        'stock': primeras(cambios['cambia_stock'], ['codigo', 'nombre', 'stock_actual', 'stock']),
+        'errores': previa['errores'].head(FILAS_EN_PREVIA).to_dict('records'),
+    }
+    return render(request, 'gestion/importacion_previa.html', context)
+
+
+@login_required
+def estado_importacion(request, importacion_id):
+    importacion = _del_usuario(request, ImportacionProductos, importacion_id)
+    if importacion.estado == 'PREVIA':
+        return redirect('previa_importacion', importacion_id=importacion.id)
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({
+            'estado': importacion.estado,
+            'progreso': importacion.progreso,
+            'filas_procesadas': importacion.filas_procesadas,
+            'filas_totales': importacion.filas_totales,
+            'nuevos': importacion.nuevos,
+            'actualizados': importacion.actualizados,
+            'con_error': importacion.con_error,
+            'error': importacion.error,
+        })
+    return render(request, 'gestion/importacion.html', {'importacion': importacion})
+
+
+@login_required
+def errores_importacion(request, importacion_id):
+    importacion = _del_usuario(request, ImportacionProductos, importacion_id)
+    filas = importacion.errores.values_list('fila', 'codigo', 'mensaje').iterator()
+    response = StreamingHttpResponse(lineas_csv(('Fila', 'Código', 'Error'), filas), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="errores_importacion_{importacion.id}.csv"'
+    return response
+
+
 @login_required
+def reanudar_importacion(request, importacion_id):
+    importacion = _del_usuario(request, ImportacionProductos, importacion_id)
+    colgada = importacion.estado == 'EN_CURSO' and timezone.now() - importacion.actualizado > TRABAJO_COLGADO
+    if request.method == 'POST' and (importacion.estado == 'ERROR' or colgada):
+        # Sigue desde el último lote guardado (filas_procesadas)
+        importacion.estado = 'PENDIENTE'
+        importacion.save(update_fields=['estado', 'actualizado'])
+        encolar(ejecutar_importacion, importacion.id)
+    return redirect('estado_importacion', importacion_id=importacion.id)
+
+
+FALTANTES_POR_PAGINA = 100
+
+
+@login_required
+@usar_base_de_reportes
 def reporte_faltantes(request):
     if not request.user.is_staff:
         return redirect('ventas')
     
-    productos_bajos = Producto.objects.filter(
-        activo=True, 
-        stock_actual__lte=models.F('stock_minimo') 
-    ).order_by('stock_actual')
+    # bajo_minimo es una columna generada con índice parcial: no se recorre todo el catálogo
+    productos_bajos = Producto.objects.filter(activo=True, bajo_minimo=True).select_related('categoria')
+
+    # Mismo filtro de categoría que el catálogo: id o 'SIN_CAT'
+    categoria = request.GET.get('categoria', '')
+    if categoria == 'SIN_CAT':
+        productos_bajos = productos_bajos.filter(categoria__isnull=True)
+    elif categoria.isdigit():
+        productos_bajos = productos_bajos.filter(categoria_id=int(categoria))
+    else:
+        categoria = ''
+
+    try:
+        cobertura = min(max(int(request.GET.get('cobertura', DIAS_DE_COBERTURA)), 1), 90)
+    except ValueError:
+        cobertura = DIAS_DE_COBERTURA
+
+    paginador = Paginator(productos_bajos.order_by('stock_actual', 'id'), FALTANTES_POR_PAGINA)
+    pagina = paginador.get_page(request.GET.get('pagina'))
+
+    # Sugerido según lo que se vende por día (la velocidad de venta se calcula una vez por día)
+    productos = list(pagina.object_list)
+    sugerencias = sugerir(productos, cobertura)
+    for p in productos:
+        p.venta_diaria = sugerencias[p.id]['venta_diaria']
+        p.dias_de_stock = sugerencias[p.id]['dias_de_stock']
+        p.sugerido = sugerencias[p.id]['sugerido']
 
     return render(request, 'gestion/reporte_faltantes.html', {
-        'productos': productos_bajos
+        'productos': productos,
+        'pagina': pagina,
+        'categorias': Categoria.objects.order_by('nombre'),
+        'categoria': categoria,
+        'cobertura': cobertura,
+        'dias_de_ventas': DIAS_DE_VENTAS,
     })
 
 
@@ -465,9 +625,35 @@ def reporte_faltantes(request):
 # gestion/views.py
 @login_required
 def historial_ventas(request):
-    # Traemos las últimas 50 ventas para no sobrecargar la página
-    ventas_lista = Venta.objects.all().order_by('-fecha')[:50]
-    return render(request, 'gestion/historial_ventas.html', {'ventas': ventas_lista})
+    # Filtros opcionales: ?sesion, ?usuario, ?metodo, ?anulada=si|no, ?desde/?hasta (AAAA-MM-DD, inclusive)
+    parametros = request.GET
+    try:
+        filtros = {
+            'sesion': int(parametros['sesion']) if parametros.get('sesion') else None,
+            'usuario': int(parametros['usuario']) if parametros.get('usuario') else None,
+            'metodo_pago': parametros.get('metodo') or None,
+            'anulada': {'si': True, 'no': False}.get(parametros.get('anulada')),
+            'desde': datetime.date.fromisoformat(parametros['desde']) if parametros.get('desde') else None,
+            'hasta': datetime.date.fromisoformat(parametros['hasta']) if parametros.get('hasta') else None,
+        }
+        ventas_lista, siguiente = pagina_ventas(cursor=parametros.get('cursor') or None, **filtros)
+    except (ValueError, OverflowError):
+        messages.error(request, "Filtro o página inválida.")
+        return redirect('historial_ventas')
+
+    # Los links de "más viejas" conservan los filtros
+    sin_cursor = parametros.copy()
+    sin_cursor.pop('cursor', None)
+
+    return render(request, 'gestion/historial_ventas.html', {
+        'ventas': ventas_lista,
+        'siguiente': siguiente,
+        'es_primera_pagina': not parametros.get('cursor'),
+        'filtros': parametros,
+        'filtros_query': sin_cursor.urlencode(),
+        'metodos_pago': Venta.METODOS_PAGO,
+        'cajeros': User.objects.filter(is_active=True).order_by('username'),
+    })
 
 @login_required
 def anular_venta(request, venta_id):
@@ -486,13 +672,28 @@ def anular_venta(request, venta_id):
                 return redirect('historial_ventas')
 
             # Devolvemos el stock de cada producto
-            for detalle in venta.detalles.all():
+            detalles = list(venta.detalles.select_related('producto'))
+            for detalle in detalles:
                 producto = detalle.producto
                 producto.stock_actual += detalle.cantidad
                 producto.save()
 
+            # Sacamos la venta del resumen diario de los reportes
+            sumar_al_resumen_diario(timezone.localdate(venta.fecha), venta.metodo_pago, [
+                (d.producto_id, d.producto.categoria_id, d.cantidad, d.subtotal,
+                 d.cantidad * (d.producto.precio_costo if d.costo_unitario is None else d.costo_unitario))
+                for d in detalles
+            ], signo=-1)
+
             venta.anulada = True
             venta.save()
+
+            # Restamos la venta de los totales acumulados de su caja
+            sumar_venta(venta.sesion_id, venta.metodo_pago, -venta.total)
+
+            # Si la venta era de un período ya cerrado, sus reportes cacheados quedan viejos
+            fecha_venta = timezone.localdate(venta.fecha)
+            transaction.on_commit(lambda: olvidar_reportes(fecha_venta))
             messages.success(request, f"Venta #{venta.id} anulada con éxito.")
             
     except Exception as e: